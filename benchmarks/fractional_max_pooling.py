@@ -6,25 +6,39 @@ from treeano.sandbox.nodes import fmp
 fX = theano.config.floatX
 
 # TODO change me
-node = "fmp2"
+node = "fmp"
 compute_grad = True
+# whether to compare the nodes at the same output size (instead of the same
+# input size)
+same_output_size = True
+batch_size = 32
+num_channels = 16
+size = 32
 
 if node == "mp":
     n = tn.MaxPool2DNode("mp", pool_size=(2, 2))
+    in_size = 2 * size
 elif node == "fmp":
+    # on the cpu, this uses the C implementation
     n = fmp.DisjointPseudorandomFractionalMaxPool2DNode("fmp1",
                                                         fmp_alpha=1.414,
                                                         fmp_u=0.5)
+    in_size = int(np.ceil(size * 1.414))
 elif node == "fmp2":
     n = fmp.OverlappingRandomFractionalMaxPool2DNode("fmp2",
                                                      pool_size=(1.414, 1.414))
+    in_size = int(np.floor(size * 1.414))
 else:
     assert False
 
+if not same_output_size:
+    in_size = size
+
+input_shape = (batch_size, num_channels, in_size, in_size)
 
 network = tn.SequentialNode(
     "s",
-    [tn.InputNode("i", shape=(1, 1, 32, 32)),
+    [tn.InputNode("i", shape=input_shape),
      n]
 ).network()
 
@@ -36,10 +50,11 @@ if compute_grad:
 else:
     fn = network.function(["i"], ["s"])
 
-x = np.random.randn(1, 1, 32, 32).astype(fX)
+x = np.random.randn(*input_shape).astype(fX)
+print("output shape:", network["s"].get_vw("default").shape)
 
 """
-20150924 results:
+20150924 results (on a gpu, input shape (1, 1, 32, 32)):
 
 %timeit fn(x)
 
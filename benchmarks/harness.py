@@ -0,0 +1,311 @@
+"""
+minimal benchmark harness: a registry of benchmark cases, timing utilities,
+environment metadata, json results and comparison of result files
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import collections
+import fnmatch
+import json
+import math
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import timeit
+
+BENCHMARKS = collections.OrderedDict()
+
+RESULTS_FORMAT_VERSION = 1
+
+
+class Benchmark(object):
+
+    """
+    a single registered benchmark case
+
+    setup_fn:
+    function taking in the benchmark size ("quick" or "full") and returning
+    a dict with:
+    - "fn": a function of no arguments to be timed (required unless "measure"
+      is given)
+    - "items" (optional): number of items processed per call of "fn", to
+      report throughput
+    - "number" (optional): fixed number of calls per timing repeat, instead
+      of calibrating
+    - "extra" (optional): additional json-serializable data to report
+    - "measure" (optional): instead of timing "fn", call this function of no
+      arguments, which returns the time in seconds that it measured itself
+      (eg. for work done in a subprocess)
+    """
+
+    def __init__(self, name, setup_fn, tags=(), description=None):
+        self.name = name
+        self.setup_fn = setup_fn
+        self.tags = tuple(tags)
+        self.description = description
+
+    def matches(self, patterns):
+        """
+        whether the name or a tag of the benchmark matches any of the given
+        glob patterns
+        """
+        return any(fnmatch.fnmatch(self.name, pattern) or pattern in self.tags
+                   for pattern in patterns)
+
+
+def register_benchmark(name, tags=(), description=None):
+    """
+    registers the decorated setup function as a benchmark with the given name
+    """
+    def inner(setup_fn):
+        # we want to allow overwriting (eg. if the file is refreshed)
+        # sometimes, but not accidentaly overwriting
+        if name in BENCHMARKS:
+            assert setup_fn.__name__ == BENCHMARKS[name].setup_fn.__name__
+        BENCHMARKS[name] = Benchmark(
+            name=name,
+            setup_fn=setup_fn,
+            tags=tags,
+            description=description or setup_fn.__doc__,
+        )
+        return setup_fn
+    return inner
+
+
+def select_benchmarks(patterns=None):
+    if not patterns:
+        return list(BENCHMARKS.values())
+    return [b for b in BENCHMARKS.values() if b.matches(patterns)]
+
+
+# ################################## timing ##################################
+
+
+def calibrate_number(fn, min_time):
+    """
+    find a number of calls for which calling fn takes at least min_time
+    seconds (like timeit's autorange)
+    """
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            return number
+        # increase geometrically, with a guess from the current timing
+        if elapsed > 0:
+            guess = int(math.ceil(number * min_time / elapsed))
+            number = max(number * 2, min(guess, number * 10))
+        else:
+            number *= 10
+
+
+def summarize(times):
+    times = sorted(times)
+    n = len(times)
+    mean = sum(times) / n
+    if n > 1:
+        std = math.sqrt(sum((t - mean) ** 2 for t in times) / (n - 1))
+    else:
+        std = 0.0
+    if n % 2:
+        median = times[n // 2]
+    else:
+        median = (times[n // 2 - 1] + times[n // 2]) / 2
+    return dict(min=times[0], max=times[-1], mean=mean, median=median, std=std)
+
+
+def time_benchmark(benchmark, size="quick", repeat=5, min_time=0.2):
+    """
+    sets up and times a benchmark, returning a json-serializable result
+    """
+    setup_start = time.time()
+    spec = benchmark.setup_fn(size)
+    setup_time = time.time() - setup_start
+    if "measure" in spec:
+        measure = spec["measure"]
+        # warmup
+        measure()
+        number = 1
+        times = [measure() for _ in range(repeat)]
+    else:
+        fn = spec["fn"]
+        # warmup (eg. allocating buffers, filling caches)
+        fn()
+        number = spec.get("number")
+        if number is None:
+            number = calibrate_number(fn, min_time)
+        times = [t / number
+                 for t in timeit.repeat(fn, number=number, repeat=repeat)]
+    stats = summarize(times)
+    result = dict(
+        name=benchmark.name,
+        tags=list(benchmark.tags),
+        size=size,
+        number=number,
+        repeat=repeat,
+        setup_time=setup_time,
+        time=stats,
+    )
+    items = spec.get("items")
+    if items is not None:
+        result["items_per_call"] = items
+        result["items_per_second"] = items / stats["min"]
+    if "extra" in spec:
+        result["extra"] = spec["extra"]
+    return result
+
+
+# ############################ environment metadata ###########################
+
+
+def _git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with open(os.devnull, "w") as devnull:
+            out = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                          cwd=root,
+                                          stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode("ascii").strip()
+
+
+def environment_metadata():
+    import numpy as np
+    import theano
+    config = theano.config
+    return dict(
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        hostname=socket.gethostname(),
+        platform=platform.platform(),
+        processor=platform.processor(),
+        cpu_count=multiprocessing.cpu_count(),
+        python_version=sys.version.split()[0],
+        numpy_version=np.__version__,
+        theano_version=theano.__version__,
+        theano_config=dict(
+            device=config.device,
+            floatX=config.floatX,
+            mode=config.mode,
+            optimizer=config.optimizer,
+            blas_ldflags=config.blas.ldflags,
+        ),
+        theano_flags=os.environ.get("THEANO_FLAGS"),
+        omp_num_threads=os.environ.get("OMP_NUM_THREADS"),
+        git_revision=_git_revision(),
+    )
+
+
+# ################################## results ##################################
+
+
+def run_benchmarks(benchmarks, size="quick", repeat=5, min_time=0.2,
+                   log=print):
+    results = []
+    for benchmark in benchmarks:
+        try:
+            result = time_benchmark(benchmark,
+                                    size=size,
+                                    repeat=repeat,
+                                    min_time=min_time)
+        except Exception as e:
+            # a failing (eg. unsupported on this machine) benchmark should
+            # not stop the whole suite
+            result = dict(name=benchmark.name,
+                          tags=list(benchmark.tags),
+                          size=size,
+                          error="%s: %s" % (e.__class__.__name__, e))
+            log("%-45s ERROR %s" % (benchmark.name, result["error"]))
+        else:
+            log("%-45s %s" % (benchmark.name, format_result(result)))
+        results.append(result)
+    return dict(
+        format_version=RESULTS_FORMAT_VERSION,
+        environment=environment_metadata(),
+        results=results,
+    )
+
+
+def format_seconds(seconds):
+    for unit, factor in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * factor >= 1:
+            return "%.3g%s" % (seconds * factor, unit)
+    return "%.3gns" % (seconds * 1e9)
+
+
+def format_result(result):
+    s = "%s (median %s, %dx%d)" % (format_seconds(result["time"]["min"]),
+                                   format_seconds(result["time"]["median"]),
+                                   result["repeat"],
+                                   result["number"])
+    if "items_per_second" in result:
+        s += " %.4g items/s" % result["items_per_second"]
+    return s
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    assert results.get("format_version") == RESULTS_FORMAT_VERSION, path
+    return results
+
+
+def compare_results(old, new, threshold=0.1, stat="min"):
+    """
+    compares two results dicts on the given timing statistic
+
+    returns a list of dicts for benchmarks present in both, with "status"
+    one of "regression", "improvement", "unchanged" or "error"
+    """
+    old_by_name = {r["name"]: r for r in old["results"]}
+    comparisons = []
+    for new_result in new["results"]:
+        name = new_result["name"]
+        if name not in old_by_name:
+            continue
+        old_result = old_by_name[name]
+        if "error" in old_result or "error" in new_result:
+            comparisons.append(dict(name=name, status="error"))
+            continue
+        old_time = old_result["time"][stat]
+        new_time = new_result["time"][stat]
+        ratio = new_time / old_time
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "unchanged"
+        comparisons.append(dict(name=name,
+                                status=status,
+                                old=old_time,
+                                new=new_time,
+                                ratio=ratio))
+    return comparisons
+
+
+def format_comparisons(comparisons):
+    lines = []
+    for c in comparisons:
+        if c["status"] == "error":
+            lines.append("%-45s %s" % (c["name"], "ERROR"))
+        else:
+            lines.append("%-45s %10s -> %10s  x%.3f  %s" % (
+                c["name"],
+                format_seconds(c["old"]),
+                format_seconds(c["new"]),
+                c["ratio"],
+                c["status"].upper() if c["status"] == "regression"
+                else c["status"]))
+    return "\n".join(lines)
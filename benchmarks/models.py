@@ -0,0 +1,230 @@
+"""
+the example models (see examples/), built on random data so that the
+benchmarks don't need to download datasets
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+
+fX = theano.config.floatX
+
+
+def with_updates(model, target_shape, target_dtype, cost_function):
+    return tn.HyperparameterNode(
+        "with_updates",
+        tn.AdamNode(
+            "adam",
+            {"subtree": model,
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="model"),
+                 "target": tn.InputNode("y",
+                                        shape=target_shape,
+                                        dtype=target_dtype)},
+             )}),
+        cost_function=cost_function,
+    )
+
+
+def classification_data(batch_size, input_shape, num_classes=10):
+    return dict(
+        x=np.random.randn(batch_size, *input_shape).astype(fX),
+        y=np.random.randint(0, num_classes, batch_size).astype("int32"),
+    )
+
+
+def mnist_mlp(num_units=512):
+    """
+    examples/mnist_mlp.py
+    """
+    model = tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(None, 1, 28, 28)),
+             tn.DenseNode("fc1"),
+             tn.ReLUNode("relu1"),
+             tn.DropoutNode("do1"),
+             tn.DenseNode("fc2"),
+             tn.ReLUNode("relu2"),
+             tn.DropoutNode("do2"),
+             tn.DenseNode("fc3", num_units=10),
+             tn.SoftmaxNode("pred"),
+             ]),
+        num_units=num_units,
+        dropout_probability=0.5,
+        inits=[treeano.inits.XavierNormalInit()],
+    )
+    return with_updates(model,
+                        (None,),
+                        "int32",
+                        treeano.utils.categorical_crossentropy_i32)
+
+
+def mnist_cnn(num_filters=32, num_units=256):
+    """
+    examples/mnist_cnn.py
+    """
+    model = tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(None, 1, 28, 28)),
+             tn.Conv2DWithBiasNode("conv1"),
+             tn.ReLUNode("relu1"),
+             tn.MaxPool2DNode("mp1"),
+             tn.Conv2DWithBiasNode("conv2"),
+             tn.ReLUNode("relu2"),
+             tn.MaxPool2DNode("mp2"),
+             tn.DenseNode("fc1"),
+             tn.ReLUNode("relu3"),
+             tn.DropoutNode("do1"),
+             tn.DenseNode("fc2", num_units=10),
+             tn.SoftmaxNode("pred"),
+             ]),
+        num_filters=num_filters,
+        filter_size=(5, 5),
+        pool_size=(2, 2),
+        num_units=num_units,
+        dropout_probability=0.5,
+        inits=[treeano.inits.XavierNormalInit()],
+    )
+    return with_updates(model,
+                        (None,),
+                        "int32",
+                        treeano.utils.categorical_crossentropy_i32)
+
+
+def mnist_resnet(groups=3, blocks_per_group=5, num_filters=16,
+                 checkpoint=False):
+    """
+    examples/resnet/mnist_cnn.py
+
+    checkpoint:
+    whether each residual block is recomputed for the backward pass (see
+    treeano.sandbox.nodes.checkpoint)
+    """
+    from treeano.sandbox.nodes import batch_normalization as bn
+    from treeano.sandbox.nodes import checkpoint as ckpt
+    from treeano.sandbox.nodes import resnet
+
+    nodes = [
+        tn.InputNode("x", shape=(None, 1, 28, 28)),
+        tn.Conv2DNode("conv1", num_filters=num_filters),
+        bn.BatchNormalizationNode("bn1"),
+        tn.ReLUNode("relu1"),
+    ]
+    for group in range(groups):
+        for block in range(blocks_per_group):
+            if group != 0 and block == 0:
+                num_filters *= 2
+                nodes.append(resnet.residual_block_conv_2d(
+                    "resblock_%d_%d" % (group, block),
+                    num_filters=num_filters,
+                    num_layers=2,
+                    increase_dim="projection"))
+            else:
+                nodes.append(resnet.residual_block_conv_2d(
+                    "resblock_%d_%d" % (group, block),
+                    num_filters=num_filters,
+                    num_layers=2))
+            if checkpoint:
+                nodes[-1] = ckpt.CheckpointNode(
+                    "checkpoint_%d_%d" % (group, block),
+                    nodes[-1])
+    nodes += [
+        tn.GlobalMeanPool2DNode("global_pool"),
+        tn.DenseNode("logit", num_units=10),
+        tn.SoftmaxNode("pred"),
+    ]
+    model = tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode("seq", nodes),
+        filter_size=(3, 3),
+        inits=[treeano.inits.OrthogonalInit()],
+        pad="same",
+    )
+    return with_updates(model,
+                        (None,),
+                        "int32",
+                        treeano.utils.categorical_crossentropy_i32)
+
+
+def simple_rnn(hidden_state_size=10):
+    """
+    examples/simple_rnn.py
+    """
+    model = tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(None, 1)),
+             tn.recurrent.SimpleRecurrentNode(
+                 "srn",
+                 tn.TanhNode("nonlin"),
+                 batch_size=None,
+                 num_units=hidden_state_size),
+             tn.scan.ScanNode(
+                 "scan",
+                 tn.DenseNode("fc", num_units=1)),
+             tn.SigmoidNode("pred"),
+             ]),
+        inits=[treeano.inits.NormalWeightInit(0.01)],
+        scan_axis=0
+    )
+    return with_updates(model,
+                        (None, 1),
+                        fX,
+                        treeano.utils.squared_error)
+
+
+def rnn_data(length):
+    inputs = np.random.randint(0, 2, (length, 1)).astype(fX)
+    outputs = np.concatenate([np.zeros((1, 1), dtype=fX), inputs[:-1]])
+    return dict(x=inputs, y=outputs)
+
+
+# map from model name to (constructor kwargs, data function) for each size
+MODELS = dict(
+    mlp=dict(
+        constructor=mnist_mlp,
+        quick=(dict(num_units=128),
+               lambda: classification_data(64, (1, 28, 28))),
+        full=(dict(),
+              lambda: classification_data(500, (1, 28, 28))),
+    ),
+    cnn=dict(
+        constructor=mnist_cnn,
+        quick=(dict(num_filters=8, num_units=64),
+               lambda: classification_data(32, (1, 28, 28))),
+        full=(dict(),
+              lambda: classification_data(500, (1, 28, 28))),
+    ),
+    resnet=dict(
+        constructor=mnist_resnet,
+        quick=(dict(groups=2, blocks_per_group=1, num_filters=4),
+               lambda: classification_data(16, (1, 28, 28))),
+        full=(dict(),
+              lambda: classification_data(256, (1, 28, 28))),
+    ),
+    rnn=dict(
+        constructor=simple_rnn,
+        quick=(dict(),
+               lambda: rnn_data(50)),
+        full=(dict(),
+              lambda: rnn_data(500)),
+    ),
+)
+
+
+def build_model(name, size):
+    """
+    returns the root node and a batch of data for the given model and size
+    """
+    spec = MODELS[name]
+    kwargs, data_fn = spec[size]
+    return spec["constructor"](**kwargs), data_fn()
@@ -0,0 +1,109 @@
+"""
+command line interface to the benchmark suite
+
+examples:
+python benchmarks/run.py list
+python benchmarks/run.py run -o before.json
+python benchmarks/run.py run -o after.json model/mlp/* handlers
+python benchmarks/run.py compare before.json after.json --threshold 0.1
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+
+# allow running from any directory, without installing treeano
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import harness
+
+
+def list_command(args):
+    import suite
+    for benchmark in harness.select_benchmarks(args.patterns):
+        print("%-45s %s" % (benchmark.name,
+                            (benchmark.description or "").strip()
+                            .split("\n")[0]))
+
+
+def run_command(args):
+    import suite
+    benchmarks = harness.select_benchmarks(args.patterns)
+    if not benchmarks:
+        print("no benchmarks match %s" % args.patterns)
+        return 1
+    results = harness.run_benchmarks(benchmarks,
+                                     size=args.size,
+                                     repeat=args.repeat,
+                                     min_time=args.min_time)
+    if args.output is not None:
+        harness.save_results(results, args.output)
+        print("results written to %s" % args.output)
+    return 0
+
+
+def compare_command(args):
+    old = harness.load_results(args.old)
+    new = harness.load_results(args.new)
+    comparisons = harness.compare_results(old,
+                                          new,
+                                          threshold=args.threshold,
+                                          stat=args.stat)
+    print(harness.format_comparisons(comparisons))
+    regressions = [c for c in comparisons if c["status"] == "regression"]
+    if regressions:
+        print("%d regression(s) above %d%%"
+              % (len(regressions), round(args.threshold * 100)))
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command")
+
+    list_parser = subparsers.add_parser("list", help="list benchmarks")
+    list_parser.add_argument("patterns", nargs="*",
+                             help="glob patterns on names, or tags")
+    list_parser.set_defaults(fn=list_command)
+
+    run_parser = subparsers.add_parser("run", help="run benchmarks")
+    run_parser.add_argument("patterns", nargs="*",
+                            help="glob patterns on names, or tags")
+    run_parser.add_argument("-o", "--output",
+                            help="path to write json results to")
+    run_parser.add_argument("--size", choices=["quick", "full"],
+                            default="quick",
+                            help="problem sizes (full is similar to the "
+                            "examples, quick is for fast iteration)")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--min-time", type=float, default=0.2,
+                            help="minimum seconds per timing repeat")
+    run_parser.set_defaults(fn=run_command)
+
+    compare_parser = subparsers.add_parser(
+        "compare",
+        help="compare two result files, exiting with an error on regressions")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative slowdown counted as a "
+                                "regression")
+    compare_parser.add_argument("--stat", default="min",
+                                choices=["min", "median", "mean"])
+    compare_parser.set_defaults(fn=compare_command)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    return args.fn(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
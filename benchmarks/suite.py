@@ -0,0 +1,1119 @@
+"""
+benchmark cases of the suite
+
+importing this module registers all of the cases into harness.BENCHMARKS
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import contextlib
+import functools
+import io
+import os
+import subprocess
+import sys
+
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+import canopy
+
+from harness import register_benchmark
+import models
+
+fX = theano.config.floatX
+
+
+@contextlib.contextmanager
+def _quiet():
+    old_stdout = sys.stdout
+    sys.stdout = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+    try:
+        yield
+    finally:
+        sys.stdout = old_stdout
+
+
+def _quiet_handled_fn(*args, **kwargs):
+    """
+    handled_fn prints how long building and compiling takes, which would
+    clutter the benchmark output
+    """
+    with _quiet():
+        return canopy.handled_fn(*args, **kwargs)
+
+
+# ################################## models ##################################
+
+
+def _build_setup(model_name, size, lazy=False):
+    root_node, _ = models.build_model(model_name, size)
+
+    def fn():
+        network = root_node.network(lazy=lazy)
+        network.build()
+        if lazy:
+            # what an inference-only function needs
+            network["model"].get_vw("default")
+
+    return dict(fn=fn, number=1)
+
+
+def _compile_setup(model_name, size, include_updates):
+    root_node, _ = models.build_model(model_name, size)
+    network = root_node.network()
+    network.build()
+    if include_updates:
+        inputs, outputs = ["x", "y"], ["cost"]
+    else:
+        inputs, outputs = ["x"], ["model"]
+
+    def fn():
+        network.function(inputs, outputs, include_updates=include_updates)
+
+    return dict(fn=fn, number=1)
+
+
+def _forward_setup(model_name, size):
+    root_node, data = models.build_model(model_name, size)
+    network = root_node.network(
+        override_hyperparameters=dict(deterministic=True,
+                                      bn_use_moving_stats=True))
+    fn = network.function(["x"], ["model"])
+    x = data["x"]
+    return dict(fn=lambda: fn(x), items=len(x))
+
+
+def _num_nodes(network):
+    network.build()
+    return len(list(network.graph.architectural_tree_nodes_root_to_leaves()))
+
+
+def _optimized_forward_setup(model_name, size):
+    root_node, data = models.build_model(model_name, size)
+    network = root_node.network(
+        override_hyperparameters=dict(deterministic=True,
+                                      bn_use_moving_stats=True))
+    optimized = canopy.transforms.optimize_for_inference(network)
+    fn = optimized.function(["x"], ["model"])
+    x = data["x"]
+    extra = dict(
+        num_nodes_before=_num_nodes(network),
+        num_nodes_after=_num_nodes(optimized),
+        num_apply_nodes_before=len(network.function(
+            ["x"], ["model"]).maker.fgraph.apply_nodes),
+        num_apply_nodes_after=len(fn.maker.fgraph.apply_nodes),
+    )
+    return dict(fn=lambda: fn(x), items=len(x), extra=extra)
+
+
+def _parameter_bytes(network):
+    return sum(v.nbytes
+               for v in canopy.network_utils.to_value_dict(network).values())
+
+
+def _quantized_forward_setup(model_name, size):
+    root_node, data = models.build_model(model_name, size)
+    network = root_node.network(
+        override_hyperparameters=dict(deterministic=True,
+                                      bn_use_moving_stats=True))
+    x = data["x"]
+    quantized = canopy.transforms.quantize(network, {"x": "x"}, {"x": x})
+    fn = quantized.function(["x"], ["model"])
+    expected = network.function(["x"], ["model"])(x)[0]
+    res = fn(x)[0]
+    extra = dict(
+        parameter_bytes_before=_parameter_bytes(network),
+        parameter_bytes_after=_parameter_bytes(quantized),
+        max_abs_error=float(np.abs(expected - res).max()),
+    )
+    if expected.ndim == 2:
+        extra["argmax_agreement"] = float(np.mean(
+            expected.argmax(axis=1) == res.argmax(axis=1)))
+    return dict(fn=lambda: fn(x), items=len(x), extra=extra)
+
+
+def _frozen_forward_setup(model_name, size):
+    root_node, data = models.build_model(model_name, size)
+    network = root_node.network(
+        override_hyperparameters=dict(deterministic=True,
+                                      bn_use_moving_stats=True))
+    fn = canopy.frozen.export_network(network, ["x"], ["model"])
+    x = data["x"]
+    return dict(fn=lambda: fn(x), items=len(x))
+
+
+def _train_step_setup(model_name, size):
+    root_node, data = models.build_model(model_name, size)
+    network = root_node.network()
+    fn = network.function(["x", "y"], ["cost"], include_updates=True)
+    x, y = data["x"], data["y"]
+    return dict(fn=lambda: fn(x, y), items=len(x))
+
+
+for _model_name in sorted(models.MODELS):
+    for _kind, _setup, _kwargs in [
+            ("build", _build_setup, {}),
+            ("build_inference", _build_setup, dict(lazy=True)),
+            ("compile_forward", _compile_setup, dict(include_updates=False)),
+            ("compile_train", _compile_setup, dict(include_updates=True)),
+            ("forward", _forward_setup, {}),
+            ("optimized_forward", _optimized_forward_setup, {}),
+            ("quantized_forward", _quantized_forward_setup, {}),
+            ("frozen_forward", _frozen_forward_setup, {}),
+            ("train_step", _train_step_setup, {})]:
+        register_benchmark(
+            "model/%s/%s" % (_model_name, _kind),
+            tags=("model", _model_name, _kind),
+            description="%s of the %s example model" % (_kind, _model_name),
+        )(functools.partial(_setup, _model_name, **_kwargs))
+
+
+# ############################## handler chains ##############################
+
+
+def _handler_network():
+    return tn.SequentialNode(
+        "s",
+        [tn.InputNode("x", shape=(1, 16)),
+         tn.DenseNode("fc", num_units=16)]
+    ).network()
+
+
+@register_benchmark("handlers/raw_function", tags=("handlers",))
+def raw_function(size):
+    """
+    per call time of a compiled network function without handlers, as
+    a baseline for the handler benchmarks
+    """
+    network = _handler_network()
+    fn = network.function(["x"], ["s"])
+    x = np.random.randn(1, 16).astype(fX)
+    return dict(fn=lambda: fn(x))
+
+
+@register_benchmark("handlers/handled_fn_empty", tags=("handlers",))
+def handled_fn_empty(size):
+    """
+    per call time of a handled_fn without additional handlers
+    """
+    network = _handler_network()
+    fn = _quiet_handled_fn(network, [], {"x": "x"}, {"out": "s"})
+    in_dict = {"x": np.random.randn(1, 16).astype(fX)}
+    return dict(fn=lambda: fn(in_dict))
+
+
+@register_benchmark("handlers/handled_fn_build_only", tags=("handlers",))
+def handled_fn_build_only(size):
+    """
+    per call time of a handled_fn with handlers that only transform the
+    network (and so are skipped when calling)
+    """
+    network = _handler_network()
+    fn = _quiet_handled_fn(
+        network,
+        [canopy.handlers.override_hyperparameters(deterministic=True),
+         canopy.handlers.with_hyperparameters("hp", inits=[]),
+         canopy.handlers.remove_nodes_with_class(tn.DropoutNode)],
+        {"x": "x"},
+        {"out": "s"})
+    in_dict = {"x": np.random.randn(1, 16).astype(fX)}
+    return dict(fn=lambda: fn(in_dict))
+
+
+@register_benchmark("handlers/handled_fn_chain", tags=("handlers",))
+def handled_fn_chain(size):
+    """
+    per call time of a handled_fn with a typical chain of handlers
+    """
+    network = _handler_network()
+    fn = _quiet_handled_fn(
+        network,
+        [canopy.handlers.time_call(key="total_time"),
+         canopy.handlers.override_hyperparameters(deterministic=True),
+         canopy.handlers.split_input(split_size=1, keys=["x"]),
+         canopy.handlers.batch_pad(batch_size=1, keys=["x"])],
+        {"x": "x"},
+        {"out": "s"})
+    in_dict = {"x": np.random.randn(1, 16).astype(fX)}
+    return dict(fn=lambda: fn(in_dict))
+
+
+MC_DROPOUT_SAMPLES = 16
+
+
+def _mc_dropout_setup(batched, size):
+    root_node, data = models.build_model("mlp", size)
+    network = root_node.network()
+    x = data["x"]
+    if batched:
+        fn = _quiet_handled_fn(
+            network,
+            [canopy.handlers.monte_carlo_samples(MC_DROPOUT_SAMPLES, ["x"])],
+            {"x": "x"},
+            {"out": "model"})
+
+        def run():
+            return fn({"x": x})
+    else:
+        fn = _quiet_handled_fn(network, [], {"x": "x"}, {"out": "model"})
+
+        def run():
+            samples = [fn({"x": x})["out"]
+                       for _ in range(MC_DROPOUT_SAMPLES)]
+            return np.mean(samples, axis=0), np.var(samples, axis=0)
+    return dict(fn=run,
+                items=len(x),
+                extra=dict(num_samples=MC_DROPOUT_SAMPLES))
+
+
+for _kind, _batched in [("loop", False), ("batched", True)]:
+    register_benchmark(
+        "handlers/mc_dropout_%s" % _kind,
+        tags=("handlers", "mc_dropout"),
+        description=("mean and variance of %d monte carlo dropout samples "
+                     "of the mlp model (%s)" % (MC_DROPOUT_SAMPLES, _kind)),
+    )(functools.partial(_mc_dropout_setup, _batched))
+
+
+ENSEMBLE_SIZE = 8
+
+
+def _ensemble_setup(model_name, batched, size):
+    value_dicts = []
+    networks = []
+    for _ in range(ENSEMBLE_SIZE):
+        root_node, data = models.build_model(model_name, size)
+        network = root_node.network(
+            override_hyperparameters=dict(deterministic=True))
+        # only the inference part of the network, without the optimizer
+        network = canopy.transforms.remove_parents(network, "model")
+        network.build()
+        value_dicts.append(canopy.network_utils.to_value_dict(network))
+        networks.append(network)
+    x = data["x"]
+    if batched:
+        fn = canopy.transforms.ensemble_fn(networks[0],
+                                           value_dicts,
+                                           {"x": "x"},
+                                           {"out": "model"})
+
+        def run():
+            return fn({"x": x})
+    else:
+        fns = [_quiet_handled_fn(network, [], {"x": "x"}, {"out": "model"})
+               for network in networks]
+
+        def run():
+            samples = [fn({"x": x})["out"] for fn in fns]
+            return np.mean(samples, axis=0), np.var(samples, axis=0)
+    return dict(fn=run,
+                items=len(x),
+                extra=dict(ensemble_size=ENSEMBLE_SIZE))
+
+
+for _model_name in ["mlp", "cnn"]:
+    for _kind, _batched in [("sequential", False), ("batched", True)]:
+        register_benchmark(
+            "ensemble/%s/%s" % (_model_name, _kind),
+            tags=("ensemble", _model_name),
+            description=("mean and variance of an ensemble of %d %s models "
+                         "(%s)" % (ENSEMBLE_SIZE, _model_name, _kind)),
+        )(functools.partial(_ensemble_setup, _model_name, _batched))
+
+
+# ########################### sensitivity analysis ###########################
+
+
+def _sensitivity_setup(num_classes, batched, size):
+    from treeano.sandbox import sensitivity_analysis
+    network = tn.HyperparameterNode(
+        "hp",
+        tn.SequentialNode(
+            "s",
+            [tn.InputNode("x", shape=(None, 1, 28, 28)),
+             tn.DenseNode("fc", num_units=128),
+             tn.ReLUNode("relu"),
+             tn.DenseNode("logit", num_units=num_classes)]),
+        inits=[treeano.inits.XavierNormalInit()]
+    ).network()
+    network.build()
+    x = np.random.randn(4, 1, 28, 28).astype(fX)
+    idxs = list(range(num_classes))
+    with _quiet():
+        if batched:
+            fn = sensitivity_analysis.batched_sensitivity_analysis_fn(
+                "x", "logit", network, [], chunk_size=100)
+        else:
+            fn = sensitivity_analysis.sensitivity_analysis_fn(
+                "x", "logit", network, [])
+
+    def run():
+        if batched:
+            return [heatmaps for _, heatmaps in fn(x, idxs)]
+        else:
+            return [fn(x, idx) for idx in idxs]
+
+    return dict(fn=run, items=num_classes)
+
+
+for _num_classes in [10, 1000]:
+    for _kind, _batched in [("loop", False), ("batched", True)]:
+        register_benchmark(
+            "sensitivity/%d_classes/%s" % (_num_classes, _kind),
+            tags=("sensitivity",),
+            description=("sensitivity analysis of all %d classes for 4 "
+                         "examples (%s)" % (_num_classes, _kind)),
+        )(functools.partial(_sensitivity_setup, _num_classes, _batched))
+
+
+# ######################### decision tree probability #########################
+
+
+def _tree_probability_setup(depth, sparse, size):
+    from treeano.theano_extensions import tree_probability
+    if sparse:
+        op = tree_probability.sparse_tree_probability
+    else:
+        op = tree_probability.tree_probability
+    batch_size = 16 if size == "quick" else 128
+    num_splits = 2 ** depth - 1
+    x = T.matrix("x")
+    w = T.matrix("w")
+    out = op(x)
+    fn = theano.function([x, w], [out, T.grad((out * w).sum(), x)])
+    x_val = np.random.uniform(0.01, 0.99,
+                              size=(batch_size, num_splits)).astype(fX)
+    w_val = np.random.randn(batch_size, num_splits + 1).astype(fX)
+    return dict(fn=lambda: fn(x_val, w_val), items=batch_size)
+
+
+for _depth in [4, 6, 8, 10, 12]:
+    for _kind, _sparse in [("loop", False), ("sparse", True)]:
+        register_benchmark(
+            "tree_probability/depth_%d/%s" % (_depth, _kind),
+            tags=("tree_probability",),
+            description=("leaf probabilities of a decision tree of depth %d "
+                         "and their gradient (%s)" % (_depth, _kind)),
+        )(functools.partial(_tree_probability_setup, _depth, _sparse))
+
+
+# ############################### word vectors ###############################
+
+
+def _coocurrence_setup(kind, size):
+    from treeano.sandbox.nodes import word_vectors
+    vocabulary_size = 10000
+    if kind == "loop":
+        num_tokens = 10000 if size == "quick" else 100000
+    else:
+        num_tokens = 200000 if size == "quick" else 10000000
+    rng = np.random.RandomState(42)
+    # zipfian tokens, in sentences of 20 tokens
+    tokens = (rng.zipf(1.3, size=num_tokens) % vocabulary_size).astype(
+        np.int32)
+    offsets = np.arange(0, num_tokens + 1, 20)
+    if kind == "loop":
+        data = [list(tokens[start:start + 20]) for start in offsets[:-1]]
+
+        def fn():
+            return word_vectors.coocurrence_matrix(data, vocabulary_size)
+    else:
+        num_workers = 4 if kind == "parallel" else 1
+
+        def fn():
+            return word_vectors.coocurrence_counts(tokens,
+                                                   offsets,
+                                                   vocabulary_size,
+                                                   num_workers=num_workers)
+
+    return dict(fn=fn, items=num_tokens)
+
+
+for _kind in ["loop", "vectorized", "parallel"]:
+    register_benchmark(
+        "word_vectors/coocurrence/%s" % _kind,
+        tags=("word_vectors",),
+        description=("co-occurrence counts with a window of 5 (%s), items "
+                     "are tokens" % _kind),
+    )(functools.partial(_coocurrence_setup, _kind))
+
+
+def _sparse_block_setup(kind, size):
+    import scipy.sparse
+    from treeano.sandbox.nodes import sparse_updates
+    from treeano.sandbox.nodes import word_vectors
+    vocabulary_size = 20000 if size == "quick" else 200000
+    block_size = 256
+    num_blocks = 10
+    counts = scipy.sparse.random(vocabulary_size,
+                                 vocabulary_size,
+                                 density=1e-4,
+                                 format="csr",
+                                 random_state=42)
+    counts.data = np.ceil(counts.data * 100)
+    node = word_vectors.SparseBlockWordVectorsNode(
+        "wv",
+        vocabulary_size=vocabulary_size,
+        embedding_size=64)
+    if kind == "dense":
+        updates_cls = tn.ADAGRADNode
+    else:
+        updates_cls = sparse_updates.SparseAdaGradNode
+    network = tn.HyperparameterNode(
+        "hp",
+        updates_cls("updates",
+                    {"subtree": node,
+                     "cost": tn.ReferenceNode("cost", reference="wv")}),
+        learning_rate=0.05,
+        inits=[treeano.inits.NormalWeightInit(0.01)],
+    ).network()
+    fn = _quiet_handled_fn(network,
+                           [],
+                           node.inputs(),
+                           {"cost": "wv"},
+                           include_updates=True)
+    blocks = word_vectors.sparse_blocks(counts,
+                                        vocabulary_size // block_size,
+                                        random_state=42)
+    if kind == "sparse_prefetch":
+        blocks = canopy.fn_utils.prefetch(blocks)
+
+    def run():
+        for _ in range(num_blocks):
+            fn(next(blocks))
+
+    return dict(fn=run, items=num_blocks)
+
+
+for _kind in ["dense", "sparse", "sparse_prefetch"]:
+    register_benchmark(
+        "word_vectors/sparse_block/%s" % _kind,
+        tags=("word_vectors",),
+        description=("adagrad on blocks of a sparse co-occurrence matrix, "
+                     "with %s updates, items are blocks" % _kind),
+    )(functools.partial(_sparse_block_setup, _kind))
+
+
+# ############################# large softmaxes #############################
+
+
+def _large_softmax_setup(kind, size):
+    from treeano.sandbox.nodes import large_softmax
+    from treeano.sandbox.nodes import sparse_updates
+    num_classes = 2 ** 14 if size == "quick" else 2 ** 17
+    num_features = 256
+    batch_size = 128
+    if kind == "full":
+        output_nodes = [tn.DenseNode("d", num_units=num_classes),
+                        tn.SoftmaxNode("sm")]
+    elif kind == "sampled":
+        output_nodes = [large_softmax.SampledSoftmaxNode("sm",
+                                                         num_samples=1024)]
+    elif kind == "hierarchical":
+        output_nodes = [large_softmax.HierarchicalSoftmaxNode("sm")]
+    # only updates the looked up rows of the sampled and hierarchical
+    # softmaxes (same as SGDNode for the full softmax)
+    network = tn.HyperparameterNode(
+        "hp",
+        sparse_updates.SparseSGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [tn.InputNode("x", shape=(None, num_features))]
+                + output_nodes),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                  "target": tn.InputNode("y",
+                                         shape=(None,),
+                                         dtype="int32")})}),
+        num_classes=num_classes,
+        target_reference="y",
+        cost_function=large_softmax.target_categorical_crossentropy_i32,
+        learning_rate=0.01,
+        inits=[treeano.inits.NormalWeightInit(0.01)],
+    ).network()
+    fn = _quiet_handled_fn(network,
+                           [],
+                           {"x": "x", "y": "y"},
+                           {"cost": "cost"},
+                           include_updates=True)
+    rng = np.random.RandomState(42)
+    x = rng.randn(batch_size, num_features).astype(fX)
+    y = rng.randint(num_classes, size=batch_size).astype(np.int32)
+    return dict(fn=lambda: fn({"x": x, "y": y}), items=batch_size)
+
+
+for _kind in ["full", "sampled", "hierarchical"]:
+    register_benchmark(
+        "large_softmax/%s" % _kind,
+        tags=("softmax",),
+        description=("sgd step of a %s softmax output layer, items are "
+                     "examples" % _kind),
+    )(functools.partial(_large_softmax_setup, _kind))
+
+
+# ############################ large embeddings ############################
+
+
+def _large_embedding_setup(kind, size):
+    import tempfile
+    from treeano.sandbox.nodes import embedding_tables
+    from treeano.sandbox.nodes import sparse_updates
+    vocabulary_size = 200000 if size == "quick" else 2000000
+    embedding_size = 64
+    batch_size = 1024
+    cache_size = 2 ** 14
+    handlers = []
+    if kind == "dense":
+        embedding = sparse_updates.SparseEmbeddingNode(
+            "e", input_size=vocabulary_size)
+    elif kind == "memmap":
+        embedding = sparse_updates.SparseEmbeddingNode(
+            "e", input_size=cache_size)
+        # NOTE: the file is left in the temporary directory, as there is
+        # no teardown
+        table = embedding_tables.MemmapEmbeddingTable(
+            os.path.join(tempfile.mkdtemp(), "table.npy"),
+            cache_size=cache_size,
+            shape=(vocabulary_size, embedding_size))
+        handlers.append(embedding_tables.memmap_embedding(table, "e", ["x"]))
+    elif kind == "hashed":
+        embedding = embedding_tables.HashedEmbeddingNode(
+            "e", num_buckets=vocabulary_size // 16, num_hashes=2)
+    network = tn.HyperparameterNode(
+        "hp",
+        sparse_updates.SparseSGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [tn.InputNode("i", shape=(None,), dtype="int32"),
+                 embedding]),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                  "target": tn.InputNode("y",
+                                         shape=(None, embedding_size))})}),
+        output_size=embedding_size,
+        learning_rate=0.1,
+        cost_function=treeano.utils.squared_error,
+        inits=[treeano.inits.NormalWeightInit(0.01)],
+    ).network()
+    fn = _quiet_handled_fn(network,
+                           handlers,
+                           {"x": "i", "y": "y"},
+                           {"cost": "cost"},
+                           include_updates=True)
+    rng = np.random.RandomState(42)
+    # word frequencies are roughly zipfian
+    batches = [((rng.zipf(1.3, size=batch_size) - 1)
+                % vocabulary_size).astype(np.int32)
+               for _ in range(16)]
+    y = rng.randn(batch_size, embedding_size).astype(fX)
+    batch_idx = [0]
+
+    def run():
+        batch_idx[0] = (batch_idx[0] + 1) % len(batches)
+        fn({"x": batches[batch_idx[0]], "y": y})
+
+    return dict(fn=run, items=batch_size)
+
+
+for _kind in ["dense", "memmap", "hashed"]:
+    register_benchmark(
+        "large_embedding/%s" % _kind,
+        tags=("embedding",),
+        description=("sparse sgd step of an embedding with a %s table, "
+                     "items are examples" % _kind),
+    )(functools.partial(_large_embedding_setup, _kind))
+
+
+# ############################### sparse inputs ###############################
+
+
+def _sparse_input_setup(densify, size):
+    import scipy.sparse
+    num_features = 20000 if size == "quick" else 100000
+    batch_size = 256
+    x = scipy.sparse.random(batch_size,
+                            num_features,
+                            density=0.01,
+                            format="csr",
+                            dtype=fX,
+                            random_state=42)
+    if densify:
+        input_node = tn.InputNode("i", shape=(None, num_features))
+
+        # includes densifying the batch, as that is part of the cost
+        def to_input(x):
+            return x.toarray()
+    else:
+        input_node = tn.SparseInputNode("i", shape=(None, num_features))
+
+        def to_input(x):
+            return x
+    network = tn.HyperparameterNode(
+        "hp",
+        tn.SGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [input_node,
+                 tn.DenseNode("d", num_units=128),
+                 tn.ReLUNode("r"),
+                 tn.DenseNode("d2", num_units=10),
+                 tn.SoftmaxNode("p")]),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                  "target": tn.InputNode("y", shape=(None,),
+                                         dtype="int32")})}),
+        cost_function=treeano.utils.categorical_crossentropy_i32,
+        learning_rate=0.01,
+        inits=[treeano.inits.NormalWeightInit(0.01)],
+    ).network()
+    fn = _quiet_handled_fn(network,
+                           [],
+                           {"x": "i", "y": "y"},
+                           {"cost": "cost"},
+                           include_updates=True)
+    y = np.random.RandomState(42).randint(10, size=batch_size).astype(
+        np.int32)
+
+    def run():
+        fn({"x": to_input(x), "y": y})
+
+    return dict(fn=run, items=batch_size)
+
+
+for _densify in [True, False]:
+    register_benchmark(
+        "sparse_input/%s" % ("densified" if _densify else "sparse"),
+        tags=("sparse",),
+        description=("sgd step of an mlp on bag-of-words features with 1%% "
+                     "density, %s, items are examples"
+                     % ("densified before the call" if _densify
+                        else "as a csr matrix")),
+    )(functools.partial(_sparse_input_setup, _densify))
+
+
+# ################################ simple rnn ################################
+
+
+def _simple_rnn_setup(unroll, length, size):
+    # the model of examples/simple_rnn.py, with a fixed sequence length
+    batch_size = None if size == "quick" else 32
+    input_shape = (length, 1) if batch_size is None else (length,
+                                                         batch_size,
+                                                         1)
+    model = tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=input_shape),
+             tn.recurrent.SimpleRecurrentNode(
+                 "srn",
+                 tn.TanhNode("nonlin"),
+                 batch_size=batch_size,
+                 num_units=10),
+             tn.scan.ScanNode(
+                 "scan",
+                 tn.DenseNode("fc", num_units=1)),
+             tn.SigmoidNode("pred"),
+             ]),
+        inits=[treeano.inits.NormalWeightInit(0.01)],
+        scan_axis=0,
+        scan_unroll=unroll,
+    )
+    network = tn.HyperparameterNode(
+        "with_updates",
+        tn.AdamNode(
+            "adam",
+            {"subtree": model,
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="model"),
+                 "target": tn.InputNode("y", shape=input_shape)},
+             )}),
+        cost_function=treeano.utils.squared_error,
+    ).network()
+    fn = _quiet_handled_fn(network,
+                           [],
+                           {"x": "x", "y": "y"},
+                           {"cost": "cost"},
+                           include_updates=True)
+    rng = np.random.RandomState(42)
+    x = rng.randint(0, 2, size=input_shape).astype(fX)
+    y = rng.randint(0, 2, size=input_shape).astype(fX)
+    return dict(fn=lambda: fn({"x": x, "y": y}), items=length)
+
+
+# unrolled graphs take superlinear time to compile, so they are only
+# benchmarked for short sequences
+for _unroll, _lengths in [(False, [5, 10, 50, 200]), (True, [5, 10])]:
+    for _length in _lengths:
+        register_benchmark(
+            "simple_rnn/%s/%d" % ("unrolled" if _unroll else "scan", _length),
+            tags=("recurrent",),
+            description=("adam step of the simple_rnn example with "
+                         "sequences of length %d, %s, items are steps "
+                         "(quick: a single sequence, full: batches of 32)"
+                         % (_length,
+                            "unrolled" if _unroll else "with theano.scan")),
+        )(functools.partial(_simple_rnn_setup, _unroll, _length))
+
+
+# ########################### streaming recurrence ###########################
+
+
+def _streaming_rnn_setup(stateful, size):
+    history_length = 512 if size == "quick" else 4096
+    chunk_length = 16
+    batch_size = 8
+    num_features = 64
+    network = tn.HyperparameterNode(
+        "hp",
+        tn.SequentialNode(
+            "s",
+            [tn.InputNode("x", shape=(None, batch_size, num_features)),
+             tn.recurrent.SimpleRecurrentNode("rnn",
+                                              tn.TanhNode("tanh"),
+                                              batch_size=batch_size,
+                                              num_units=128,
+                                              scan_axis=0)]),
+        stateful=stateful,
+        inits=[treeano.inits.NormalWeightInit(0.05)],
+    ).network()
+    # includes updates, which only keep the final states
+    fn = _quiet_handled_fn(network,
+                           [],
+                           {"x": "x"},
+                           {"h": "s"},
+                           include_updates=True)
+    rng = np.random.RandomState(42)
+    if stateful:
+        fn({"x": rng.randn(history_length,
+                           batch_size,
+                           num_features).astype(fX)})
+        x = rng.randn(chunk_length, batch_size, num_features).astype(fX)
+    else:
+        # the whole sequence is recomputed for each chunk
+        x = rng.randn(history_length + chunk_length,
+                      batch_size,
+                      num_features).astype(fX)
+    return dict(fn=lambda: fn({"x": x}), items=chunk_length)
+
+
+for _stateful in [False, True]:
+    register_benchmark(
+        "streaming_rnn/%s" % ("stateful" if _stateful else "recompute"),
+        tags=("recurrent",),
+        description=("outputs of a simple rnn for a new chunk of a long "
+                     "sequence, %s, items are steps"
+                     % ("keeping the final states between calls"
+                        if _stateful
+                        else "recomputing the whole sequence")),
+    )(functools.partial(_streaming_rnn_setup, _stateful))
+
+
+# ########################## gradient checkpointing ##########################
+
+
+def _peak_traced_bytes(fn):
+    """
+    peak memory allocated (by python and numpy) during a call of fn, or
+    None without tracemalloc (python 2)
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _resnet_checkpoint_setup(checkpoint, size):
+    spec = models.MODELS["resnet"]
+    kwargs, data_fn = spec[size]
+    root_node = spec["constructor"](checkpoint=checkpoint, **kwargs)
+    data = data_fn()
+    network = root_node.network()
+    fn = network.function(["x", "y"], ["cost"], include_updates=True)
+    x, y = data["x"], data["y"]
+    fn(x, y)
+    extra = dict(peak_bytes=_peak_traced_bytes(lambda: fn(x, y)))
+    return dict(fn=lambda: fn(x, y), items=len(x), extra=extra)
+
+
+for _checkpoint in [False, True]:
+    register_benchmark(
+        "resnet_checkpoint/%s" % ("recomputed" if _checkpoint else "stored"),
+        tags=("model", "resnet", "checkpoint"),
+        description=("train step of the resnet example model, %s (extra "
+                     "peak_bytes is the peak memory of a step)"
+                     % ("recomputing the activations of each residual "
+                        "block for the backward pass"
+                        if _checkpoint
+                        else "storing all activations")),
+    )(functools.partial(_resnet_checkpoint_setup, _checkpoint))
+
+
+# ############################# micro benchmarks #############################
+
+
+def create_big_node_graph(levels):
+    assert levels >= 0
+    if levels == 0:
+        return tn.IdentityNode("i")
+    else:
+        prev = create_big_node_graph(levels - 1)
+        return tn.SequentialNode(
+            "s",
+            [canopy.node_utils.suffix_node(prev, "0"),
+             canopy.node_utils.suffix_node(prev, "1")])
+
+
+@register_benchmark("micro/walk_utils/big_node_graph", tags=("micro",))
+def big_node_graph(size):
+    """
+    benchmarks/walk_utils_cached_walk.py
+    """
+    levels = 5 if size == "quick" else 10
+    return dict(fn=lambda: create_big_node_graph(levels),
+                extra=dict(levels=levels))
+
+
+def elu1(x, alpha=1.):
+    return T.switch(T.gt(x, 0.), x, alpha * (T.exp(x) - 1))
+
+
+def elu2(x, alpha=1.):
+    pos = (x + abs(x)) / 2
+    neg = (x + -abs(x)) / 2
+    return pos + alpha * (T.exp(neg) - 1)
+
+
+def _elu_setup(elu, grad, size):
+    n = 512 if size == "quick" else 4096
+    x = T.matrix()
+    f = elu(x)
+    if grad:
+        f = T.grad(f.sum(), x)
+    fn = theano.function([x], f)
+    X = np.random.randn(n, n).astype(fX)
+    return dict(fn=lambda: fn(X), items=n * n)
+
+
+for _elu_name, _elu in [("elu1", elu1), ("elu2", elu2)]:
+    for _grad in [False, True]:
+        register_benchmark(
+            "micro/elu/%s%s" % (_elu_name, "_grad" if _grad else ""),
+            tags=("micro", "elu"),
+            description="benchmarks/elu.py",
+        )(functools.partial(_elu_setup, _elu, _grad))
+
+
+def _network_fn_setup(nodes, shape, size):
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=shape)] + nodes
+    ).network()
+    fn = network.function(["i"], ["s"])
+    x = np.random.randn(*shape).astype(fX)
+    return dict(fn=lambda: fn(x), items=shape[0])
+
+
+@register_benchmark("micro/repeat_n_d", tags=("micro", "upsample"))
+def repeat_n_d(size):
+    """
+    benchmarks/repeat_n_d.py
+    """
+    n = 8 if size == "quick" else 32
+    return _network_fn_setup(
+        [tn.SpatialRepeatNDNode("r", upsample_factor=(2, 2, 2))],
+        (n, n, n, n, n),
+        size)
+
+
+@register_benchmark("micro/sparse_upsample", tags=("micro", "upsample"))
+def sparse_upsample(size):
+    """
+    benchmarks/repeat_n_d_vs_sparse_upsample.py
+    """
+    n = 8 if size == "quick" else 32
+    return _network_fn_setup(
+        [tn.SpatialSparseUpsampleNode("us", upsample_factor=(2, 2, 2))],
+        (n, n, n, n, n),
+        size)
+
+
+@register_benchmark("micro/conv_3d2d", tags=("micro", "conv"))
+def conv_3d2d(size):
+    """
+    benchmarks/conv_3d.py (with Conv3D2DNode, the implementation that doesn't
+    require a GPU)
+    """
+    n = 16 if size == "quick" else 32
+    return _network_fn_setup(
+        [tn.Conv3D2DNode("conv", num_filters=32, filter_size=(3, 3, 3))],
+        (1, 1, n, n, n),
+        size)
+
+
+def _pool_setup(node_fn, grad, size, input_shape=(1, 1, 32, 32)):
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=input_shape),
+         node_fn()]
+    ).network()
+    if grad:
+        i = network["i"].get_vw("default").variable
+        s = network["s"].get_vw("default").variable
+        fn = network.function(["i"], [T.grad(s.sum(), i)])
+    else:
+        fn = network.function(["i"], ["s"])
+    x = np.random.randn(*input_shape).astype(fX)
+    return dict(fn=lambda: fn(x))
+
+
+def _disjoint_fmp():
+    from treeano.sandbox.nodes import fmp
+    return fmp.DisjointPseudorandomFractionalMaxPool2DNode(
+        "fmp1", fmp_alpha=1.414, fmp_u=0.5)
+
+
+def _overlapping_fmp():
+    from treeano.sandbox.nodes import fmp
+    return fmp.OverlappingRandomFractionalMaxPool2DNode(
+        "fmp2", pool_size=(1.414, 1.414))
+
+
+for _pool_name, _node_fn in [
+        ("max_pool", lambda: tn.MaxPool2DNode("mp", pool_size=(2, 2))),
+        ("disjoint_fmp", _disjoint_fmp),
+        ("overlapping_fmp", _overlapping_fmp)]:
+    for _grad in [False, True]:
+        register_benchmark(
+            "micro/pooling/%s%s" % (_pool_name, "_grad" if _grad else ""),
+            tags=("micro", "pooling"),
+            description="benchmarks/fractional_max_pooling.py",
+        )(functools.partial(_pool_setup, _node_fn, _grad))
+
+
+def _same_output_pool_setup(node_fn, in_size_fn, grad, size):
+    """
+    pooling with input sizes chosen so that the outputs have the same size
+    """
+    out_size = 16 if size == "quick" else 32
+    return _pool_setup(node_fn,
+                       grad,
+                       size,
+                       input_shape=(32, 16) + (in_size_fn(out_size),) * 2)
+
+
+for _pool_name, _node_fn, _in_size_fn in [
+        ("max_pool",
+         lambda: tn.MaxPool2DNode("mp", pool_size=(2, 2)),
+         lambda out_size: 2 * out_size),
+        ("disjoint_fmp",
+         _disjoint_fmp,
+         lambda out_size: int(np.ceil(out_size * 1.414)))]:
+    for _grad in [False, True]:
+        register_benchmark(
+            "micro/pooling/same_output/%s%s" % (_pool_name,
+                                                "_grad" if _grad else ""),
+            tags=("micro", "pooling"),
+            description="benchmarks/fractional_max_pooling.py",
+        )(functools.partial(_same_output_pool_setup,
+                            _node_fn,
+                            _in_size_fn,
+                            _grad))
+
+
+def _lrn_setup(grad, size):
+    from treeano.sandbox.nodes import lrn
+    shape = (32, 32, 32, 32) if size == "quick" else (128, 32, 128, 128)
+    vw = treeano.VariableWrapper("foo",
+                                 variable=T.tensor4(),
+                                 shape=shape)
+    target = lrn.local_response_normalization_2d_v1(
+        vw, alpha=1e-4, k=2, beta=0.75, n=5).sum()
+    if grad:
+        target = T.grad(target, vw.variable).sum()
+    fn = theano.function([vw.variable], [target])
+    x = np.random.randn(*shape).astype(fX)
+    return dict(fn=lambda: fn(x), items=shape[0])
+
+
+for _grad in [False, True]:
+    register_benchmark(
+        "micro/lrn_2d%s" % ("_grad" if _grad else ""),
+        tags=("micro", "lrn"),
+        description="benchmarks/local_response_normalization_2d.py",
+    )(functools.partial(_lrn_setup, _grad))
+
+
+@register_benchmark("micro/sparse_updates", tags=("micro", "updates"))
+def sparse_updates(size):
+    """
+    benchmarks/sparse_updates.py: updating a single row of a large shared
+    variable the way UpdateDeltas does
+    """
+    rows, cols = (3000, 1000) if size == "quick" else (30000, 10000)
+    s = theano.shared(np.zeros((rows, cols), dtype=fX))
+    fn = theano.function(
+        [],
+        updates=[(s, s + (T.inc_subtensor(s[1497], s[1497] ** 2) - s))])
+    return dict(fn=fn)
+
+
+# ################################## imports ##################################
+
+
+_IMPORT_CODE = """
+import time
+%s
+start = time.time()
+import %s
+print(time.time() - start)
+"""
+
+
+def _import_setup(module_name, preload, size):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = _IMPORT_CODE % ("\n".join("import %s" % m for m in preload),
+                           module_name)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [root] + [p for p in [env.get("PYTHONPATH")] if p])
+
+    def measure():
+        with open(os.devnull, "w") as devnull:
+            out = subprocess.check_output([sys.executable, "-c", code],
+                                          env=env,
+                                          stderr=devnull)
+        return float(out.decode("ascii").strip().split("\n")[-1])
+
+    return dict(measure=measure, extra=dict(preload=preload))
+
+
+# theano dominates the import time of treeano and canopy, and varies a lot
+# between runs, so it is imported before timing them
+for _module_name, _preload in [("theano", []),
+                               ("treeano", ["theano"]),
+                               ("treeano.nodes", ["theano"]),
+                               ("canopy", ["theano"])]:
+    register_benchmark(
+        "import/%s" % _module_name,
+        tags=("import",),
+        description="time for `import %s` in a new process%s"
+        % (_module_name,
+           " (after importing %s)" % ", ".join(_preload) if _preload else ""),
+    )(functools.partial(_import_setup, _module_name, _preload))
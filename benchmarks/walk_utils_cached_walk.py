@@ -26,3 +26,17 @@ def create_big_node_graph(levels):
 # cached_walk = True => 1.77s
 # cached_walk = False => 16.5s
 """
+
+"""
+20261019 results (after replacing the pickle based walk in
+canopy.node_utils.postwalk_node with a structural traversal over
+ChildrenContainer's):
+
+%timeit create_big_node_graph(5)
+# pickle walk (cached_walk = True) => 13.7ms
+# structural walk => 1.39ms
+
+%timeit create_big_node_graph(10)
+# pickle walk (cached_walk = True) => 534ms
+# structural walk => 47.2ms
+"""
@@ -1,11 +1,8 @@
-from . import handlers
-from . import network_utils
-from . import node_utils
-from . import schedules
-from . import serialization
-from . import transforms
-from . import templates
-from . import walk_utils
+"""
+submodules are imported lazily, on first access, to reduce import time
+"""
+
+from treeano.lazy_module import make_lazy
 
 # TODO rename fn_utils
 # ---
@@ -13,6 +10,19 @@ from . import walk_utils
 # don't really belong anywhere
 # import fn_utils
 
-
-from .fn_utils import evaluate_until
-from .handlers import handled_fn
+make_lazy(
+    __name__,
+    ["handlers",
+     "network_utils",
+     "node_utils",
+     "schedules",
+     "serialization",
+     "transforms",
+     "templates",
+     "walk_utils",
+     "fn_utils",
+     "frozen",
+     "activation_cache",
+     "memory"],
+    {"fn_utils": ["evaluate_until"],
+     "handlers": ["handled_fn"]})
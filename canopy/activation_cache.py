@@ -0,0 +1,166 @@
+"""
+caching the outputs of a frozen subtree of a network on disk, so that the
+rest of the network (eg. a classification head on top of a pretrained
+feature extractor) can be trained without recomputing the subtree every
+epoch
+
+usage:
+- activations = cached_activations(network, "features", ...)
+- head = head_network(network, "features")
+- train head with activations as the input for "features"
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import functools
+import hashlib
+import numbers
+import os
+
+import six
+import numpy as np
+import treeano
+
+from . import handlers
+from . import transforms
+
+
+def _stable_data(obj):
+    """
+    returns a version of obj (eg. the data of a node) whose repr is the same
+    across processes, since the reprs of functions and most objects (eg.
+    inits) include memory addresses
+    """
+    if obj is None or isinstance(obj, (bool,
+                                       numbers.Number,
+                                       six.string_types,
+                                       bytes)):
+        return obj
+    if isinstance(obj, dict):
+        return sorted(((_stable_data(k), _stable_data(v))
+                       for k, v in obj.items()),
+                      key=repr)
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__, [_stable_data(x) for x in obj])
+    if isinstance(obj, np.ndarray):
+        return ("ndarray",
+                obj.dtype.str,
+                obj.shape,
+                hashlib.sha1(np.ascontiguousarray(obj).data).hexdigest())
+    if isinstance(obj, functools.partial):
+        return ("partial",
+                _stable_data(obj.func),
+                _stable_data(obj.args),
+                _stable_data(obj.keywords or {}))
+    if hasattr(obj, "__module__") and hasattr(obj, "__name__"):
+        # functions and classes are identified by their qualified names
+        name = "%s.%s" % (obj.__module__,
+                          getattr(obj, "__qualname__", obj.__name__))
+        code = getattr(obj, "__code__", None)
+        if code is not None and "<" in name:
+            # lambdas and nested functions don't have unique names
+            return (name, hashlib.sha1(code.co_code).hexdigest())
+        return name
+    # other objects are identified by their class and attributes
+    return (_stable_data(type(obj)),
+            _stable_data(getattr(obj, "__dict__", {})))
+
+
+def subtree_hash(network, name):
+    """
+    returns a hash of the architecture and the values of the shared
+    variables of the subtree of the node with the given name
+
+    NOTE: hyperparameters set outside of the subtree aren't part of the hash
+    """
+    network.build()
+    rel_network = network[name]
+    h = hashlib.sha1()
+    node_data = treeano.core.node_to_data(network.graph.name_to_node[name])
+    h.update(repr(_stable_data(node_data)).encode("utf-8"))
+    for vw in sorted(rel_network.find_vws_in_subtree(is_shared=True),
+                     key=lambda vw: vw.name):
+        value = vw.value
+        h.update(vw.name.encode("utf-8"))
+        h.update(repr((value.dtype.str, value.shape)).encode("utf-8"))
+        h.update(np.ascontiguousarray(value).data)
+    return h.hexdigest()
+
+
+def cache_filename(network, name, cache_dir, dataset_id):
+    """
+    returns the file that the activations of the subtree for the dataset
+    are cached in
+    """
+    return os.path.join(cache_dir, "%s_%s_%s.npy" % (
+        dataset_id, name, subtree_hash(network, name)))
+
+
+def cached_activations(network,
+                       name,
+                       inputs,
+                       in_dict,
+                       cache_dir,
+                       dataset_id,
+                       batch_size=None):
+    """
+    returns the outputs of the node with the given name for a dataset (in
+    deterministic mode) as a read-only memory-mapped array, only computing
+    them if they aren't already cached
+
+    the cache is keyed by dataset_id and a hash of the subtree's
+    architecture and parameters, so changing the parameters of the subtree
+    causes the activations to be recomputed
+
+    inputs:
+    map from key in in_dict to the node (or variable) to give it to (same as
+    for handled_fn)
+
+    batch_size:
+    if given, the activations are computed (and written to disk) in batches
+    of this size, so that they don't need to fit in memory
+    """
+    filename = cache_filename(network, name, cache_dir, dataset_id)
+    if not os.path.exists(filename):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fn = handlers.handled_fn(
+            network,
+            [handlers.override_hyperparameters(deterministic=True)],
+            inputs,
+            {"out": name})
+        num_rows = len(in_dict[list(inputs)[0]])
+        if batch_size is None:
+            batch_size = num_rows
+        # write to a temporary file, so that an interrupted computation
+        # isn't used as the cache
+        tmp_filename = filename + ".tmp.npy"
+        out = None
+        # with no rows, the outputs of an empty batch still give the dtype
+        # and shape of the cache
+        starts = range(0, num_rows, batch_size) if num_rows > 0 else [0]
+        for start in starts:
+            batch_dict = {k: in_dict[k][start:start + batch_size]
+                          for k in inputs}
+            batch_out = fn(batch_dict)["out"]
+            if out is None:
+                out = np.lib.format.open_memmap(
+                    tmp_filename,
+                    mode="w+",
+                    dtype=batch_out.dtype,
+                    shape=(num_rows,) + batch_out.shape[1:])
+            out[start:start + len(batch_out)] = batch_out
+        out.flush()
+        del out
+        os.rename(tmp_filename, filename)
+    return np.load(filename, mmap_mode="r")
+
+
+def head_network(network, name, **kwargs):
+    """
+    returns the network with the subtree of the node with the given name
+    replaced by an input with the same name, to be given the cached
+    activations
+    """
+    return transforms.replace_with_input(network, name, **kwargs)
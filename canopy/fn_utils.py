@@ -1,9 +1,12 @@
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
+import threading
 import time
 import pprint
 
+import six
+
 
 # TODO move to handlers-specific module, since this assumes a handled_fn as
 # input
@@ -45,3 +48,38 @@ def evaluate_until(fn,
                 callback(res)
     except to_catch:
         print("Ending evaluate_until")
+
+
+def prefetch(gen, buffer_size=2):
+    """
+    returns a generator with the values of gen, that are computed in a
+    background thread while the previous values are used (eg. preparing
+    the next minibatch while a function is evaluated on the current one)
+
+    buffer_size:
+    maximum number of values computed ahead of time
+    """
+    q = six.moves.queue.Queue(maxsize=buffer_size)
+    done = object()
+
+    def worker():
+        try:
+            for value in gen:
+                q.put((value, None))
+        except Exception as e:
+            q.put((None, e))
+        else:
+            q.put((done, None))
+
+    thread = threading.Thread(target=worker)
+    # so that the thread doesn't keep the process alive if the values
+    # aren't all used
+    thread.daemon = True
+    thread.start()
+    while True:
+        value, exception = q.get()
+        if exception is not None:
+            raise exception
+        if value is done:
+            return
+        yield value
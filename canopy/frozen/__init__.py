@@ -0,0 +1,9 @@
+from . import numpy_executor
+from . import export
+
+from .numpy_executor import (FrozenExecutor,
+                             save,
+                             load)
+from .export import (UnsupportedNodeError,
+                     register_converter,
+                     export_network)
@@ -0,0 +1,333 @@
+"""
+exporting built networks into executors that only depend on numpy (see
+numpy_executor.py)
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import six
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+from treeano.nodes import composite
+from treeano.nodes import conv
+
+from .. import network_utils
+from .. import transforms
+from . import numpy_executor
+
+fX = theano.config.floatX
+
+CONVERTERS = {}
+
+
+class UnsupportedNodeError(ValueError):
+    pass
+
+
+def register_converter(node_str):
+    """
+    registers the decorated function as the converter for nodes registered
+    with the given name (see treeano.register_node)
+
+    converters take in an exporter, the relative network of the node and the
+    names of the node's inputs (in the order of its input keys), and add the
+    ops that compute the node's output to the exporter
+    """
+    def inner(fn):
+        # we want to allow overwriting (eg. if the file is refreshed)
+        # sometimes, but not accidentaly overwriting
+        if node_str in CONVERTERS:
+            assert fn.__name__ == CONVERTERS[node_str].__name__
+        CONVERTERS[node_str] = fn
+        return fn
+    return inner
+
+
+def _node_str(node):
+    return treeano.core.serialization_state.node_to_str(node.__class__)
+
+
+class Exporter(object):
+
+    """
+    state of exporting a single network
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.value_dict = network_utils.to_value_dict(network)
+        self.ops = []
+        self.arrays = {}
+
+    def array(self, vw):
+        """
+        returns the key of the value of a shared variable
+        """
+        key = vw.name
+        self.arrays[key] = self.value_dict[key]
+        return key
+
+    def derived_array(self, key, value):
+        """
+        adds an array computed from the values of shared variables
+        """
+        assert key not in self.arrays, key
+        self.arrays[key] = np.ascontiguousarray(value, dtype=fX)
+        return key
+
+    def add_op(self, op, inputs, output, params=None, arrays=None):
+        assert op in numpy_executor.OPS, op
+        self.ops.append(dict(
+            op=op,
+            inputs=list(inputs),
+            output=output,
+            params=params or {},
+            arrays=arrays or {},
+        ))
+
+
+def export_network(network, inputs, outputs):
+    """
+    returns a numpy_executor.FrozenExecutor computing the given outputs
+    (names of nodes, or tuples of node name and variable name) from the
+    inputs (names of InputNode's), with the current values of the network's
+    shared variables
+
+    the network should be in inference mode (eg. built with
+    deterministic=True), so that nodes like dropout don't do anything
+    """
+    network.build()
+    exporter = Exporter(network)
+    graph = network.graph
+    output_vars = [network.network_variable(o) for o in outputs]
+    output_node_names = [o if isinstance(o, six.string_types) else o[0]
+                         for o in outputs]
+    # only export the nodes needed to compute the outputs
+    needed = set(output_node_names)
+    for name in output_node_names:
+        needed |= graph.computation_ancestor_names(name)
+
+    # map from theano variable to the name of the value in the executor
+    var_names = {}
+    for node in graph.computation_graph_nodes_topological():
+        if node.name not in needed:
+            continue
+        rel_network = network[node.name]
+        var = rel_network.get_vw("default").variable
+        if var in var_names:
+            # the node passes through one of its inputs (eg. containers,
+            # or dropout in deterministic mode)
+            continue
+        if isinstance(node, tn.InputNode):
+            if node.name not in inputs:
+                raise ValueError("InputNode %s is needed, but not given as "
+                                 "an input" % node.name)
+            var_names[var] = node.name
+            continue
+        node_str = _node_str(node)
+        if node_str not in CONVERTERS:
+            raise UnsupportedNodeError(
+                "node %s (%s) is not supported by the numpy exporter - if it "
+                "doesn't do anything at inference time, make sure that the "
+                "network is built with deterministic=True"
+                % (node.name, node.__class__.__name__))
+        in_names = []
+        for input_key in node.get_input_keys(rel_network):
+            in_var = rel_network.get_input_vw(input_key).variable
+            if in_var not in var_names:
+                raise UnsupportedNodeError(
+                    "input %s of node %s is not computed by an exported node"
+                    % (input_key, node.name))
+            in_names.append(var_names[in_var])
+        CONVERTERS[node_str](exporter, rel_network, in_names)
+        var_names[var] = node.name
+
+    for output, var in zip(outputs, output_vars):
+        if var not in var_names:
+            raise UnsupportedNodeError("output %s is not computed by an "
+                                       "exported node" % (output,))
+    plan = dict(
+        inputs=list(inputs),
+        outputs=[var_names[var] for var in output_vars],
+        dtype=fX,
+        ops=exporter.ops,
+    )
+    return numpy_executor.FrozenExecutor(plan, exporter.arrays)
+
+
+# ################################ converters ################################
+
+
+@register_converter("linear_mapping")
+def _linear_mapping(exporter, network, in_names):
+    exporter.add_op(
+        "linear_mapping",
+        in_names,
+        network._name,
+        arrays=dict(weight=exporter.array(network.get_vw("weight"))))
+
+
+@register_converter("add_bias")
+def _add_bias(exporter, network, in_names):
+    exporter.add_op(
+        "add",
+        in_names,
+        network._name,
+        arrays=dict(value=exporter.array(network.get_vw("bias"))))
+
+
+@register_converter("apply")
+def _apply(exporter, network, in_names):
+    fn = network.find_hyperparameter(["fn"])
+    if fn is not composite._flatten_1d_or_2d:
+        raise UnsupportedNodeError("ApplyNode %s is only supported for the "
+                                   "flattening in DenseNode" % network._name)
+    # only called when the input has more than 2 dimensions, otherwise the
+    # output is the same variable as the input
+    exporter.add_op("flatten", in_names, network._name, params=dict(outdim=2))
+
+
+@register_converter("conv_2d")
+def _conv_2d(exporter, network, in_names):
+    filter_size = network.find_hyperparameter(["filter_size"])
+    stride = network.find_hyperparameter(["conv_stride", "stride"], (1, 1))
+    pad = network.find_hyperparameter(["conv_pad", "pad"], "valid")
+    pad = conv.conv_parse_pad(filter_size, pad)
+    W_vw = network.get_vw("weight")
+    W = exporter.value_dict[W_vw.name]
+    # theano's conv2d flips the filters
+    W = W[:, :, ::-1, ::-1].reshape(W.shape[0], -1)
+    exporter.add_op(
+        "conv_2d",
+        in_names,
+        network._name,
+        params=dict(filter_size=list(filter_size),
+                    stride=list(stride),
+                    pad=list(pad)),
+        arrays=dict(weight=exporter.derived_array(W_vw.name + "_flipped", W)))
+
+
+@register_converter("pool_2d")
+def _pool_2d(exporter, network, in_names):
+    pool_size = network.find_hyperparameter(["pool_size"])
+    stride = network.find_hyperparameter(["pool_stride", "stride"], None)
+    if stride is None:
+        stride = pool_size
+    exporter.add_op(
+        "pool_2d",
+        in_names,
+        network._name,
+        params=dict(
+            mode=network.find_hyperparameter(["mode"]),
+            pool_size=list(pool_size),
+            stride=list(stride),
+            pad=list(network.find_hyperparameter(["pool_pad", "pad"],
+                                                 (0, 0))),
+            ignore_border=network.find_hyperparameter(["ignore_border"],
+                                                      True)))
+
+
+@register_converter("global_pool_2d")
+def _global_pool_2d(exporter, network, in_names):
+    exporter.add_op("global_pool_2d",
+                    in_names,
+                    network._name,
+                    params=dict(mode=network.find_hyperparameter(["mode"])))
+
+
+def _activation_converter(activation, alpha_fn=None):
+    def _activation(exporter, network, in_names):
+        params = dict(activation=activation)
+        if alpha_fn is not None:
+            params["alpha"] = alpha_fn(network)
+        exporter.add_op("activation", in_names, network._name, params=params)
+    return _activation
+
+
+for _node_str_, _activation, _alpha_fn in [
+        ("relu", "relu", None),
+        ("leaky_relu", "leaky_relu",
+         lambda network: network.find_hyperparameter(["leak_alpha", "alpha"],
+                                                     0.01)),
+        ("very_leaky_relu", "leaky_relu",
+         lambda network: network.find_hyperparameter(["leak_alpha", "alpha"],
+                                                     1. / 3)),
+        ("tanh", "tanh", None),
+        ("scaled_tanh", "scaled_tanh", None),
+        ("sigmoid", "sigmoid", None),
+        ("softplus", "softplus", None),
+        ("resqrt", "resqrt", None),
+        ("abs", "abs", None),
+        ("elu", "elu",
+         lambda network: network.find_hyperparameter(["alpha"], 1.)),
+        ("hard_sigmoid", "hard_sigmoid", None),
+        ("hard_tanh", "hard_tanh", None),
+        ("trec", "trec",
+         lambda network: network.find_hyperparameter(["t"], 1))]:
+    register_converter(_node_str_)(
+        _activation_converter(_activation, _alpha_fn))
+
+
+def _softmax_converter(axis_fn):
+    def _softmax(exporter, network, in_names):
+        axis = axis_fn(network)
+        if isinstance(axis, int):
+            axis = [axis]
+        exporter.add_op("activation",
+                        in_names,
+                        network._name,
+                        params=dict(activation="softmax", axis=list(axis)))
+    return _softmax
+
+
+for _node_str_, _axis_fn in [
+        ("softmax", lambda network: 1),
+        ("stable_softmax",
+         lambda network: network.find_hyperparameter(["axis"], 1)),
+        ("spatial_softmax",
+         lambda network: range(2, network.get_input_vw("default").ndim))]:
+    register_converter(_node_str_)(_softmax_converter(_axis_fn))
+
+
+@register_converter("concatenate")
+def _concatenate(exporter, network, in_names):
+    axis = network.find_hyperparameter(
+        ["concatenate_axis", "axis"],
+        treeano.utils.nth_non_batch_axis(network, 0))
+    exporter.add_op("concatenate",
+                    in_names,
+                    network._name,
+                    params=dict(axis=axis))
+
+
+@register_converter("elementwise_sum")
+@register_converter("input_elementwise_sum")
+def _elementwise_sum(exporter, network, in_names):
+    if len(in_names) == 1:
+        exporter.add_op("add",
+                        in_names,
+                        network._name,
+                        arrays=dict(value=exporter.derived_array(
+                            network._name + ":zero", 0)))
+    else:
+        exporter.add_op("elementwise_sum", in_names, network._name)
+
+
+@register_converter("advanced_batch_normalization")
+def _batch_normalization(exporter, network, in_names):
+    if not network.find_hyperparameter(["bn_use_moving_stats"], False):
+        raise UnsupportedNodeError(
+            "batch normalization node %s uses minibatch statistics - only "
+            "inference-mode batch normalization (bn_use_moving_stats=True) "
+            "is supported" % network._name)
+    scale, shift = transforms.inference.batch_normalization_affine(network)
+    exporter.add_op(
+        "affine",
+        in_names,
+        network._name,
+        arrays=dict(
+            scale=exporter.derived_array(network._name + ":scale", scale),
+            shift=exporter.derived_array(network._name + ":shift", shift)))
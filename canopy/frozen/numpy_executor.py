@@ -0,0 +1,528 @@
+"""
+executor for frozen networks that only depends on numpy
+
+NOTE: this module must not import theano, treeano or anything from canopy,
+because it is copied into exported directories so that it can be used for
+serving without them:
+
+>>> import sys
+>>> sys.path.insert(0, dirname)
+>>> import numpy_executor
+>>> fn = numpy_executor.load(dirname)
+>>> outputs = fn(x)
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+PLAN_FILENAME = "plan.json"
+ARRAYS_FILENAME = "arrays.npz"
+MODULE_FILENAME = "numpy_executor.py"
+
+OPS = {}
+
+
+def register_op(name):
+    """
+    registers the decorated class as the implementation of the op with the
+    given name
+    """
+    def inner(cls):
+        # we want to allow overwriting (eg. if the file is refreshed)
+        # sometimes, but not accidentaly overwriting
+        if name in OPS:
+            assert cls.__name__ == OPS[name].__name__
+        OPS[name] = cls
+        return cls
+    return inner
+
+
+class Op(object):
+
+    """
+    base class for ops of the executor
+
+    ops are constructed with their json-serializable params and a dict of
+    arrays (eg. weights), and compute their output into a preallocated
+    buffer
+    """
+
+    def __init__(self, params, arrays):
+        self.params = params
+        self.arrays = arrays
+
+    def output_shape(self, *in_shapes):
+        """
+        by default, the output has the shape of the first input
+        """
+        return in_shapes[0]
+
+    def workspace(self, *in_shapes):
+        """
+        returns a dict from name to shape of temporary buffers needed to
+        compute the output, which are allocated along with the output
+        """
+        return {}
+
+    def prepare(self, in_shapes, buffers):
+        """
+        called once after buffers are allocated for the given input shapes,
+        for precomputing values that depend on the shapes
+        """
+
+    def compute(self, inputs, out, buffers):
+        raise NotImplementedError
+
+
+# ################################## linear ##################################
+
+
+@register_op("linear_mapping")
+class LinearMappingOp(Op):
+
+    def output_shape(self, in_shape):
+        return tuple(in_shape[:-1]) + (self.arrays["weight"].shape[1],)
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        W = self.arrays["weight"]
+        if x.ndim == 2:
+            np.dot(x, W, out=out)
+        else:
+            np.dot(x.reshape(-1, x.shape[-1]),
+                   W,
+                   out=out.reshape(-1, W.shape[1]))
+
+
+@register_op("add")
+class AddOp(Op):
+
+    """
+    adds an array (eg. a bias) to the input
+    """
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        np.add(x, self.arrays["value"], out=out)
+
+
+@register_op("affine")
+class AffineOp(Op):
+
+    """
+    multiplies the input by a scale and adds a shift (eg. batch
+    normalization with fixed statistics)
+    """
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        np.multiply(x, self.arrays["scale"], out=out)
+        out += self.arrays["shift"]
+
+
+@register_op("flatten")
+class FlattenOp(Op):
+
+    """
+    flattens all axes from params["outdim"] - 1 onwards
+    """
+
+    def output_shape(self, in_shape):
+        outdim = self.params["outdim"]
+        return (tuple(in_shape[:outdim - 1])
+                + (int(np.prod(in_shape[outdim - 1:])),))
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        np.copyto(out, x.reshape(out.shape))
+
+
+# ############################### convolution ###############################
+
+
+def conv_output_length(input_size, filter_size, stride, pad):
+    return (input_size + 2 * pad - filter_size) // stride + 1
+
+
+@register_op("conv_2d")
+class Conv2DOp(Op):
+
+    """
+    2D convolution (with flipped filters, like theano.tensor.nnet.conv2d)
+    implemented as a matrix multiplication of image patches
+
+    arrays["weight"] should already be flipped and reshaped to
+    (num_filters, num_channels * filter_height * filter_width)
+    """
+
+    def output_shape(self, in_shape):
+        n, _, h, w = in_shape
+        fh, fw = self.params["filter_size"]
+        sh, sw = self.params["stride"]
+        ph, pw = self.params["pad"]
+        return (n,
+                self.arrays["weight"].shape[0],
+                conv_output_length(h, fh, sh, ph),
+                conv_output_length(w, fw, sw, pw))
+
+    def workspace(self, in_shape):
+        n, c, h, w = in_shape
+        fh, fw = self.params["filter_size"]
+        ph, pw = self.params["pad"]
+        _, f, oh, ow = self.output_shape(in_shape)
+        workspace = dict(
+            patches=(n, oh, ow, c, fh, fw),
+            product=(n * oh * ow, f),
+        )
+        if ph or pw:
+            workspace["padded"] = (n, c, h + 2 * ph, w + 2 * pw)
+        return workspace
+
+    def prepare(self, in_shapes, buffers):
+        if "padded" in buffers:
+            # the border stays zero, only the center is overwritten
+            buffers["padded"][...] = 0
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        n, c, h, w = x.shape
+        fh, fw = self.params["filter_size"]
+        sh, sw = self.params["stride"]
+        ph, pw = self.params["pad"]
+        _, f, oh, ow = out.shape
+        if "padded" in buffers:
+            padded = buffers["padded"]
+            padded[:, :, ph:ph + h, pw:pw + w] = x
+            x = padded
+        # view of the patches with shape (n, oh, ow, c, fh, fw)
+        sn, sc, sy, sx = x.strides
+        patches_view = np.lib.stride_tricks.as_strided(
+            x,
+            shape=(n, oh, ow, c, fh, fw),
+            strides=(sn, sy * sh, sx * sw, sc, sy, sx))
+        patches = buffers["patches"]
+        np.copyto(patches, patches_view)
+        product = buffers["product"]
+        np.dot(patches.reshape(n * oh * ow, c * fh * fw),
+               self.arrays["weight"].T,
+               out=product)
+        np.copyto(out, product.reshape(n, oh, ow, f).transpose(0, 3, 1, 2))
+
+
+# ################################# pooling #################################
+
+
+def pool_output_length(input_size, pool_size, stride, pad, ignore_border):
+    """
+    same as treeano.nodes.downsample.pool_output_length
+    """
+    if ignore_border:
+        without_stride = input_size + 2 * pad - pool_size + 1
+        pre_max = (without_stride + stride - 1) // stride
+        return max(pre_max, 0)
+    else:
+        if stride >= pool_size:
+            return (input_size + stride - 1) // stride
+        else:
+            pre_max = (input_size - pool_size + stride - 1) // stride
+            return 1 + max(0, pre_max)
+
+
+@register_op("pool_2d")
+class Pool2DOp(Op):
+
+    """
+    2D pooling with the same semantics as theano's Pool op (including which
+    elements are counted for the average at the borders)
+    """
+
+    def output_shape(self, in_shape):
+        n, c, h, w = in_shape
+        ph, pw = self.params["pad"]
+        (sh, sw) = self.params["stride"]
+        (dh, dw) = self.params["pool_size"]
+        ignore_border = self.params["ignore_border"]
+        return (n,
+                c,
+                pool_output_length(h, dh, sh, ph, ignore_border),
+                pool_output_length(w, dw, sw, pw, ignore_border))
+
+    def _padded_size(self, in_shape):
+        _, _, h, w = in_shape
+        _, _, oh, ow = self.output_shape(in_shape)
+        ph, pw = self.params["pad"]
+        (sh, sw) = self.params["stride"]
+        (dh, dw) = self.params["pool_size"]
+        return (max(h + 2 * ph, (oh - 1) * sh + dh),
+                max(w + 2 * pw, (ow - 1) * sw + dw))
+
+    def workspace(self, in_shape):
+        n, c, _, _ = in_shape
+        return dict(padded=(n, c) + self._padded_size(in_shape))
+
+    def _windows(self, x, out_shape):
+        """
+        yields a strided view of x for each offset in the pooling window
+        """
+        _, _, oh, ow = out_shape
+        (sh, sw) = self.params["stride"]
+        (dh, dw) = self.params["pool_size"]
+        for i in range(dh):
+            for j in range(dw):
+                yield x[..., i:i + sh * (oh - 1) + 1:sh,
+                        j:j + sw * (ow - 1) + 1:sw]
+
+    def prepare(self, in_shapes, buffers):
+        in_shape, = in_shapes
+        _, _, h, w = in_shape
+        ph, pw = self.params["pad"]
+        mode = self.params["mode"]
+        padded = buffers["padded"]
+        # elements outside of the input are never part of the result
+        padded[...] = -np.inf if mode == "max" else 0
+        if mode in ("average_exc_pad", "average_inc_pad"):
+            # number of elements counted in each window
+            ph_, pw_ = self._padded_size(in_shape)
+            mask = np.zeros((ph_, pw_), dtype=padded.dtype)
+            if mode == "average_exc_pad":
+                mask[ph:ph + h, pw:pw + w] = 1
+            else:
+                mask[:h + 2 * ph, :w + 2 * pw] = 1
+            out_shape = self.output_shape(in_shape)
+            count = sum(self._windows(mask, out_shape))
+            self.inv_count = (1 / count).astype(padded.dtype)
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        _, _, h, w = x.shape
+        ph, pw = self.params["pad"]
+        mode = self.params["mode"]
+        padded = buffers["padded"]
+        padded[:, :, ph:ph + h, pw:pw + w] = x
+        windows = self._windows(padded, out.shape)
+        np.copyto(out, next(windows))
+        if mode == "max":
+            for window in windows:
+                np.maximum(out, window, out=out)
+        else:
+            for window in windows:
+                out += window
+            if mode != "sum":
+                out *= self.inv_count
+
+
+@register_op("global_pool_2d")
+class GlobalPool2DOp(Op):
+
+    def output_shape(self, in_shape):
+        return tuple(in_shape[:2])
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        mode = self.params["mode"]
+        if mode == "max":
+            np.max(x, axis=(2, 3), out=out)
+        elif mode == "sum":
+            np.sum(x, axis=(2, 3), out=out)
+        else:
+            np.mean(x, axis=(2, 3), out=out)
+
+
+# ############################### activations ###############################
+
+
+def _softmax(x, axis, out):
+    # numerically stable, like treeano.utils.stable_softmax
+    np.subtract(x, x.max(axis=axis, keepdims=True), out=out)
+    np.exp(out, out=out)
+    out /= out.sum(axis=axis, keepdims=True)
+
+
+@register_op("activation")
+class ActivationOp(Op):
+
+    """
+    elementwise activation function given by params["activation"]
+    """
+
+    def compute(self, inputs, out, buffers):
+        x, = inputs
+        activation = self.params["activation"]
+        alpha = self.params.get("alpha")
+        if activation == "relu":
+            np.maximum(x, 0, out=out)
+        elif activation == "leaky_relu":
+            # max(x, alpha * x) for alpha <= 1, otherwise min
+            np.multiply(x, alpha, out=out)
+            if alpha <= 1:
+                np.maximum(x, out, out=out)
+            else:
+                np.minimum(x, out, out=out)
+        elif activation == "tanh":
+            np.tanh(x, out=out)
+        elif activation == "scaled_tanh":
+            np.multiply(x, 2.0 / 3.0, out=out)
+            np.tanh(out, out=out)
+            out *= 1.7159
+        elif activation == "sigmoid":
+            # 1 / (1 + exp(-x))
+            np.negative(x, out=out)
+            np.exp(out, out=out)
+            out += 1
+            np.reciprocal(out, out=out)
+        elif activation == "softplus":
+            np.logaddexp(0, x, out=out)
+        elif activation == "resqrt":
+            np.maximum(x, 0, out=out)
+            out += 1
+            np.sqrt(out, out=out)
+            out -= 1
+        elif activation == "abs":
+            np.abs(x, out=out)
+        elif activation == "elu":
+            np.minimum(x, 0, out=out)
+            np.expm1(out, out=out)
+            out *= alpha
+            out += np.maximum(x, 0)
+        elif activation == "hard_sigmoid":
+            np.add(x, 0.5, out=out)
+            np.clip(out, 0, 1, out=out)
+        elif activation == "hard_tanh":
+            np.clip(x, -1, 1, out=out)
+        elif activation == "trec":
+            np.multiply(x, x > alpha, out=out)
+        elif activation == "softmax":
+            _softmax(x, tuple(self.params["axis"]), out)
+        else:
+            raise ValueError("unknown activation: %s" % activation)
+
+
+# ################################# combine #################################
+
+
+@register_op("concatenate")
+class ConcatenateOp(Op):
+
+    def output_shape(self, *in_shapes):
+        axis = self.params["axis"]
+        shape = list(in_shapes[0])
+        shape[axis] = sum(s[axis] for s in in_shapes)
+        return tuple(shape)
+
+    def compute(self, inputs, out, buffers):
+        axis = self.params["axis"]
+        idx = [slice(None)] * out.ndim
+        start = 0
+        for x in inputs:
+            idx[axis] = slice(start, start + x.shape[axis])
+            out[tuple(idx)] = x
+            start += x.shape[axis]
+
+
+@register_op("elementwise_sum")
+class ElementwiseSumOp(Op):
+
+    def output_shape(self, *in_shapes):
+        return tuple(np.broadcast(*[np.empty(s, dtype=bool)
+                                    for s in in_shapes]).shape)
+
+    def compute(self, inputs, out, buffers):
+        np.add(inputs[0], inputs[1], out=out)
+        for x in inputs[2:]:
+            out += x
+
+
+# ################################# executor #################################
+
+
+class FrozenExecutor(object):
+
+    """
+    executes a plan of ops with numpy
+
+    plan:
+    a json-serializable dict with:
+    - "inputs": names of the inputs
+    - "outputs": names of the outputs
+    - "dtype": dtype of the inputs and all intermediate values
+    - "ops": list of dicts with the "op" name, "inputs" (names), "output"
+      (name), json-serializable "params" and "arrays" (map from the name the
+      op uses to the key in arrays), in the order that they should be
+      computed
+
+    arrays:
+    map from key to numpy array (eg. the weights)
+
+    the outputs of ops are preallocated for the shapes of the inputs, and
+    reused as long as the input shapes stay the same
+    """
+
+    def __init__(self, plan, arrays):
+        self.plan = plan
+        self.arrays = arrays
+        self.dtype = np.dtype(plan["dtype"])
+        self.ops = []
+        for op_spec in plan["ops"]:
+            op_arrays = {name: np.asarray(arrays[key])
+                         for name, key in op_spec.get("arrays", {}).items()}
+            op = OPS[op_spec["op"]](op_spec.get("params", {}), op_arrays)
+            self.ops.append((op, op_spec["inputs"], op_spec["output"]))
+        self._in_shapes = None
+        self._buffers = None
+
+    def _allocate(self, in_shapes):
+        shapes = dict(zip(self.plan["inputs"], in_shapes))
+        buffers = {}
+        for op, input_names, output_name in self.ops:
+            op_in_shapes = [shapes[name] for name in input_names]
+            shape = tuple(op.output_shape(*op_in_shapes))
+            shapes[output_name] = shape
+            op_buffers = {name: np.empty(s, dtype=self.dtype)
+                          for name, s in op.workspace(*op_in_shapes).items()}
+            op.prepare(op_in_shapes, op_buffers)
+            buffers[output_name] = (np.empty(shape, dtype=self.dtype),
+                                    op_buffers)
+        self._in_shapes = in_shapes
+        self._buffers = buffers
+
+    def __call__(self, *inputs):
+        assert len(inputs) == len(self.plan["inputs"])
+        inputs = [np.ascontiguousarray(x, dtype=self.dtype) for x in inputs]
+        in_shapes = tuple(x.shape for x in inputs)
+        if in_shapes != self._in_shapes:
+            self._allocate(in_shapes)
+        env = dict(zip(self.plan["inputs"], inputs))
+        for op, input_names, output_name in self.ops:
+            out, op_buffers = self._buffers[output_name]
+            op.compute([env[name] for name in input_names], out, op_buffers)
+            env[output_name] = out
+        # copy the outputs, so that they aren't overwritten by the next call
+        return [np.array(env[name]) for name in self.plan["outputs"]]
+
+
+def save(executor, dirname):
+    """
+    saves the plan and arrays of an executor, along with a copy of this
+    module, into the given directory
+    """
+    if not os.path.isdir(dirname):
+        os.mkdir(dirname)
+    with open(os.path.join(dirname, PLAN_FILENAME), "w") as f:
+        json.dump(executor.plan, f, indent=2, sort_keys=True)
+    np.savez(os.path.join(dirname, ARRAYS_FILENAME), **executor.arrays)
+    source = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+    shutil.copyfile(source, os.path.join(dirname, MODULE_FILENAME))
+
+
+def load(dirname):
+    with open(os.path.join(dirname, PLAN_FILENAME)) as f:
+        plan = json.load(f)
+    with np.load(os.path.join(dirname, ARRAYS_FILENAME)) as f:
+        arrays = {k: f[k] for k in f.files}
+    return FrozenExecutor(plan, arrays)
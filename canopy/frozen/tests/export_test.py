@@ -0,0 +1,232 @@
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+from treeano.sandbox.nodes import batch_normalization as bn
+
+import canopy
+
+fX = theano.config.floatX
+
+
+def _randomize_params(network):
+    value_dict = canopy.network_utils.to_value_dict(network)
+    for k, v in value_dict.items():
+        value_dict[k] = np.random.randn(*v.shape).astype(fX)
+    canopy.network_utils.load_value_dict(network, value_dict)
+
+
+def _check_same_as_theano(root_node, shape, randomize=True):
+    network = root_node.network(
+        override_hyperparameters=dict(deterministic=True))
+    network.build()
+    if randomize:
+        _randomize_params(network)
+    nodes = network.graph.computation_graph_nodes_topological()
+    input_name = [node.name
+                  for node in nodes
+                  if isinstance(node, tn.InputNode)][0]
+    fn = network.function([input_name], [root_node.name])
+    frozen_fn = canopy.frozen.export_network(network,
+                                             [input_name],
+                                             [root_node.name])
+    for _ in range(2):
+        x = np.random.randn(*shape).astype(fX)
+        expected = fn(x)[0]
+        # float32 rounding errors scale with the magnitude of the outputs
+        np.testing.assert_allclose(expected,
+                                   frozen_fn(x)[0],
+                                   rtol=1e-4,
+                                   atol=1e-5 * max(1, np.abs(expected).max()))
+    return network, frozen_fn
+
+
+def test_mlp():
+    _check_same_as_theano(
+        tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(None, 5)),
+             tn.DenseNode("fc1", num_units=7),
+             tn.ReLUNode("r"),
+             tn.DropoutNode("do"),
+             tn.DenseNode("fc2", num_units=3),
+             tn.SoftmaxNode("sm")]),
+        (4, 5))
+
+
+def test_cnn():
+    for pad in ["valid", "full", "same", (1, 2)]:
+        for stride in [(1, 1), (2, 1)]:
+            _check_same_as_theano(
+                tn.SequentialNode(
+                    "s",
+                    [tn.InputNode("i", shape=(None, 2, 9, 8)),
+                     tn.Conv2DWithBiasNode("c",
+                                           num_filters=3,
+                                           filter_size=(3, 3),
+                                           conv_stride=stride,
+                                           conv_pad=pad),
+                     tn.DenseNode("fc", num_units=4)]),
+                (3, 2, 9, 8))
+
+
+def test_pool():
+    for mode in ["max", "sum", "average_exc_pad", "average_inc_pad"]:
+        for kwargs in [dict(pool_size=(2, 2)),
+                       dict(pool_size=(3, 2), stride=(1, 2)),
+                       dict(pool_size=(3, 3), pad=(1, 1)),
+                       dict(pool_size=(2, 3), ignore_border=False)]:
+            _check_same_as_theano(
+                tn.SequentialNode(
+                    "s",
+                    [tn.InputNode("i", shape=(None, 2, 7, 8)),
+                     tn.Pool2DNode("p", mode=mode, **kwargs)]),
+                (3, 2, 7, 8))
+        _check_same_as_theano(
+            tn.SequentialNode(
+                "s",
+                [tn.InputNode("i", shape=(None, 2, 7, 8)),
+                 tn.GlobalPool2DNode("p", mode=mode)]),
+            (3, 2, 7, 8))
+
+
+def test_activations():
+    for node in [tn.ReLUNode("a"),
+                 tn.LeakyReLUNode("a", leak_alpha=0.2),
+                 tn.VeryLeakyReLUNode("a"),
+                 tn.TanhNode("a"),
+                 tn.ScaledTanhNode("a"),
+                 tn.SigmoidNode("a"),
+                 tn.SoftplusNode("a"),
+                 tn.AbsNode("a"),
+                 tn.ELUNode("a", alpha=0.5),
+                 tn.activations.HardSigmoidNode("a"),
+                 tn.activations.HardTanhNode("a"),
+                 tn.activations.TRecNode("a", t=0.5),
+                 tn.StableSoftmaxNode("a", axis=2),
+                 tn.SpatialSoftmaxNode("a")]:
+        _check_same_as_theano(
+            tn.SequentialNode("s", [tn.InputNode("i", shape=(2, 3, 4, 5)),
+                                    node]),
+            (2, 3, 4, 5))
+    # resqrt isn't defined for negative inputs
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(2, 3)),
+         tn.AbsNode("abs"),
+         tn.ReSQRTNode("a")]).network()
+    fn = network.function(["i"], ["s"])
+    frozen_fn = canopy.frozen.export_network(network, ["i"], ["s"])
+    x = np.random.randn(2, 3).astype(fX)
+    np.testing.assert_allclose(fn(x)[0], frozen_fn(x)[0], rtol=1e-5)
+
+
+def test_concatenate_and_sum():
+    _check_same_as_theano(
+        tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(None, 5)),
+             tn.ElementwiseSumNode(
+                 "sum",
+                 [tn.ConcatenateNode(
+                     "concat",
+                     [tn.DenseNode("fc1", num_units=2),
+                      tn.DenseNode("fc2", num_units=3)]),
+                  tn.DenseNode("fc3", num_units=5)])]),
+        (4, 5))
+
+
+def test_batch_normalization():
+    for moving_var_type in ["log_var", "var", "inv_std"]:
+        root_node = tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(None, 3, 4, 5)),
+             bn.BatchNormalizationNode("bn",
+                                       moving_var_type=moving_var_type,
+                                       bn_use_moving_stats=True)])
+        network = root_node.network(
+            override_hyperparameters=dict(deterministic=True))
+        network.build()
+        value_dict = canopy.network_utils.to_value_dict(network)
+        for k, v in value_dict.items():
+            value_dict[k] = np.random.uniform(0.5, 1.5, v.shape).astype(fX)
+        canopy.network_utils.load_value_dict(network, value_dict)
+        _check_same_as_theano(root_node, (2, 3, 4, 5), randomize=False)
+
+
+def test_batch_normalization_training_mode():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 3)),
+         bn.BatchNormalizationNode("bn")]).network()
+    nt.assert_raises(canopy.frozen.UnsupportedNodeError,
+                     canopy.frozen.export_network,
+                     network,
+                     ["i"],
+                     ["s"])
+
+
+def test_unsupported_node():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 3)),
+         tn.DropoutNode("do", p=0.5)]).network()
+    nt.assert_raises(canopy.frozen.UnsupportedNodeError,
+                     canopy.frozen.export_network,
+                     network,
+                     ["i"],
+                     ["s"])
+
+
+def test_only_needed_nodes():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 3)),
+         tn.DenseNode("fc1", num_units=4),
+         tn.DropoutNode("do"),
+         tn.DenseNode("fc2", num_units=2)]).network()
+    frozen_fn = canopy.frozen.export_network(network, ["i"], ["fc1"])
+    fn = network.function(["i"], ["fc1"])
+    x = np.random.randn(5, 3).astype(fX)
+    np.testing.assert_allclose(fn(x)[0], frozen_fn(x)[0], rtol=1e-5)
+
+
+def test_save_load():
+    network, frozen_fn = _check_same_as_theano(
+        tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(None, 2, 6, 6)),
+             tn.Conv2DWithBiasNode("c", num_filters=3, filter_size=(3, 3)),
+             tn.MaxPool2DNode("p", pool_size=(2, 2)),
+             tn.DenseNode("fc", num_units=4)]),
+        (3, 2, 6, 6))
+    x = np.random.randn(3, 2, 6, 6).astype(fX)
+    dirname = tempfile.mkdtemp()
+    try:
+        canopy.frozen.save(frozen_fn, dirname)
+        np.testing.assert_equal(frozen_fn(x)[0],
+                                canopy.frozen.load(dirname)(x)[0])
+        # the saved directory can be used with only numpy
+        np.save(dirname + "/x.npy", x)
+        code = "\n".join([
+            "import sys",
+            "sys.path.insert(0, %r)" % dirname,
+            "import numpy as np",
+            "import numpy_executor",
+            "fn = numpy_executor.load(%r)" % dirname,
+            "np.save(%r, fn(np.load(%r))[0])" % (dirname + "/y.npy",
+                                                  dirname + "/x.npy"),
+            "assert 'theano' not in sys.modules",
+        ])
+        subprocess.check_call([sys.executable, "-c", code])
+        np.testing.assert_equal(frozen_fn(x)[0],
+                                np.load(dirname + "/y.npy"))
+    finally:
+        shutil.rmtree(dirname)
@@ -1,34 +1,47 @@
-from . import base
-from . import conditional
-from . import nodes
-from . import batch
-from . import fn
-from . import monitor
-from . import debug
+"""
+handler modules are imported lazily, on first access of either the module or
+one of the names exported from it (eg. canopy.handlers.split_input), to reduce
+import time
+"""
 
-from .base import (NetworkHandlerAPI,
-                   NetworkHandlerImpl)
-from .fn import (handled_fn)
-from .conditional import (call_after_every)
-from .nodes import (remove_nodes_with_class,
-                    with_hyperparameters,
-                    override_hyperparameters,
-                    update_hyperparameters,
-                    schedule_hyperparameter,
-                    use_scheduled_hyperparameter)
-from .batch import (split_input,
-                    chunk_variables,
-                    batch_pad)
-from .monitor import (time_call,
-                      time_per_row,
-                      evaluate_monitoring_variables,
-                      monitor_network_state,
-                      monitor_variable,
-                      monitor_shared_in_subtree)
-from .misc import (callback_with_input,
-                   exponential_polyak_averaging)
-from .debug import (output_nanguard,
-                    network_nanguard,
-                    nanguardmode,
-                    save_last_inputs_and_networks,
-                    make_updates_synchronous)
+from treeano.lazy_module import make_lazy
+
+make_lazy(
+    __name__,
+    ["base",
+     "conditional",
+     "nodes",
+     "batch",
+     "fn",
+     "monitor",
+     "debug",
+     "misc"],
+    dict(
+        base=("NetworkHandlerAPI",
+              "NetworkHandlerImpl"),
+        fn=("handled_fn",),
+        conditional=("call_after_every",),
+        nodes=("remove_nodes_with_class",
+               "with_hyperparameters",
+               "override_hyperparameters",
+               "update_hyperparameters",
+               "schedule_hyperparameter",
+               "use_scheduled_hyperparameter"),
+        batch=("split_input",
+               "chunk_variables",
+               "batch_pad",
+               "monte_carlo_samples"),
+        monitor=("time_call",
+                 "time_per_row",
+                 "evaluate_monitoring_variables",
+                 "monitor_network_state",
+                 "monitor_variable",
+                 "monitor_shared_in_subtree"),
+        misc=("callback_with_input",
+              "exponential_polyak_averaging"),
+        debug=("output_nanguard",
+               "network_nanguard",
+               "nanguardmode",
+               "save_last_inputs_and_networks",
+               "make_updates_synchronous"),
+    ))
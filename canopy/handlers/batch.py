@@ -2,7 +2,9 @@ from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
 
+import six
 import numpy as np
+import scipy.sparse
 import theano
 import theano.tensor as T
 import treeano
@@ -28,6 +30,23 @@ def datamap_batch_merge(datamaps, scalar_merge="mean"):
     return res
 
 
+def _num_rows(value):
+    # len is ambiguous for scipy.sparse matrices
+    if scipy.sparse.issparse(value):
+        return value.shape[0]
+    return len(value)
+
+
+def _empty_value(shared):
+    """
+    returns an empty value for a shared variable (dense or sparse)
+    """
+    if treeano.utils.is_sparse_variable(shared):
+        return scipy.sparse.csr_matrix((0, 0), dtype=shared.dtype).asformat(
+            shared.format)
+    return np.zeros([0] * shared.ndim, dtype=shared.dtype)
+
+
 class SplitInput(base.NetworkHandlerImpl):
 
     """
@@ -36,6 +55,9 @@ class SplitInput(base.NetworkHandlerImpl):
 
     Size of input must be a mulitple of split_size.
 
+    Inputs can be scipy.sparse matrices (eg. for SparseInputNode), which are
+    split along their rows.
+
     scalar_merge:
     how scalar outputs should be merged together
 
@@ -54,9 +76,9 @@ class SplitInput(base.NetworkHandlerImpl):
         for input_key in self.keys:
             input_val = in_dict[input_key]
             if input_size is None:
-                input_size = len(input_val)
+                input_size = _num_rows(input_val)
             else:
-                assert len(input_val) == input_size
+                assert _num_rows(input_val) == input_size
         assert input_size is not None
         results = []
         # optimization to prevent copying and simply pass computation through
@@ -92,6 +114,9 @@ class ChunkVariables(base.NetworkHandlerImpl):
     use case: datasets that fit in memory can be much more efficient because
     we don't need to send it to the GPU repeatedly
     TODO implement
+
+    sparse input variables (from SparseInputNode) are stored in sparse
+    shared variables, and given scipy.sparse matrices
     """
 
     BATCH_IDX_KEY = "batch_idx"
@@ -134,10 +159,15 @@ class ChunkVariables(base.NetworkHandlerImpl):
                 new_inputs.pop(input_key)
                 # create shared variable
                 v = state.network.network_variable(input_var)
-                shared_var = treeano.utils.shared_empty(
-                    ndim=v.ndim,
-                    dtype=v.dtype,
-                )
+                if treeano.utils.is_sparse_variable(v):
+                    shared_var = theano.shared(
+                        scipy.sparse.csr_matrix((1, 1), dtype=v.dtype
+                                                ).asformat(v.format))
+                else:
+                    shared_var = treeano.utils.shared_empty(
+                        ndim=v.ndim,
+                        dtype=v.dtype,
+                    )
                 # create givens for variable
                 idx_slice = slice(self.idx_var_ * self.batch_size,
                                   (self.idx_var_ + 1) * self.batch_size)
@@ -159,9 +189,9 @@ class ChunkVariables(base.NetworkHandlerImpl):
             for input_key, shared in self.key_to_shared_.items():
                 input_val = in_dict.pop(input_key)
                 if chunk_size is None:
-                    chunk_size = len(input_val)
+                    chunk_size = _num_rows(input_val)
                 else:
-                    assert len(input_val) == chunk_size
+                    assert _num_rows(input_val) == chunk_size
                 if self.strict_size:
                     # error if chunk size not a multiple of batch size
                     assert (chunk_size % self.batch_size) == 0
@@ -180,8 +210,7 @@ class ChunkVariables(base.NetworkHandlerImpl):
         # may be inefficient if not necessary
         with state.time("data_free"):
             for shared in self.key_to_shared_.values():
-                shared.set_value(np.zeros([0] * shared.ndim,
-                                          dtype=shared.dtype))
+                shared.set_value(_empty_value(shared))
         return res
 
 chunk_variables = ChunkVariables
@@ -213,11 +242,126 @@ class BatchPad(base.NetworkHandlerImpl):
             return np.concatenate([arr, to_pad], axis=self.axis)
 
     def call(self, fn, in_dict, *args, **kwargs):
-        # make a copy, since we are mutating it
-        in_dict = dict(in_dict)
+        padded = {}
         for key in self.keys:
-            in_dict[key] = self._pad(in_dict[key])
+            arr = in_dict[key]
+            if arr.shape[self.axis] % self.batch_size != 0:
+                padded[key] = self._pad(arr)
+        if padded:
+            # make a copy, since we are mutating it
+            in_dict = dict(in_dict)
+            in_dict.update(padded)
 
         return fn(in_dict, *args, **kwargs)
 
 batch_pad = BatchPad
+
+
+def _has_batch_axis(network, query):
+    """
+    whether an output (as given to network.network_variable) has an
+    unknown size along axis 0, ie. a batch axis
+    """
+    if isinstance(query, six.string_types):
+        query = (query, "default")
+    if not isinstance(query, tuple):
+        # theano variables don't have a known shape
+        return False
+    node_name, from_key = query
+    shape = network[node_name].get_vw(from_key).shape
+    return len(shape) > 0 and shape[0] is None
+
+
+class MonteCarloSamples(base.NetworkHandlerImpl):
+
+    """
+    evaluates a stochastic network (eg. with dropout and deterministic=False)
+    num_samples times on each input in a single call, by repeating the
+    inputs along the batch axis within the graph (so that each repetition
+    gets independent noise), and returns the mean and variance of the
+    outputs over the samples
+
+    for each output key with a batch axis, returns:
+    - key: mean over samples
+    - key + "_variance": variance over samples
+    - key + "_samples": all of the samples, with the samples along axis 1
+      (only if return_samples is True)
+    scalar outputs are computed over all of the samples
+
+    NOTE: the batch axis of the inputs must not have a fixed size in the
+    network
+
+    NOTE: to bound memory use, split_input can be used as an outer handler
+    (in which case num_samples * split_size examples are computed at once)
+
+    keys:
+    keys of the inputs to repeat
+
+    output_keys:
+    keys of the outputs to compute statistics over (defaults to all outputs
+    of nodes whose variable wrappers have an unknown size along axis 0,
+    which excludes eg. parameters and outputs given as theano variables)
+    """
+
+    def __init__(self,
+                 num_samples,
+                 keys,
+                 output_keys=None,
+                 return_samples=False):
+        assert num_samples >= 1
+        self.num_samples = num_samples
+        self.keys = keys
+        self.output_keys = output_keys
+        self.return_samples = return_samples
+
+    def transform_compile_function_kwargs(self, state, **kwargs):
+        inputs = kwargs["inputs"]
+        outputs = kwargs["outputs"]
+        givens = kwargs.get("givens")
+        assert isinstance(inputs, dict)
+        assert isinstance(outputs, dict)
+
+        if givens is None:
+            new_givens = []
+        elif isinstance(givens, dict):
+            new_givens = list(givens.items())
+        elif isinstance(givens, (list, tuple)):
+            new_givens = list(givens)
+
+        batch_size = None
+        new_inputs = dict(inputs)
+        for key in self.keys:
+            input_var = state.network.network_variable(inputs[key])
+            # replace the input with a new variable that is repeated
+            new_var = input_var.type(input_var.name)
+            new_inputs[key] = new_var
+            reps = [self.num_samples] + [1] * (new_var.ndim - 1)
+            new_givens.append((input_var, T.tile(new_var, reps)))
+            if batch_size is None:
+                batch_size = new_var.shape[0]
+
+        output_keys = self.output_keys
+        if output_keys is None:
+            output_keys = [k for k, v in outputs.items()
+                           if _has_batch_axis(state.network, v)]
+        new_outputs = dict(outputs)
+        for key in output_keys:
+            output_var = state.network.network_variable(outputs[key])
+            samples = output_var.reshape(
+                ([self.num_samples, batch_size]
+                 + [output_var.shape[axis]
+                    for axis in range(1, output_var.ndim)]),
+                ndim=output_var.ndim + 1)
+            new_outputs[key] = samples.mean(axis=0)
+            new_outputs[key + "_variance"] = samples.var(axis=0)
+            if self.return_samples:
+                # batch axis first, so that results can be concatenated
+                # (eg. by split_input)
+                new_outputs[key + "_samples"] = samples.swapaxes(0, 1)
+
+        kwargs["inputs"] = new_inputs
+        kwargs["outputs"] = new_outputs
+        kwargs["givens"] = new_givens
+        return kwargs
+
+monte_carlo_samples = MonteCarloSamples
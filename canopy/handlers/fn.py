@@ -74,8 +74,27 @@ class _HandledFunction(object):
                                      inputs=inputs,
                                      outputs=outputs,
                                      **kwargs)
+        # the handlers that do something on each call, followed by the
+        # calls of call_with_dict, return_dict and the final handler
+        self._call = base.call_plan(self.state,
+                                    handlers,
+                                    self._call_with_dict)
+
+    def _call_with_dict(self, in_dict, **kwargs):
+        """
+        same as calling call_with_dict, return_dict and the final handler,
+        reading the orders of the keys on every call (since they can
+        change when rebuilding)
+        """
+        call_with_dict, return_dict, _ = self.handlers[-3:]
+        assert isinstance(in_dict, dict)
+        res = self.state.call(
+            *[in_dict[k] for k in call_with_dict.input_key_order_],
+            **kwargs)
+        assert len(res) == len(return_dict.output_key_order_)
+        return dict(zip(return_dict.output_key_order_, res))
 
     def __call__(self, *args, **kwargs):
-        return self.outermost(self.state, *args, **kwargs)
+        return self._call(*args, **kwargs)
 
 handled_fn = _HandledFunction
@@ -1,5 +1,6 @@
 import nose.tools as nt
 import numpy as np
+import scipy.sparse
 import theano
 import theano.tensor as T
 
@@ -61,6 +62,29 @@ def test_chunk_variables():
                             np.ones((18, 2), dtype=fX) * 3)
 
 
+def test_split_input_and_chunk_variables_sparse():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.SparseInputNode("i", shape=(None, 20)),
+         tn.DenseNode("d",
+                      num_units=3,
+                      inits=[treeano.inits.NormalWeightInit()])]
+    ).network()
+    x = scipy.sparse.random(18, 20, density=0.1, format="csr", dtype=fX)
+    fn1 = canopy.handlers.handled_fn(network,
+                                     [],
+                                     {"x": "i"},
+                                     {"out": "seq"})
+    ans = fn1({"x": x})["out"]
+    for handler in [canopy.handlers.split_input(4, ["x"]),
+                    canopy.handlers.chunk_variables(3, ["i"])]:
+        fn2 = canopy.handlers.handled_fn(network,
+                                         [handler],
+                                         {"x": "i"},
+                                         {"out": "seq"})
+        np.testing.assert_allclose(ans, fn2({"x": x})["out"], rtol=1e-5)
+
+
 def test_batch_pad():
 
     def tmp(include_batch_pad):
@@ -84,3 +108,60 @@ def test_batch_pad():
     res = tmp(True)
 
     np.testing.assert_equal(res["out"], np.ones((18, 2), dtype=fX) * 3)
+
+
+def test_monte_carlo_samples():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 1000)),
+         tn.DropoutNode("do", p=0.5)]
+    ).network()
+    x = np.ones((3, 1000), dtype=fX)
+    for split in [False, True]:
+        handlers = [canopy.handlers.monte_carlo_samples(8,
+                                                        ["x"],
+                                                        return_samples=True)]
+        if split:
+            handlers.insert(0, canopy.handlers.split_input(2, ["x"]))
+        fn = canopy.handlers.handled_fn(network,
+                                        handlers,
+                                        {"x": "i"},
+                                        {"out": "seq"})
+        res = fn({"x": x})
+        nt.assert_equal((3, 1000), res["out"].shape)
+        nt.assert_equal((3, 1000), res["out_variance"].shape)
+        samples = res["out_samples"]
+        nt.assert_equal((3, 8, 1000), samples.shape)
+        np.testing.assert_allclose(samples.mean(axis=1), res["out"],
+                                   rtol=1e-5)
+        np.testing.assert_allclose(samples.var(axis=1), res["out_variance"],
+                                   rtol=1e-4, atol=1e-5)
+        # dropout with p=0.5 rescales by 2, so each sample is 0 or 2
+        nt.assert_equal({0, 2}, set(np.unique(samples)))
+        # each sample has an independent mask
+        for i in range(7):
+            nt.assert_false(np.all(samples[:, i] == samples[:, i + 1]))
+        # mean 1 and variance 1 (times 7 / 8, since the variance is biased)
+        np.testing.assert_allclose(1, res["out"].mean(), atol=0.05)
+        np.testing.assert_allclose(7. / 8, res["out_variance"].mean(),
+                                   atol=0.05)
+
+
+def test_monte_carlo_samples_default_output_keys():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 3)),
+         tn.DenseNode("fc", num_units=2),
+         tn.DropoutNode("do", p=0.5)]
+    ).network()
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.monte_carlo_samples(4, ["x"])],
+        {"x": "i"},
+        {"out": "seq", "W": ("fc_linear", "weight")})
+    res = fn({"x": np.ones((5, 3), dtype=fX)})
+    nt.assert_equal((5, 2), res["out"].shape)
+    nt.assert_in("out_variance", res)
+    # parameters don't have a batch axis, so they are returned as is
+    nt.assert_equal((3, 2), res["W"].shape)
+    nt.assert_not_in("W_variance", res)
@@ -123,3 +123,66 @@ def test_build_handler3():
                                     {"out": "ac"})
     x = np.array(3, dtype=fX)
     np.testing.assert_equal(x + 42, fn({"x": x})["out"])
+
+
+def test_call_plan():
+    class network_identity(canopy.handlers.NetworkHandlerImpl):
+
+        def transform_network(self, network):
+            return network
+
+    class plus_n(canopy.handlers.NetworkHandlerImpl):
+
+        def __init__(self, n):
+            self.n = n
+
+        def call(self, fn, *args, **kwargs):
+            res = fn(*args, **kwargs)
+            res["out"] += self.n
+            return res
+
+    def final_fn(in_dict):
+        return {"out": in_dict["x"]}
+
+    # handlers that don't do anything on a call are skipped
+    nt.assert_is(final_fn,
+                 canopy.handlers.base.call_plan(None,
+                                                [network_identity()],
+                                                final_fn))
+    fn = canopy.handlers.base.call_plan(None,
+                                        [plus_n(1),
+                                         network_identity(),
+                                         plus_n(2)],
+                                        final_fn)
+    nt.assert_equal(4, fn({"x": 1})["out"])
+
+
+def test_handled_fn_call_and_rebuild():
+    class plus_n(canopy.handlers.NetworkHandlerImpl):
+
+        def __init__(self, n):
+            self.n = n
+
+        def __call__(self, state, *args, **kwargs):
+            res = self._inner_handler(state, *args, **kwargs)
+            res["out"] += self.n
+            return res
+
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=()),
+         tn.AddConstantNode("ac", value=2)]
+    ).network()
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.override_hyperparameters(value=3),
+         plus_n(10),
+         canopy.handlers.time_call()],
+        {"x": "i"},
+        {"out": "seq"})
+    x = np.array(3, dtype=fX)
+    res = fn({"x": x})
+    np.testing.assert_equal(x + 3 + 10, res["out"])
+    nt.assert_in("time", res)
+    fn.outermost.rebuild(fn.state)
+    np.testing.assert_equal(x + 3 + 10, fn({"x": x})["out"])
@@ -0,0 +1,274 @@
+"""
+static estimates of the memory used by a network, from the shapes of its
+variable wrappers, and choosing the largest batch size (eg. the split_size
+of handlers.split_input, or the batch_size of handlers.chunk_variables)
+that fits in a memory budget
+
+eg.
+  batch_size = canopy.memory.choose_batch_size(network,
+                                               memory_budget=2 * 1024 ** 3,
+                                               max_batch_size=4096,
+                                               include_updates=True)
+  print(canopy.memory.format_memory_report(
+      canopy.memory.memory_report(network, batch_size, include_updates=True)))
+
+the estimates assume that:
+- an unknown size along axis 0 is the batch size
+- variables that are views of other variables (eg. reshapes and
+  dimshuffles) don't use memory
+- while computing outputs, a variable is freed after the last node taking
+  it as an input (like theano with allow_gc)
+- while training, every variable is kept for the backward pass, which also
+  needs a gradient for each parameter and the gradients of the input and
+  output of a node at a time
+
+sparse variables (eg. from SparseInputNode) aren't counted, since their
+sizes depend on the data
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import collections
+
+import numpy as np
+import scipy.sparse
+import treeano
+
+
+class _Variable(object):
+
+    """
+    memory of a variable as a function of the batch size
+    """
+
+    def __init__(self, node_name, fixed, per_example, created, last_used):
+        self.node_name = node_name
+        self.fixed = fixed
+        self.per_example = per_example
+        self.created = created
+        self.last_used = last_used
+
+    def bytes(self, batch_size):
+        return self.fixed + self.per_example * batch_size
+
+
+def _shared_bytes(shared):
+    value = shared.get_value(borrow=True)
+    if scipy.sparse.issparse(value):
+        return sum(getattr(value, attr).nbytes
+                   for attr in ("data", "indices", "indptr")
+                   if hasattr(value, attr))
+    return value.nbytes
+
+
+def _is_view(variable):
+    owner = variable.owner
+    return owner is not None and bool(getattr(owner.op, "view_map", None))
+
+
+def _activation(vw, unknown_size):
+    """
+    returns (fixed, per_example) bytes of a non-shared variable wrapper
+    """
+    itemsize = np.dtype(vw.dtype).itemsize
+    shape = list(vw.shape)
+    batch_dependent = len(shape) > 0 and shape[0] is None
+    if batch_dependent:
+        shape[0] = 1
+    if None in shape:
+        if unknown_size is None:
+            raise ValueError("variable %s has unknown sizes along axes "
+                             "other than the batch axis (shape %s), "
+                             "unknown_size must be given"
+                             % (vw.name, vw.shape))
+        shape = [unknown_size if s is None else s for s in shape]
+    size = int(np.prod(shape)) * itemsize
+    if batch_dependent:
+        return 0, size
+    return size, 0
+
+
+def _analyze(network, include_updates, unknown_size):
+    """
+    returns (node names in computation order, map from node name to
+    (parameter bytes, state bytes), list of _Variable's for the
+    activations)
+    """
+    network.build()
+    order = [node.name
+             for node in network.graph.computation_graph_nodes_topological()]
+    # outputs of lazy networks are only computed when needed
+    network.compute_outputs_for(order)
+    if include_updates:
+        # updates nodes create their state (eg. moment estimates) when
+        # computing the update deltas
+        network.update_deltas
+    idxs = {name: idx for idx, name in enumerate(order)}
+    shared = {}
+    # the same theano variable can be in several variable wrappers (eg. of
+    # a node and its parent), so it is attributed to the first node that
+    # computes it
+    created = collections.OrderedDict()
+    last_used = {}
+    for name in order:
+        node_state = network.node_state[name]
+        parameter_bytes = state_bytes = 0
+        for vw in node_state["current_variables"].values():
+            variable = vw.variable
+            if vw.is_shared:
+                if variable in created:
+                    continue
+                created[variable] = None
+                if "parameter" in vw.tags:
+                    parameter_bytes += _shared_bytes(variable)
+                else:
+                    state_bytes += _shared_bytes(variable)
+            elif variable not in created:
+                created[variable] = (name, vw)
+        shared[name] = (parameter_bytes, state_bytes)
+        for in_vw in node_state.get("inputs", {}).values():
+            last_used[in_vw.variable] = idxs[name]
+
+    activations = []
+    for variable, created_by in created.items():
+        if created_by is None:
+            # shared variable
+            continue
+        name, vw = created_by
+        if (treeano.utils.is_sparse_variable(variable)
+                or _is_view(variable)):
+            continue
+        fixed, per_example = _activation(vw, unknown_size)
+        activations.append(_Variable(
+            node_name=name,
+            fixed=fixed,
+            per_example=per_example,
+            created=idxs[name],
+            last_used=max(idxs[name], last_used.get(variable, -1))))
+    return order, shared, activations
+
+
+def _peak_activations(activations, num_nodes, batch_size):
+    # memory in use while computing each node
+    live = np.zeros(num_nodes + 1, dtype=np.int64)
+    for v in activations:
+        live[v.created] += v.bytes(batch_size)
+        live[v.last_used + 1] -= v.bytes(batch_size)
+    return int(np.cumsum(live).max()) if num_nodes else 0
+
+
+def _peak(analysis, batch_size, include_updates):
+    order, shared, activations = analysis
+    parameters = sum(p for p, _ in shared.values())
+    states = sum(s for _, s in shared.values())
+    if include_updates:
+        activation_bytes = [v.bytes(batch_size) for v in activations]
+        gradients = parameters + 2 * max(activation_bytes + [0])
+        return parameters + states + sum(activation_bytes) + gradients
+    return (parameters
+            + states
+            + _peak_activations(activations, len(order), batch_size))
+
+
+def memory_report(network,
+                  batch_size,
+                  include_updates=False,
+                  unknown_size=None):
+    """
+    returns the estimated memory (in bytes) of each node for the given
+    batch size, as a dict with:
+    - nodes: ordered map from node name (in computation order) to a dict
+      with the bytes of its "parameters", "state" (shared variables that
+      aren't parameters, eg. of updates), "activations" and "gradients"
+      (of its parameters, if include_updates)
+    - parameters, state, activations, gradients: totals over the nodes
+    - peak: estimated peak memory of a call of a function of the network
+
+    include_updates:
+    whether to estimate the memory of training (ie. of a function with
+    include_updates=True), including the backward pass
+
+    unknown_size:
+    size to use for unknown sizes along axes other than the batch axis (eg.
+    sequence lengths)
+    """
+    analysis = _analyze(network, include_updates, unknown_size)
+    order, shared, activations = analysis
+    nodes = collections.OrderedDict()
+    for name in order:
+        parameter_bytes, state_bytes = shared[name]
+        nodes[name] = dict(
+            parameters=parameter_bytes,
+            state=state_bytes,
+            activations=0,
+            gradients=parameter_bytes if include_updates else 0,
+        )
+    for v in activations:
+        nodes[v.node_name]["activations"] += v.bytes(batch_size)
+    res = dict(
+        batch_size=batch_size,
+        include_updates=include_updates,
+        nodes=nodes,
+        peak=_peak(analysis, batch_size, include_updates),
+    )
+    for key in ["parameters", "state", "activations", "gradients"]:
+        res[key] = sum(node[key] for node in nodes.values())
+    return res
+
+
+def choose_batch_size(network,
+                      memory_budget,
+                      max_batch_size,
+                      include_updates=False,
+                      multiple_of=1,
+                      unknown_size=None):
+    """
+    returns the largest batch size (a multiple of multiple_of, up to
+    max_batch_size) whose estimated peak memory (see memory_report) is at
+    most memory_budget bytes
+    """
+    analysis = _analyze(network, include_updates, unknown_size)
+
+    def fits(batch_size):
+        return _peak(analysis, batch_size, include_updates) <= memory_budget
+
+    # binary search on the number of multiples, since the peak memory
+    # increases with the batch size
+    low, high = 0, max_batch_size // multiple_of
+    while low < high:
+        mid = (low + high + 1) // 2
+        if fits(mid * multiple_of):
+            low = mid
+        else:
+            high = mid - 1
+    if low == 0:
+        raise ValueError(
+            "a batch size of %d doesn't fit in the memory budget (%d bytes "
+            "estimated, %d bytes budget)"
+            % (multiple_of,
+               _peak(analysis, multiple_of, include_updates),
+               memory_budget))
+    return low * multiple_of
+
+
+def format_memory_report(report, min_bytes=0):
+    """
+    returns a table of the memory of each node in a report (see
+    memory_report) in MB, leaving out nodes without memory or with less
+    than min_bytes
+    """
+    columns = ["parameters", "state", "activations", "gradients"]
+
+    def mb(num_bytes):
+        return "%.3f" % (num_bytes / 2 ** 20)
+
+    lines = ["\t".join(["node"] + columns)]
+    for name, node in report["nodes"].items():
+        total = sum(node[c] for c in columns)
+        if total > 0 and total >= min_bytes:
+            lines.append("\t".join([name] + [mb(node[c]) for c in columns]))
+    lines.append("\t".join(["total"] + [mb(report[c]) for c in columns]))
+    lines.append("peak (batch size %d): %s MB"
+                 % (report["batch_size"], mb(report["peak"])))
+    return "\n".join(lines)
@@ -4,26 +4,16 @@ TODO should this be in treeano.node_utils
 
 import treeano
 
-from . import walk_utils
-
 
 def postwalk_node(root_node, fn):
     """
     traverses a tree of nodes in a postwalk with a function that can
     transform nodes
-    """
-    def postwalk_fn(obj):
-        if isinstance(obj, treeano.core.NodeAPI):
-            res = fn(obj)
-            assert isinstance(res, treeano.core.NodeAPI)
-            return res
-        else:
-            return obj
 
-    # make a copy so that we don't have to worry about mutating the
-    # architecture
-    node_copy = treeano.node_utils.copy_node(root_node)
-    return walk_utils.walk(node_copy, postwalk_fn=postwalk_fn)
+    NOTE: fn should return a new node instead of mutating its input, because
+    unchanged subtrees are shared with the original tree
+    """
+    return treeano.node_utils.postwalk_node(root_node, fn)
 
 
 def suffix_node(root_node, suffix):
@@ -39,8 +29,7 @@ def suffix_node(root_node, suffix):
         # assert that node is nodeimpl, since we only know how to set
         # name for those
         assert isinstance(node, treeano.NodeImpl)
-        node._name += suffix
-        return node
+        return treeano.node_utils.rebuild_node(node, name=node.name + suffix)
 
     return postwalk_node(root_node, copy_and_suffix)
 
@@ -58,7 +47,6 @@ def format_node_name(root_node, format):
         # assert that node is nodeimpl, since we only know how to set
         # name for those
         assert isinstance(node, treeano.NodeImpl)
-        node._name = format % node.name
-        return node
+        return treeano.node_utils.rebuild_node(node, name=format % node.name)
 
     return postwalk_node(root_node, copy_and_format)
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+
+import canopy
+
+fX = theano.config.floatX
+
+
+def _network():
+    return tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 3)),
+         tn.SequentialNode(
+             "features",
+             [tn.DenseNode("fc1", num_units=4),
+              tn.DropoutNode("do", p=0.5),
+              tn.ReLUNode("r")]),
+         tn.DenseNode("fc2", num_units=2)]
+    ).network(
+        default_hyperparameters=dict(
+            inits=[treeano.inits.NormalWeightInit()]))
+
+
+def test_cached_activations():
+    network = _network()
+    x = np.random.randn(10, 3).astype(fX)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        activations = canopy.activation_cache.cached_activations(
+            network, "features", {"x": "i"}, {"x": x}, cache_dir, "train",
+            batch_size=3)
+        nt.assert_equal(1, len(os.listdir(cache_dir)))
+        nt.assert_is_instance(activations, np.memmap)
+        # the dropout in the subtree shouldn't be used
+        deterministic = canopy.handlers.handled_fn(
+            network,
+            [canopy.handlers.override_hyperparameters(deterministic=True)],
+            {"x": "i"},
+            {"out": "features"})({"x": x})["out"]
+        np.testing.assert_allclose(deterministic, activations, rtol=1e-5)
+
+        # the head gives the same outputs as the full network
+        head = canopy.activation_cache.head_network(network, "features")
+        fn1 = canopy.handlers.handled_fn(
+            network,
+            [canopy.handlers.override_hyperparameters(deterministic=True)],
+            {"x": "i"},
+            {"out": "s"})
+        fn2 = canopy.handlers.handled_fn(
+            head,
+            [canopy.handlers.override_hyperparameters(deterministic=True)],
+            {"x": "features"},
+            {"out": "s"})
+        np.testing.assert_allclose(fn1({"x": x})["out"],
+                                   fn2({"x": np.asarray(activations)})["out"],
+                                   rtol=1e-5)
+
+        # the cache is reused for the same dataset
+        canopy.activation_cache.cached_activations(
+            network, "features", {"x": "i"}, {"x": x}, cache_dir, "train")
+        nt.assert_equal(1, len(os.listdir(cache_dir)))
+        # and recomputed when the parameters of the subtree change
+        W = network["fc1_linear"].get_vw("weight").variable
+        W.set_value(W.get_value() * 2)
+        canopy.activation_cache.cached_activations(
+            network, "features", {"x": "i"}, {"x": x}, cache_dir, "train")
+        nt.assert_equal(2, len(os.listdir(cache_dir)))
+        # but not when the parameters outside of the subtree change
+        W = network["fc2_linear"].get_vw("weight").variable
+        W.set_value(W.get_value() * 2)
+        canopy.activation_cache.cached_activations(
+            network, "features", {"x": "i"}, {"x": x}, cache_dir, "train")
+        nt.assert_equal(2, len(os.listdir(cache_dir)))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_cached_activations_no_rows():
+    network = _network()
+    x = np.zeros((0, 3), dtype=fX)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        activations = canopy.activation_cache.cached_activations(
+            network, "features", {"x": "i"}, {"x": x}, cache_dir, "empty",
+            batch_size=3)
+        nt.assert_equal((0, 4), activations.shape)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_subtree_hash_stable():
+    # the hash doesn't depend on the identity of hyperparameter objects
+    # (eg. inits), whose reprs contain memory addresses
+    def hp_network(std):
+        network = tn.HyperparameterNode(
+            "hp",
+            _network().root_node,
+            inits=[treeano.inits.NormalWeightInit(std)],
+            cost_function=treeano.utils.squared_error).network()
+        network.build()
+        return network
+
+    network1 = hp_network(0.5)
+    value_dict = canopy.network_utils.to_value_dict(network1)
+    hashes = []
+    for std in [0.5, 0.25]:
+        network2 = hp_network(std)
+        canopy.network_utils.load_value_dict(network2, value_dict)
+        hashes.append(canopy.activation_cache.subtree_hash(network2, "hp"))
+    nt.assert_equal(canopy.activation_cache.subtree_hash(network1, "hp"),
+                    hashes[0])
+    nt.assert_not_equal(hashes[0], hashes[1])
@@ -0,0 +1,22 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import nose.tools as nt
+
+import canopy
+
+
+def test_prefetch():
+    for buffer_size in [1, 2, 10]:
+        nt.assert_equal(list(range(5)),
+                        list(canopy.fn_utils.prefetch(iter(range(5)),
+                                                      buffer_size)))
+
+
+@nt.raises(ValueError)
+def test_prefetch_exception():
+    def gen():
+        yield 1
+        raise ValueError()
+
+    list(canopy.fn_utils.prefetch(gen()))
@@ -0,0 +1,108 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+
+import canopy
+
+fX = theano.config.floatX
+itemsize = np.dtype(fX).itemsize
+
+
+def _network(updates_cls=tn.SGDNode):
+    return tn.HyperparameterNode(
+        "hp",
+        updates_cls(
+            "updates",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [tn.InputNode("x", shape=(None, 100)),
+                 tn.DenseNode("d1", num_units=50),
+                 tn.ReLUNode("r"),
+                 tn.DenseNode("d2", num_units=10),
+                 tn.SoftmaxNode("p")]),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                  "target": tn.InputNode("y", shape=(None,),
+                                         dtype="int32")})}),
+        cost_function=treeano.utils.categorical_crossentropy_i32,
+    ).network()
+
+
+def test_memory_report():
+    network = _network()
+    report = canopy.memory.memory_report(network, 32)
+    nt.assert_equal((100 * 50 + 50 + 50 * 10 + 10) * itemsize,
+                    report["parameters"])
+    nt.assert_equal(100 * 50 * itemsize,
+                    report["nodes"]["d1_linear"]["parameters"])
+    nt.assert_equal(32 * 100 * itemsize,
+                    report["nodes"]["x"]["activations"])
+    nt.assert_equal(0, report["gradients"])
+    # activations are linear in the batch size (plus scalars, eg. the cost)
+    report64 = canopy.memory.memory_report(network, 64)
+    report96 = canopy.memory.memory_report(network, 96)
+    nt.assert_equal(report64["activations"] - report["activations"],
+                    report96["activations"] - report64["activations"])
+    nt.assert_greater(report64["peak"], report["peak"])
+    nt.assert_less(report["peak"],
+                   report["parameters"] + report["activations"])
+
+
+def test_memory_report_include_updates():
+    network = _network(tn.AdamNode)
+    report = canopy.memory.memory_report(network, 32, include_updates=True)
+    nt.assert_equal(report["parameters"], report["gradients"])
+    # first and second moment estimates (and the number of steps)
+    nt.assert_less_equal(2 * report["parameters"], report["state"])
+    nt.assert_less(report["state"], 2 * report["parameters"] + 100)
+    nt.assert_greater(report["peak"],
+                      canopy.memory.memory_report(network, 32)["peak"])
+    table = canopy.memory.format_memory_report(report)
+    nt.assert_in("d1_linear", table)
+    nt.assert_in("peak (batch size 32)", table)
+
+
+def test_choose_batch_size():
+    network = _network()
+    for include_updates in [False, True]:
+        def peak(batch_size):
+            return canopy.memory.memory_report(
+                network,
+                batch_size,
+                include_updates=include_updates)["peak"]
+
+        budget = peak(100) + 1
+        batch_size = canopy.memory.choose_batch_size(
+            network,
+            memory_budget=budget,
+            max_batch_size=10000,
+            include_updates=include_updates)
+        nt.assert_equal(100, batch_size)
+        nt.assert_equal(96, canopy.memory.choose_batch_size(
+            network,
+            memory_budget=budget,
+            max_batch_size=10000,
+            include_updates=include_updates,
+            multiple_of=32))
+        nt.assert_equal(50, canopy.memory.choose_batch_size(
+            network,
+            memory_budget=budget,
+            max_batch_size=50,
+            include_updates=include_updates))
+
+
+@nt.raises(ValueError)
+def test_choose_batch_size_too_small():
+    canopy.memory.choose_batch_size(_network(),
+                                    memory_budget=1000,
+                                    max_batch_size=100)
+
+
+def test_memory_report_lazy():
+    network = _network()
+    lazy_network = _network().root_node.network(lazy=True)
+    nt.assert_equal(canopy.memory.memory_report(network, 32),
+                    canopy.memory.memory_report(lazy_network, 32))
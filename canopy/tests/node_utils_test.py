@@ -39,3 +39,39 @@ def test_suffix_node():
             tn.IdentityNode("3_foo")))
     nt.assert_equal(canopy.node_utils.suffix_node(node1, "_foo"),
                     node2)
+
+
+def test_suffix_node_does_not_mutate():
+    node = tn.HyperparameterNode(
+        "1",
+        tn.HyperparameterNode(
+            "2",
+            tn.IdentityNode("3")))
+    canopy.node_utils.suffix_node(node, "_foo")
+    nt.assert_equal(node.name, "1")
+    nt.assert_equal(node.architecture_children()[0].name, "2")
+
+
+def test_postwalk_node_structural_sharing():
+    node = tn.SequentialNode(
+        "s",
+        [tn.HyperparameterNode("hp", tn.IdentityNode("i")),
+         tn.AddConstantNode("ac")])
+
+    # an identity transform shares the whole tree
+    nt.assert_is(canopy.node_utils.postwalk_node(node, lambda n: n), node)
+
+    def replace_ac(n):
+        if n.name == "ac":
+            return tn.IdentityNode("ac")
+        return n
+
+    res = canopy.node_utils.postwalk_node(node, replace_ac)
+    nt.assert_is_not(res, node)
+    hp1 = node.architecture_children()[0]
+    hp2 = res.architecture_children()[0]
+    # the untouched subtree is shared
+    nt.assert_is(hp1, hp2)
+    nt.assert_is_instance(res.architecture_children()[1], tn.IdentityNode)
+    # original is unchanged
+    nt.assert_is_instance(node.architecture_children()[1], tn.AddConstantNode)
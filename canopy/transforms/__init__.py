@@ -1,6 +1,9 @@
 from . import fns
 from . import node
 from . import tree
+from . import inference
+from . import quantization
+from . import ensemble
 
 from .fns import (transform_root_node,
                   transform_node_data,
@@ -16,4 +19,14 @@ from .tree import (remove_nodes,
                    add_parent,
                    add_hyperparameters,
                    remove_parents,
-                   move_node)
+                   move_node,
+                   replace_with_input)
+from .inference import (remove_stochastic_nodes,
+                        remove_monitor_nodes,
+                        fold_batch_normalization,
+                        fuse_constants,
+                        optimize_for_inference)
+from .quantization import (calibrate_input_ranges,
+                           quantize)
+from .ensemble import (stack_ensemble,
+                       ensemble_fn)
@@ -0,0 +1,99 @@
+"""
+evaluating an ensemble of networks with the same architecture (but
+different parameters) as a single network
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import treeano.nodes as tn
+
+from . import fns
+from .. import handlers
+from .. import network_utils
+
+
+def _stacked_classes():
+    from treeano.sandbox.nodes import ensemble
+    return {tn.DenseNode: ensemble.StackedDenseNode,
+            tn.Conv2DNode: ensemble.StackedConv2DNode,
+            tn.Conv2DWithBiasNode: ensemble.StackedConv2DWithBiasNode}
+
+
+def stack_ensemble(network, value_dicts, **kwargs):
+    """
+    returns a network that computes the outputs of an ensemble of networks
+    with the architecture of the given network and the parameters in
+    value_dicts (as returned by canopy.network_utils.to_value_dict), with
+    the parameters of the members stacked along a new leading axis
+
+    the input of the returned network should be the inputs of the members
+    stacked along the batch axis (see ensemble_fn), and its outputs are
+    stacked the same way
+
+    NOTE: only DenseNode's, Conv2DNode's and Conv2DWithBiasNode's can have
+    parameters, and the other nodes must act on each example independently
+    (eg. batch normalization with minibatch statistics isn't supported)
+    """
+    network.build()
+    ensemble_size = len(value_dicts)
+    assert ensemble_size >= 1
+    shared_dict = network_utils.to_shared_dict(network)
+    for value_dict in value_dicts:
+        assert set(value_dict) == set(shared_dict)
+    stacked_classes = _stacked_classes()
+    new_values = fns.NewValues(network)
+    stacked_names = set()
+
+    def inner(node):
+        if node.__class__ not in stacked_classes:
+            return node
+        cls = stacked_classes[node.__class__]
+        for vw in network[node.name].find_vws_in_subtree(is_shared=True):
+            value = np.array([value_dict[vw.name]
+                              for value_dict in value_dicts])
+            if "bias" in vw.tags:
+                # the member axis replaces the broadcasted batch axis
+                assert vw.shape[0] == 1, vw.shape
+                value = value.reshape((ensemble_size,) + vw.shape[1:])
+            new_values.set(vw.name,
+                           value,
+                           broadcastable=(False,) * value.ndim)
+            stacked_names.add(vw.name)
+        hyperparameters = {k: v for k, v in node.hyperparameters.items()
+                           if k in cls.hyperparameter_names}
+        hyperparameters["ensemble_size"] = ensemble_size
+        return cls(node.name, **hyperparameters)
+
+    res = fns.transform_root_node_postwalk_with_values(network,
+                                                       inner,
+                                                       new_values,
+                                                       **kwargs)
+    not_stacked = set(shared_dict) - stacked_names
+    if not_stacked:
+        raise ValueError("parameters can't be stacked: %s"
+                         % sorted(not_stacked))
+    return res
+
+
+def ensemble_fn(network, value_dicts, inputs, outputs, **kwargs):
+    """
+    returns a handled_fn that computes the outputs of an ensemble (see
+    stack_ensemble) in a single call, returning for each output key:
+    - key: mean over the members
+    - key + "_variance": variance over the members
+    - key + "_samples": output of each member, with the members along axis 1
+
+    inputs and outputs are the same as for handled_fn (scalar outputs are
+    computed over all of the members)
+    """
+    stacked = stack_ensemble(network, value_dicts)
+    return handlers.handled_fn(
+        stacked,
+        [handlers.monte_carlo_samples(len(value_dicts),
+                                      list(inputs),
+                                      return_samples=True)],
+        inputs,
+        outputs,
+        **kwargs)
@@ -1,3 +1,5 @@
+import numpy as np
+import theano
 import treeano
 
 from .. import network_utils
@@ -52,6 +54,7 @@ def network_to_kwargs(network, priority="post_override"):
         root_node=root_node,
         override_hyperparameters=override_hyperparameters,
         default_hyperparameters=default_hyperparameters,
+        lazy=network.lazy,
     )
 
 
@@ -101,3 +104,81 @@ def transform_node_data_postwalk(network, fn, **kwargs):
         return walk_utils.collection_postwalk(data, postwalk_fn=fn)
 
     return transform_node_data(network, inner, **kwargs)
+
+
+class NewValues(object):
+
+    """
+    new values for shared variables of a network, that are used for a
+    transformed network instead of modifying the shared variables of the
+    original network
+    """
+
+    def __init__(self, network):
+        self.shared_dict = network_utils.to_shared_dict(network)
+        self.values = {}
+        self.broadcastable = {}
+        self.dtypes = {}
+
+    def get(self, vw):
+        """
+        returns the current value for the shared variable of the given
+        VariableWrapper
+        """
+        if vw.name in self.values:
+            return self.values[vw.name]
+        return self.shared_dict[vw.name].get_value()
+
+    def set(self, name, value, broadcastable=None, dtype=None):
+        """
+        sets the value for the shared variable with the given name, which
+        can be a new shared variable (defaulting to non-broadcastable and
+        floatX)
+        """
+        if name in self.shared_dict:
+            shared = self.shared_dict[name]
+            if broadcastable is None:
+                broadcastable = shared.broadcastable
+            if dtype is None:
+                dtype = shared.dtype
+        else:
+            if broadcastable is None:
+                broadcastable = (False,) * np.ndim(value)
+            if dtype is None:
+                dtype = theano.config.floatX
+        self.values[name] = value
+        self.broadcastable[name] = broadcastable
+        self.dtypes[name] = dtype
+
+    def to_init(self):
+        name_to_shared = {}
+        for name, value in self.values.items():
+            name_to_shared[name] = theano.shared(
+                np.array(value, dtype=self.dtypes[name]),
+                name=name,
+                broadcastable=self.broadcastable[name])
+        return treeano.inits.PreallocatedInit(name_to_shared)
+
+
+def transform_root_node_postwalk_with_values(network,
+                                             fn,
+                                             new_values,
+                                             **kwargs):
+    """
+    like transform_root_node_postwalk, but initializes shared variables
+    with the values set in new_values (a NewValues) when the transformed
+    network is built (the values can be set by fn)
+    """
+    network_kwargs = network_to_kwargs(network, **kwargs)
+    network_kwargs["root_node"] = node_utils.postwalk_node(
+        network_kwargs["root_node"], fn)
+    if new_values.values:
+        # the new values take precedence over sharing the variables of the
+        # original network
+        override_hyperparameters = dict(
+            network_kwargs["override_hyperparameters"])
+        override_hyperparameters["inits"] = (
+            [new_values.to_init()]
+            + list(override_hyperparameters.get("inits", [])))
+        network_kwargs["override_hyperparameters"] = override_hyperparameters
+    return treeano.Network(**network_kwargs)
@@ -0,0 +1,364 @@
+"""
+transformations that make a network faster for inference, without changing
+the output of the network in deterministic mode
+
+NOTE: nodes whose computation is folded into other nodes are removed, so
+the outputs of the remaining intermediate nodes can change (eg. a DenseNode
+followed by batch normalization outputs the normalized values) - only the
+outputs of nodes that aren't followed by a foldable node are preserved
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numbers
+
+import numpy as np
+import treeano
+import treeano.nodes as tn
+
+from . import fns
+
+# nodes that don't do anything in deterministic mode
+STOCHASTIC_NODES = (tn.DropoutNode,
+                    tn.GaussianDropoutNode,
+                    tn.SpatialDropoutNode,
+                    tn.GaussianSpatialDropoutNode)
+# nodes that don't change their input
+MONITOR_NODES = (tn.MonitorVarianceNode,
+                 tn.PrintNode)
+
+
+def _conv_nodes():
+    return (tn.Conv2DNode, tn.Conv2DWithBiasNode)
+
+
+def _linear_nodes():
+    return (tn.DenseNode,) + _conv_nodes()
+
+
+def _transform_sequential_children(network, fn, new_values=None, **kwargs):
+    """
+    applies fn to the list of children of each SequentialNode in the network,
+    and returns the transformed network
+
+    new_values:
+    a fns.NewValues that fn can set values of shared variables in
+    """
+    def inner(node):
+        if not isinstance(node, tn.SequentialNode):
+            return node
+        children = node.architecture_children()
+        new_children = fn(list(children))
+        if not new_children:
+            # an empty SequentialNode doesn't have an output
+            return tn.IdentityNode(node.name)
+        if (len(new_children) == len(children)
+                and all(c1 is c2 for c1, c2 in zip(children, new_children))):
+            return node
+        return treeano.node_utils.rebuild_node(
+            node,
+            children_container=treeano.core.ListChildrenContainer(
+                new_children))
+
+    if new_values is None:
+        return fns.transform_root_node_postwalk(network, inner, **kwargs)
+    return fns.transform_root_node_postwalk_with_values(network,
+                                                        inner,
+                                                        new_values,
+                                                        **kwargs)
+
+
+def _remove_nodes_with_classes(network, classes, **kwargs):
+    """
+    removes nodes of the given classes from SequentialNode's, and replaces
+    the other ones with IdentityNode's with the same name
+    """
+    def remove(children):
+        return [c for c in children if not isinstance(c, classes)]
+
+    network = _transform_sequential_children(network, remove, **kwargs)
+
+    def to_identity(node):
+        if isinstance(node, classes):
+            return tn.IdentityNode(node.name)
+        else:
+            return node
+
+    return fns.transform_root_node_postwalk(network, to_identity, **kwargs)
+
+
+def remove_stochastic_nodes(network, **kwargs):
+    """
+    removes dropout nodes (which don't do anything in deterministic mode)
+    """
+    return _remove_nodes_with_classes(network, STOCHASTIC_NODES, **kwargs)
+
+
+def remove_monitor_nodes(network, **kwargs):
+    """
+    removes nodes that monitor or print their input without changing it
+    """
+    return _remove_nodes_with_classes(network, MONITOR_NODES, **kwargs)
+
+
+# ########################### batch normalization ###########################
+
+
+def batch_normalization_affine(network):
+    """
+    returns the scale and shift (as arrays that broadcast with the input)
+    that AdvancedBatchNormalizationNode computes with its moving statistics
+
+    network:
+    relative network of the batch normalization node
+    """
+    # same defaults as the node
+    moving_var_type = network.find_hyperparameter(["moving_var_type"],
+                                                  "inv_std")
+    epsilon = network.find_hyperparameter(["epsilon"], 1e-8)
+
+    def value(name):
+        return network.get_vw(name).value
+
+    moving_var = value("var")
+    if moving_var_type == "log_var":
+        var = np.exp(moving_var)
+    elif moving_var_type == "var":
+        var = moving_var
+    elif moving_var_type == "inv_std":
+        var = np.square(1 / moving_var)
+    else:
+        raise ValueError(moving_var_type)
+    # (x - mean) / sqrt(var + epsilon) * (1 + gamma) + beta
+    scale = (1 + value("gamma")) / np.sqrt(var + epsilon)
+    shift = value("beta") - value("mean") * scale
+    return scale, shift
+
+
+def _per_channel(value):
+    """
+    returns the values of an array that only varies over axis 1, or None if
+    it varies over other axes
+    """
+    if value.ndim < 2:
+        return None
+    if any(s != 1 for axis, s in enumerate(value.shape) if axis != 1):
+        return None
+    return value.reshape(-1)
+
+
+def _linear_params(network, node):
+    """
+    returns the weight and bias (or None) of a linear node, and the axis of
+    the weight that corresponds to output channels
+    """
+    rel_network = network[node.name]
+    weights = rel_network.find_vws_in_subtree(tags=["weight"])
+    biases = rel_network.find_vws_in_subtree(tags=["bias"])
+    assert len(weights) == 1, weights
+    assert len(biases) <= 1, biases
+    weight = weights[0]
+    if isinstance(node, _conv_nodes()):
+        channel_axis = 0
+    else:
+        channel_axis = weight.ndim - 1
+    return weight, (biases[0] if biases else None), channel_axis
+
+
+def _scale_channels(value, scale, axis):
+    shape = [1] * value.ndim
+    shape[axis] = -1
+    return value * scale.reshape(shape)
+
+
+def _fold_batch_normalization_node(network, linear, bn_node, new_values):
+    """
+    folds the moving statistics of a batch normalization node into the
+    preceding linear node, and returns the nodes that replace the batch
+    normalization node (or None if it can't be folded)
+    """
+    rel_network = network[bn_node.name]
+    scale, shift = batch_normalization_affine(rel_network)
+    channel_scale = _per_channel(scale)
+    channel_shift = _per_channel(shift)
+    if channel_scale is None or channel_shift is None:
+        return None
+    weight, bias, channel_axis = _linear_params(network, linear)
+    W = new_values.get(weight)
+    if W.shape[channel_axis] != channel_scale.size:
+        return None
+    new_values.set(weight.name, _scale_channels(W, channel_scale,
+                                                channel_axis))
+    if bias is not None:
+        b = new_values.get(bias)
+        new_b = (b * channel_scale.reshape(b.shape)
+                 + channel_shift.reshape(b.shape))
+        new_values.set(bias.name, new_b)
+        return []
+    else:
+        # add a bias with the same name as the batch normalization node
+        in_vw = rel_network.get_input_vw("default")
+        broadcastable = tuple(axis != 1 for axis in range(in_vw.ndim))
+        new_values.set(bn_node.name + ":bias",
+                       channel_shift.reshape([1 if b else -1
+                                              for b in broadcastable]))
+        return [tn.AddBiasNode(bn_node.name, broadcastable=broadcastable)]
+
+
+def fold_batch_normalization(network, **kwargs):
+    """
+    folds batch normalization nodes that directly follow a DenseNode,
+    Conv2DNode or Conv2DWithBiasNode into the weights and bias of that node
+
+    the folded network computes batch normalization with the moving
+    statistics (as if bn_use_moving_stats were True)
+
+    NOTE: SimpleBatchNormalizationNode (and other nodes that always use
+    minibatch statistics) can't be folded
+    """
+    from treeano.sandbox.nodes import batch_normalization as bn
+
+    network.build()
+    new_values = fns.NewValues(network)
+
+    def fold(children):
+        res = []
+        for child in children:
+            if (isinstance(child, bn.AdvancedBatchNormalizationNode)
+                    and res
+                    and isinstance(res[-1], _linear_nodes())):
+                replacement = _fold_batch_normalization_node(network,
+                                                             res[-1],
+                                                             child,
+                                                             new_values)
+                if replacement is not None:
+                    res.extend(replacement)
+                    continue
+            res.append(child)
+        return res
+
+    return _transform_sequential_children(network,
+                                          fold,
+                                          new_values=new_values,
+                                          **kwargs)
+
+
+# ################################ constants ################################
+
+
+def _scalar_constant(network, node):
+    """
+    returns the value of a MultiplyConstantNode or AddConstantNode if it is
+    a scalar, otherwise None
+    """
+    if "value" in node.hyperparameters:
+        value = node.hyperparameters["value"]
+    else:
+        value = network[node.name].find_hyperparameter(["value"])
+    if isinstance(value, numbers.Number):
+        return value
+    if isinstance(value, np.ndarray) and value.ndim == 0:
+        return value.item()
+    return None
+
+
+def _fuse_constant_pair(network, node1, node2, new_values):
+    """
+    returns the nodes that replace 2 adjacent nodes, if a constant can be
+    fused into the other node, otherwise None
+    """
+    mult, add = tn.MultiplyConstantNode, tn.AddConstantNode
+    linear = _linear_nodes()
+    c1 = (_scalar_constant(network, node1)
+          if isinstance(node1, (mult, add)) else None)
+    c2 = (_scalar_constant(network, node2)
+          if isinstance(node2, (mult, add)) else None)
+
+    if c1 is not None and c2 is not None:
+        if isinstance(node1, mult) and isinstance(node2, mult):
+            return [mult(node1.name, value=c1 * c2)]
+        if isinstance(node1, add) and isinstance(node2, add):
+            return [add(node1.name, value=c1 + c2)]
+        if isinstance(node1, mult) and isinstance(node2, add) and c1 != 0:
+            # move multiplications after additions, so that they can be
+            # fused into a following node
+            # ---
+            # xc + d = (x + d / c)c
+            return [add(node2.name, value=c2 / c1),
+                    mult(node1.name, value=c1)]
+    elif isinstance(node1, linear) and c2 is not None:
+        weight, bias, _ = _linear_params(network, node1)
+        if isinstance(node2, mult):
+            # (xW + b) * c = x(cW) + cb
+            new_values.set(weight.name, new_values.get(weight) * c2)
+            if bias is not None:
+                new_values.set(bias.name, new_values.get(bias) * c2)
+            return [node1]
+        if bias is not None:
+            # xW + b + c = xW + (b + c)
+            new_values.set(bias.name, new_values.get(bias) + c2)
+            return [node1]
+    elif c1 is not None and isinstance(node2, linear):
+        weight, bias, _ = _linear_params(network, node2)
+        if isinstance(node1, mult):
+            # (cx)W = x(cW)
+            new_values.set(weight.name, new_values.get(weight) * c1)
+            return [node2]
+        if isinstance(node2, tn.DenseNode) and bias is not None:
+            # adding before a convolution isn't the same with padding
+            # ---
+            # (x + c)W + b = xW + (b + c * sum of W over inputs)
+            b = new_values.get(bias)
+            W_sum = new_values.get(weight).sum(axis=0)
+            new_values.set(bias.name, b + c1 * W_sum.reshape(b.shape))
+            return [node2]
+    return None
+
+
+def fuse_constants(network, **kwargs):
+    """
+    fuses chains of MultiplyConstantNode's and AddConstantNode's with scalar
+    values into each other, and into the weights and biases of adjacent
+    DenseNode's, Conv2DNode's and Conv2DWithBiasNode's
+    """
+    network.build()
+    new_values = fns.NewValues(network)
+
+    def fuse(children):
+        res = list(children)
+        fused = True
+        while fused:
+            fused = False
+            for idx in range(len(res) - 1):
+                replacement = _fuse_constant_pair(network,
+                                                  res[idx],
+                                                  res[idx + 1],
+                                                  new_values)
+                if replacement is not None:
+                    res[idx:idx + 2] = replacement
+                    fused = True
+                    break
+        return res
+
+    return _transform_sequential_children(network,
+                                          fuse,
+                                          new_values=new_values,
+                                          **kwargs)
+
+
+# ################################# pipeline #################################
+
+
+def optimize_for_inference(network, **kwargs):
+    """
+    applies all of the inference transformations: removing dropout and
+    monitoring nodes, folding batch normalization and fusing constants
+
+    the returned network should be used in deterministic mode
+    """
+    network = remove_stochastic_nodes(network, **kwargs)
+    network = remove_monitor_nodes(network, **kwargs)
+    network = fold_batch_normalization(network, **kwargs)
+    network = fuse_constants(network, **kwargs)
+    return network
@@ -58,9 +58,11 @@ def update_hyperparameters(network, node_name, hyperparameters, **kwargs):
             found[0] = True
             for k in hyperparameters:
                 assert k in node.hyperparameter_names
-            new_node = treeano.node_utils.copy_node(node)
-            new_node.hyperparameters.update(hyperparameters)
-            return new_node
+            new_hyperparameters = dict(node.hyperparameters)
+            new_hyperparameters.update(hyperparameters)
+            return treeano.node_utils.rebuild_node(
+                node,
+                hyperparameters=new_hyperparameters)
         else:
             return node
 
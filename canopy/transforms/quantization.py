@@ -0,0 +1,152 @@
+"""
+post-training quantization of the weights and inputs of linear layers to
+int8, with the ranges of the inputs calibrated on sample data
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+
+from . import fns
+from . import inference
+from .. import handlers
+
+
+def calibrate_input_ranges(network,
+                           node_names,
+                           inputs,
+                           in_dict,
+                           batch_size=None):
+    """
+    returns a map from node name to the largest absolute value of the input
+    of the node, when the network is run in deterministic mode over the
+    given data
+
+    inputs:
+    map from key in in_dict to the node (or variable) to give it to (same as
+    for handled_fn)
+
+    batch_size:
+    if given, the data is run through the network in batches of this size
+    """
+    # the outputs are variables of the network, so the network is made
+    # deterministic here instead of with the override_hyperparameters
+    # handler (which would create a new network)
+    network_kwargs = fns.network_to_kwargs(network)
+    network_kwargs["override_hyperparameters"] = dict(
+        network_kwargs["override_hyperparameters"],
+        deterministic=True)
+    network = treeano.Network(**network_kwargs)
+    network.build()
+    outputs = {}
+    for name in node_names:
+        in_var = network[name].get_input_vw("default").variable
+        outputs[name] = T.max(abs(in_var))
+    fn_handlers = []
+    if batch_size is not None:
+        fn_handlers.append(handlers.split_input(split_size=batch_size,
+                                                keys=list(inputs),
+                                                scalar_merge=np.max))
+    calibration_fn = handlers.handled_fn(network,
+                                         fn_handlers,
+                                         inputs,
+                                         outputs)
+    res = calibration_fn(in_dict)
+    return {name: float(res[name]) for name in node_names}
+
+
+def _quantizable_node_names(root_node):
+    """
+    returns the names of the nodes that quantize can replace, excluding
+    nodes inside of scans (whose inputs are only defined within a step, so
+    their ranges can't be calibrated)
+    """
+    linear_nodes = inference._linear_nodes()
+    res = []
+
+    def walk(node):
+        if isinstance(node, tn.scan.ScanNode):
+            return
+        if isinstance(node, linear_nodes):
+            res.append(node.name)
+            return
+        for child in node.architecture_children():
+            walk(child)
+
+    walk(root_node)
+    return res
+
+
+def quantize(network,
+             inputs,
+             in_dict,
+             batch_size=None,
+             node_names=None,
+             **kwargs):
+    """
+    replaces DenseNode's, Conv2DNode's and Conv2DWithBiasNode's with
+    versions that use int8 weights (with a scale per output unit / filter)
+    and int8 inputs, where the range of the inputs of each node is
+    calibrated by running the network over the given data (see
+    calibrate_input_ranges for inputs, in_dict and batch_size)
+
+    node_names:
+    names of the nodes to quantize (defaults to all of the supported nodes
+    that aren't inside of a scan)
+    """
+    from treeano.sandbox.nodes import quantization
+
+    network.build()
+    if node_names is None:
+        node_names = _quantizable_node_names(network.root_node)
+    node_names = set(node_names)
+    if not node_names:
+        # nothing to quantize
+        return network
+    input_ranges = calibrate_input_ranges(network,
+                                          node_names,
+                                          inputs,
+                                          in_dict,
+                                          batch_size=batch_size)
+    new_values = fns.NewValues(network)
+
+    def inner(node):
+        if node.name not in node_names:
+            return node
+        weight, _, channel_axis = inference._linear_params(network, node)
+        quantized_weight, weight_scale = quantization.quantize_weight(
+            new_values.get(weight),
+            channel_axis)
+        # inputs that are always 0 can have any scale
+        input_range = input_ranges[node.name] or 1.
+        input_scale = input_range / quantization.QUANTIZED_MAX
+        if isinstance(node, tn.DenseNode):
+            cls = quantization.QuantizedDenseNode
+            prefix = node.name + "_linear"
+        elif isinstance(node, tn.Conv2DWithBiasNode):
+            cls = quantization.QuantizedConv2DWithBiasNode
+            prefix = node.name + "_conv"
+        elif isinstance(node, tn.Conv2DNode):
+            cls = quantization.QuantizedConv2DNode
+            prefix = node.name
+        else:
+            raise ValueError("node %s (%s) can't be quantized"
+                             % (node.name, node.__class__.__name__))
+        new_values.set(prefix + ":quantized_weight",
+                       quantized_weight,
+                       dtype="int8")
+        new_values.set(prefix + ":weight_scale", weight_scale)
+        # keep the other hyperparameters (eg. num_units), except for inits
+        hyperparameters = {k: v for k, v in node.hyperparameters.items()
+                           if k in cls.hyperparameter_names}
+        hyperparameters["input_scale"] = input_scale
+        return cls(node.name, **hyperparameters)
+
+    return fns.transform_root_node_postwalk_with_values(network,
+                                                        inner,
+                                                        new_values,
+                                                        **kwargs)
@@ -0,0 +1,76 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+from treeano.sandbox.nodes import batch_normalization as bn
+
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def _root_node():
+    return tn.HyperparameterNode(
+        "hp",
+        tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(None, 2, 8, 8)),
+             tn.Conv2DWithBiasNode("c1", num_filters=3, pad="same"),
+             tn.ReLUNode("r1"),
+             tn.MaxPool2DNode("p", pool_size=(2, 2)),
+             tn.Conv2DNode("c2", num_filters=4),
+             tn.DenseNode("fc", num_units=5),
+             tn.SoftmaxNode("sm")]),
+        filter_size=(3, 3),
+        inits=[treeano.inits.NormalWeightInit()])
+
+
+def test_ensemble_fn():
+    value_dicts = []
+    member_fns = []
+    for _ in range(3):
+        network = _root_node().network()
+        network.build()
+        value_dict = canopy.network_utils.to_value_dict(network)
+        # randomize biases too
+        for k, v in value_dict.items():
+            value_dict[k] = np.random.randn(*v.shape).astype(fX)
+        canopy.network_utils.load_value_dict(network, value_dict)
+        value_dicts.append(value_dict)
+        member_fns.append(network.function(["i"], ["s"]))
+
+    fn = canopy.transforms.ensemble_fn(network,
+                                       value_dicts,
+                                       {"x": "i"},
+                                       {"out": "s"})
+    x = np.random.randn(4, 2, 8, 8).astype(fX)
+    res = fn({"x": x})
+    expected = np.array([member_fn(x)[0] for member_fn in member_fns])
+    nt.assert_equal((4, 3, 5), res["out_samples"].shape)
+    np.testing.assert_allclose(expected.swapaxes(0, 1),
+                               res["out_samples"],
+                               rtol=1e-4,
+                               atol=1e-6)
+    np.testing.assert_allclose(expected.mean(axis=0),
+                               res["out"],
+                               rtol=1e-4,
+                               atol=1e-6)
+    np.testing.assert_allclose(expected.var(axis=0),
+                               res["out_variance"],
+                               rtol=1e-3,
+                               atol=1e-6)
+
+
+def test_stack_ensemble_unsupported():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 3)),
+         tn.DenseNode("fc", num_units=4),
+         bn.BatchNormalizationNode("bn")]).network()
+    value_dict = canopy.network_utils.to_value_dict(network)
+    nt.assert_raises(ValueError,
+                     canopy.transforms.stack_ensemble,
+                     network,
+                     [value_dict, value_dict])
@@ -0,0 +1,170 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+from treeano.sandbox.nodes import batch_normalization as bn
+
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def _randomize_params(network):
+    network.build()
+    value_dict = canopy.network_utils.to_value_dict(network)
+    for k, v in value_dict.items():
+        value_dict[k] = np.random.uniform(0.5, 1.5, v.shape).astype(fX)
+    canopy.network_utils.load_value_dict(network, value_dict)
+
+
+def _node_classes(network):
+    network.build()
+    nodes = network.graph.architectural_tree_nodes_root_to_leaves()
+    return [node.__class__ for node in nodes]
+
+
+def _check_same_output(network1, network2, shape):
+    fn1 = network1.function(["i"], ["s"])
+    fn2 = network2.function(["i"], ["s"])
+    x = np.random.randn(*shape).astype(fX)
+    np.testing.assert_allclose(fn1(x)[0], fn2(x)[0], rtol=1e-4, atol=1e-5)
+
+
+def test_remove_stochastic_nodes():
+    network1 = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(3, 4)),
+         tn.DropoutNode("do", p=0.5),
+         tn.LinearMappingNode("lm", output_dim=5),
+         tn.HyperparameterNode(
+             "hp",
+             tn.GaussianDropoutNode("gdo"),
+             sigma=0.5)]
+    ).network(override_hyperparameters=dict(deterministic=True))
+    _randomize_params(network1)
+    network2 = canopy.transforms.remove_stochastic_nodes(network1)
+    nt.assert_equal([tn.SequentialNode,
+                     tn.InputNode,
+                     tn.LinearMappingNode,
+                     tn.HyperparameterNode,
+                     tn.IdentityNode],
+                    _node_classes(network2))
+    _check_same_output(network1, network2, (3, 4))
+
+
+def test_remove_monitor_nodes():
+    network1 = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(3, 4)),
+         tn.MonitorVarianceNode("mv"),
+         tn.PrintNode("p")]
+    ).network()
+    network2 = canopy.transforms.remove_monitor_nodes(network1)
+    nt.assert_equal([tn.SequentialNode, tn.InputNode],
+                    _node_classes(network2))
+    _check_same_output(network1, network2, (3, 4))
+
+
+def test_fold_batch_normalization():
+    for node, shape in [(tn.DenseNode("l", num_units=5), (3, 4)),
+                        (tn.Conv2DNode("l",
+                                       num_filters=5,
+                                       filter_size=(3, 3)),
+                         (3, 2, 6, 6)),
+                        (tn.Conv2DWithBiasNode("l",
+                                               num_filters=5,
+                                               filter_size=(3, 3)),
+                         (3, 2, 6, 6))]:
+        for moving_var_type in ["log_var", "var", "inv_std"]:
+            network1 = tn.SequentialNode(
+                "s",
+                [tn.InputNode("i", shape=shape),
+                 node,
+                 bn.BatchNormalizationNode("bn",
+                                           moving_var_type=moving_var_type),
+                 tn.ReLUNode("r")]
+            ).network(override_hyperparameters=dict(deterministic=True,
+                                                    bn_use_moving_stats=True))
+            _randomize_params(network1)
+            value_dict = canopy.network_utils.to_value_dict(network1)
+            network2 = canopy.transforms.fold_batch_normalization(network1)
+            classes = _node_classes(network2)
+            nt.assert_not_in(bn.AdvancedBatchNormalizationNode, classes)
+            if isinstance(node, tn.Conv2DNode):
+                nt.assert_in(tn.AddBiasNode, classes)
+            _check_same_output(network1, network2, shape)
+            # the original network shouldn't be changed
+            for k, v in canopy.network_utils.to_value_dict(network1).items():
+                np.testing.assert_equal(value_dict[k], v)
+
+
+def test_fold_batch_normalization_not_adjacent():
+    network1 = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(3, 4)),
+         tn.DenseNode("fc", num_units=5),
+         tn.ReLUNode("r"),
+         bn.BatchNormalizationNode("bn")]
+    ).network(override_hyperparameters=dict(bn_use_moving_stats=True))
+    network2 = canopy.transforms.fold_batch_normalization(network1)
+    nt.assert_in(bn.AdvancedBatchNormalizationNode, _node_classes(network2))
+
+
+def test_fuse_constants():
+    for node, shape in [(tn.DenseNode("l", num_units=5), (3, 4)),
+                        (tn.Conv2DWithBiasNode("l",
+                                               num_filters=5,
+                                               filter_size=(3, 3),
+                                               pad="same"),
+                         (3, 2, 6, 6))]:
+        network1 = tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=shape),
+             tn.MultiplyConstantNode("m1", value=2.),
+             tn.MultiplyConstantNode("m2", value=0.5),
+             tn.AddConstantNode("a1", value=3.),
+             node,
+             tn.MultiplyConstantNode("m3", value=3.),
+             tn.AddConstantNode("a2", value=-1.),
+             tn.AddConstantNode("a3", value=2.)]
+        ).network()
+        _randomize_params(network1)
+        network2 = canopy.transforms.fuse_constants(network1)
+        classes = _node_classes(network2)
+        nt.assert_equal(0, classes.count(tn.MultiplyConstantNode))
+        if isinstance(node, tn.DenseNode):
+            nt.assert_equal(0, classes.count(tn.AddConstantNode))
+        else:
+            # adding before a convolution with padding can't be fused
+            nt.assert_equal(1, classes.count(tn.AddConstantNode))
+        _check_same_output(network1, network2, shape)
+
+
+def test_optimize_for_inference():
+    network1 = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(3, 2, 6, 6)),
+         tn.Conv2DNode("c", num_filters=4, filter_size=(3, 3)),
+         bn.BatchNormalizationNode("bn1"),
+         tn.ReLUNode("r1"),
+         tn.DropoutNode("do1", p=0.5),
+         tn.MonitorVarianceNode("mv"),
+         tn.DenseNode("fc", num_units=3),
+         tn.DropoutNode("do2", p=0.5),
+         bn.BatchNormalizationNode("bn2"),
+         tn.MultiplyConstantNode("m", value=2.)]
+    ).network(override_hyperparameters=dict(deterministic=True,
+                                            bn_use_moving_stats=True))
+    _randomize_params(network1)
+    network2 = canopy.transforms.optimize_for_inference(network1)
+    classes = _node_classes(network2)
+    for cls in [bn.AdvancedBatchNormalizationNode,
+                tn.DropoutNode,
+                tn.MonitorVarianceNode,
+                tn.MultiplyConstantNode]:
+        nt.assert_not_in(cls, classes)
+    nt.assert_less(len(classes), len(_node_classes(network1)))
+    _check_same_output(network1, network2, (3, 2, 6, 6))
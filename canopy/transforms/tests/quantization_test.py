@@ -0,0 +1,63 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+from treeano.sandbox.nodes import quantization
+
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def test_calibrate_input_ranges():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 4)),
+         tn.MultiplyConstantNode("m", value=2.),
+         tn.DenseNode("fc", num_units=3)]
+    ).network()
+    x = np.random.randn(10, 4).astype(fX)
+    for batch_size in [None, 2]:
+        ranges = canopy.transforms.calibrate_input_ranges(
+            network, ["fc"], {"x": "i"}, {"x": x}, batch_size=batch_size)
+        np.testing.assert_allclose(2 * np.abs(x).max(), ranges["fc"])
+
+
+def test_quantize():
+    network1 = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 2, 8, 8)),
+         tn.Conv2DWithBiasNode("c1", num_filters=4, filter_size=(3, 3)),
+         tn.ReLUNode("r1"),
+         tn.Conv2DNode("c2", num_filters=4, filter_size=(3, 3)),
+         tn.ReLUNode("r2"),
+         tn.DenseNode("fc1", num_units=8),
+         tn.ReLUNode("r3"),
+         tn.DenseNode("fc2", num_units=3)]
+    ).network()
+    x = np.random.randn(10, 2, 8, 8).astype(fX)
+    network2 = canopy.transforms.quantize(network1,
+                                          {"x": "i"},
+                                          {"x": x},
+                                          batch_size=5)
+    network2.build()
+    classes = [node.__class__ for node
+               in network2.graph.architectural_tree_nodes_root_to_leaves()]
+    for cls in [quantization.QuantizedConv2DWithBiasNode,
+                quantization.QuantizedConv2DNode,
+                quantization.QuantizedDenseNode]:
+        nt.assert_in(cls, classes)
+    for cls in [tn.Conv2DNode, tn.DenseNode, tn.LinearMappingNode]:
+        nt.assert_not_in(cls, classes)
+    for k, v in canopy.network_utils.to_value_dict(network2).items():
+        if k.endswith(":quantized_weight"):
+            nt.assert_equal("int8", v.dtype)
+        else:
+            # only the weights are quantized
+            nt.assert_true(k.endswith(":bias") or k.endswith(":weight_scale"))
+    y1 = network1.function(["i"], ["s"])(x)[0]
+    y2 = network2.function(["i"], ["s"])(x)[0]
+    np.testing.assert_allclose(y1, y2, atol=0.05 * np.abs(y1).max())
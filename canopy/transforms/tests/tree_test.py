@@ -155,3 +155,24 @@ def test_move_node():
          tn.AddConstantNode("ac")])
 
     nt.assert_equal(ans, network2.root_node)
+
+
+def test_replace_with_input():
+    network1 = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(3, 4)),
+         tn.DenseNode("fc1", num_units=5),
+         tn.DenseNode("fc2", num_units=2)]).network()
+
+    network2 = canopy.transforms.replace_with_input(network1, "fc1")
+
+    nt.assert_equal(tn.InputNode("fc1",
+                                 shape=(None, 5),
+                                 dtype=theano.config.floatX,
+                                 broadcastable=(False, False)),
+                    network2.root_node.architecture_children()[1])
+    x = np.random.randn(3, 4).astype(theano.config.floatX)
+    h = network1.function(["i"], ["fc1"])(x)[0]
+    np.testing.assert_allclose(network1.function(["i"], ["seq"])(x)[0],
+                               network2.function(["fc1"], ["seq"])(h)[0],
+                               rtol=1e-5)
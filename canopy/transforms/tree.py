@@ -143,3 +143,28 @@ def move_node(network, new_name, old_name, **kwargs):
         return node_utils.postwalk_node(root_node, fn)
 
     return fns.transform_root_node(network, inner, **kwargs)
+
+
+def replace_with_input(network, name, **kwargs):
+    """
+    replaces the subtree of the node with the given name with an InputNode
+    with the same name, shape (with a variable batch axis) and dtype as the
+    output of the node
+
+    use case: training the rest of the network on precomputed outputs of a
+    frozen subtree
+    """
+    network.build()
+    vw = network[name].get_vw("default")
+    input_node = tn.InputNode(name,
+                              shape=(None,) + tuple(vw.shape[1:]),
+                              dtype=vw.dtype,
+                              broadcastable=(False,) + vw.broadcastable[1:])
+
+    def inner(node):
+        if node.name == name:
+            return input_node
+        else:
+            return node
+
+    return fns.transform_root_node_postwalk(network, inner, **kwargs)
@@ -6,10 +6,9 @@ visualization
 
 from . import utils
 from . import core
-from . import theano_extensions
+# nodes is itself lazy, so importing it only registers its node modules for
+# deserialization
 from . import nodes
-from . import inits
-from . import node_utils
 
 from .core import (UpdateDeltas,
                    SharedInit,
@@ -21,3 +20,7 @@ from .core import (UpdateDeltas,
                    WrapperNodeImpl,
                    Wrapper1NodeImpl,
                    Wrapper0NodeImpl)
+
+# imported on first access, to reduce import time
+from .lazy_module import make_lazy
+make_lazy(__name__, ["theano_extensions", "inits", "node_utils"])
@@ -1,6 +1,7 @@
 from . import update_deltas
 from . import graph
 from . import inits
+from . import shape_inference
 from . import variable
 from . import serialization_state
 from . import children_container
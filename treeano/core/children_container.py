@@ -43,6 +43,21 @@ class ChildrenContainer(six.with_metaclass(abc.ABCMeta, object)):
         NOTE: should be a classmethod
         """
 
+    def map_children(self, fn):
+        """
+        returns a children container of the same class with fn applied to
+        each child node
+
+        if fn returns every child unchanged, the container itself is returned
+        so that untouched subtrees can be shared instead of copied
+        """
+        raise NotImplementedError("map_children not implemented for %s"
+                                  % self.__class__.__name__)
+
+
+def _all_identical(xs, ys):
+    return all(x is y for x, y in zip(xs, ys))
+
 
 @serialization_state.register_children_container("list")
 class ListChildrenContainer(ChildrenContainer):
@@ -66,6 +81,12 @@ class ListChildrenContainer(ChildrenContainer):
         return [serialization_state.node_to_data(child_node)
                 for child_node in self.children]
 
+    def map_children(self, fn):
+        new_children = [fn(child_node) for child_node in self.children]
+        if _all_identical(new_children, self.children):
+            return self
+        return self.__class__(new_children)
+
     @classmethod
     def from_data(cls, data):
         return cls([serialization_state.node_from_data(datum)
@@ -92,6 +113,9 @@ class NoneChildrenContainer(ChildrenContainer):
     def to_data(self):
         return None
 
+    def map_children(self, fn):
+        return self
+
     @classmethod
     def from_data(cls, data):
         return cls(None)
@@ -117,6 +141,12 @@ class ChildContainer(ChildrenContainer):
     def to_data(self):
         return serialization_state.node_to_data(self.child)
 
+    def map_children(self, fn):
+        new_child = fn(self.child)
+        if new_child is self.child:
+            return self
+        return self.__class__(new_child)
+
     @classmethod
     def from_data(cls, data):
         return cls(serialization_state.node_from_data(data))
@@ -151,6 +181,13 @@ class DictChildrenContainer(ChildrenContainer):
         return {k: serialization_state.children_container_to_data(v)
                 for k, v in self._children.items()}
 
+    def map_children(self, fn):
+        new_children = {k: v.map_children(fn)
+                        for k, v in self._children.items()}
+        if all(new_children[k] is v for k, v in self._children.items()):
+            return self
+        return self.__class__(new_children)
+
     @classmethod
     def from_data(cls, data):
         return cls({k: serialization_state.children_container_from_data(v)
@@ -239,6 +276,13 @@ class NodesAndEdgesContainer(ChildrenContainer):
                           for node in self.nodes],
                 "edges": self.edges}
 
+    def map_children(self, fn):
+        new_nodes = [fn(node) for node in self.nodes]
+        if _all_identical(new_nodes, self.nodes):
+            return self
+        # edges refer to nodes by name, so they can be shared
+        return self.__class__((new_nodes, self.edges))
+
     @classmethod
     def from_data(cls, data):
         nodes = [serialization_state.node_from_data(n) for n in data["nodes"]]
@@ -1,7 +1,10 @@
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
-import networkx as nx
+from ..lazy_module import lazy_import
+
+# networkx takes a while to import, and is only needed when building
+nx = lazy_import("networkx")
 
 
 def init_name_to_node(root_node):
@@ -161,6 +164,13 @@ class TreeanoGraph(object):
                 return (edge_from, from_key)
         return None
 
+    def computation_ancestor_names(self, node_name):
+        """
+        returns a set of names of the nodes whose outputs the given node
+        depends on (directly or indirectly) in the computation graph
+        """
+        return nx.ancestors(self.computation_graph, node_name)
+
     def architecture_ancestor_names(self, node_name):
         """
         returns a generator of ancestor names of the current node in the
@@ -16,15 +16,29 @@ class Network(object):
 
     """
     contains the state of multiple nodes
+
+    lazy:
+    if True, the outputs of nodes are only computed when they are needed
+    (along with the nodes they depend on), and update deltas are only
+    computed when they are first accessed (eg. by calling function with
+    include_updates=True). this allows inference-only functions to skip
+    building gradients and nodes that are only used by costs
+
+    NOTE: variables that are created when computing update deltas (eg. the
+    state of optimizers) only exist after update deltas have been computed
     """
 
     def __init__(self,
                  root_node,
                  override_hyperparameters=None,
-                 default_hyperparameters=None):
+                 default_hyperparameters=None,
+                 lazy=False):
         self.root_node = root_node
         self.node_state = {}
-        self.update_deltas = UpdateDeltas()
+        self.lazy = lazy
+        self._computation_order = []
+        self._computed_node_names = set()
+        self._update_deltas = None
         self.override_hyperparameters = dict()
         self.default_hyperparameters = dict(
             batch_axis=0,
@@ -86,10 +100,28 @@ class Network(object):
         self.graph.is_mutable = False
         # compute and store outputs
         # ---
+        # the computation graph no longer changes, so the topological order
+        # can be reused when lazily computing outputs
+        self._computation_order = [
+            node.name
+            for node in self.graph.computation_graph_nodes_topological()]
+        if not self.lazy:
+            self._compute_outputs(self._computation_order)
+            self._compute_update_deltas()
+
+    def _compute_outputs(self, node_names):
+        """
+        computes the outputs of the given nodes that haven't been computed yet
+        """
+        node_names = set(node_names)
         # compute in the order of the computation DAG, so that all
         # dependencies have been computed for each node by the time
         # computation for the node has to occur
-        for node in self.graph.computation_graph_nodes_topological():
+        for name in self._computation_order:
+            if name not in node_names or name in self._computed_node_names:
+                continue
+            self._computed_node_names.add(name)
+            node = self.graph.name_to_node[name]
             rel_network = self.relative_network(node)
             # get input keys
             input_keys = node.get_input_keys(rel_network)
@@ -109,15 +141,45 @@ class Network(object):
             # sanity check to make sure no user accidentaly returns a value
             # instead of creating a variable
             assert output_res is None
-        # compute updates
-        # ---
+
+    def compute_outputs_for(self, node_names):
+        """
+        makes sure that the outputs of the given nodes (and the nodes that
+        they depend on) have been computed
+
+        this is only necessary for lazy networks
+        """
+        self.build()
+        missing = [name for name in node_names
+                   if name not in self._computed_node_names]
+        if not missing:
+            return
+        needed = set(missing)
+        for name in missing:
+            needed |= self.graph.computation_ancestor_names(name)
+        self._compute_outputs(needed)
+
+    def _compute_update_deltas(self):
+        # updates are computed from the outputs of all nodes
+        self._compute_outputs(self._computation_order)
+        self._update_deltas = update_deltas = UpdateDeltas()
         # compute from top (root) to bottom (leaves) so that low levels
         # of the tree (ie. more specific update rules) can overwrite / mutate
         # the update rules from higher leveles of the tree (ie. more general
         # update rules)
         for node in self.graph.architectural_tree_nodes_root_to_leaves():
             node.mutate_update_deltas(self.relative_network(node),
-                                      self.update_deltas)
+                                      update_deltas)
+
+    @property
+    def update_deltas(self):
+        """
+        the update deltas of all nodes in the network
+        """
+        self.build()
+        if self._update_deltas is None:
+            self._compute_update_deltas()
+        return self._update_deltas
 
     def relative_network(self, node=None):
         """
@@ -263,7 +325,12 @@ class RelativeNetwork(object):
         return self._state["additional_data"][key]
 
     def get_vw(self, variable_name):
-        return self._state["current_variables"][variable_name]
+        current_variables = self._state["current_variables"]
+        # some variables are created before the outputs are computed (eg. in
+        # init_state), so only compute the outputs if needed
+        if self._network.lazy and variable_name not in current_variables:
+            self._network.compute_outputs_for([self._name])
+        return current_variables[variable_name]
 
     def set_hyperparameter(self, node_name, key, value):
         """
@@ -374,9 +441,12 @@ class RelativeNetwork(object):
         """
         return variable wrappers matching all of the given tags
         """
+        subtree_names = self.graph.architecture_subtree_names(self._name)
+        if self._network.lazy:
+            self._network.compute_outputs_for(subtree_names)
         remaining_vws = [
             vw
-            for name in self.graph.architecture_subtree_names(self._name)
+            for name in subtree_names
             for vw in self[name]._state["current_variables"].values()]
         if tags is not None:
             tags = set(tags)
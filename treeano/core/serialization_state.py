@@ -1,7 +1,12 @@
+import importlib
+
 import six
 
 CHILDREN_CONTAINERS = {}
 NODES = {}
+# names of modules that register nodes when imported, but which are only
+# imported when needed
+LAZY_NODE_MODULES = []
 
 
 def register_node(name):
@@ -27,10 +32,31 @@ def node_to_str(cls):
     return {v: k for k, v in NODES.items()}[cls]
 
 
+def register_lazy_node_modules(module_names):
+    """
+    registers modules whose nodes can be looked up by node_from_str before
+    the modules are imported
+    """
+    for module_name in module_names:
+        if module_name not in LAZY_NODE_MODULES:
+            LAZY_NODE_MODULES.append(module_name)
+
+
+def import_lazy_node_modules():
+    """
+    imports all lazy node modules, registering their nodes
+    """
+    while LAZY_NODE_MODULES:
+        importlib.import_module(LAZY_NODE_MODULES.pop(0))
+
+
 def node_from_str(s):
     """
     returns the registered node class for the given string
     """
+    if s not in NODES:
+        # the node may be in a module that hasn't been imported yet
+        import_lazy_node_modules()
     return NODES[s]
 
 
@@ -0,0 +1,366 @@
+"""
+static shape inference for theano variables, without compiling or
+evaluating anything
+
+shapes are tuples of ints, with None for dimensions that aren't known
+until runtime (eg. the batch size)
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import theano
+import theano.tensor as T
+from theano.gof import graph
+from theano.gof import FunctionGraph
+from theano.tensor.opt import ShapeFeature, Shape_i
+
+# name of the attribute on a variable's tag for the shape declared by
+# treeano (the tag is copied when theano clones a variable)
+SHAPE_TAG = "treeano_shape"
+
+
+def merge_shapes(shape1, shape2):
+    """
+    returns the most specific shape compatible with both given shapes, or
+    raises a ValueError if they are incompatible
+    """
+    if len(shape1) != len(shape2):
+        raise ValueError("shapes %s and %s have a different number of "
+                         "dimensions" % (shape1, shape2))
+    res = []
+    for s1, s2 in zip(shape1, shape2):
+        if s1 is None:
+            res.append(s2)
+        elif s2 is None or s1 == s2:
+            res.append(s1)
+        else:
+            raise ValueError("shapes %s and %s are incompatible"
+                             % (shape1, shape2))
+    return tuple(res)
+
+
+def annotate_shape(variable, shape):
+    """
+    declares the (possibly partially known) shape of a theano variable, so
+    that the shape of variables computed from it can be inferred
+
+    raises a ValueError if the shape is incompatible with what is already
+    known about the variable
+    """
+    shape = tuple(None if s is None else int(s) for s in shape)
+    if len(shape) != variable.ndim:
+        raise ValueError("shape %s doesn't match ndim=%d of variable"
+                         % (shape, variable.ndim))
+    # sparse variables don't have broadcastable dimensions
+    broadcastable = getattr(variable,
+                            "broadcastable",
+                            (False,) * variable.ndim)
+    for s, b in zip(shape, broadcastable):
+        if b and s not in (None, 1):
+            raise ValueError("shape %s has a non-1 size for a broadcastable "
+                             "dimension (broadcastable=%s)"
+                             % (shape, broadcastable))
+    known = known_shape(variable)
+    if known is not None:
+        shape = merge_shapes(known, shape)
+    setattr(variable.tag, SHAPE_TAG, shape)
+
+
+def known_shape(variable):
+    """
+    returns the shape of the variable if it can be found without looking at
+    the graph that computes it, otherwise None
+    """
+    shape = getattr(variable.tag, SHAPE_TAG, None)
+    if shape is not None:
+        return shape
+    if isinstance(variable, graph.Constant):
+        return variable.data.shape
+    if isinstance(variable, theano.compile.SharedVariable):
+        return variable.get_value(borrow=True, return_internal_type=True).shape
+    return None
+
+
+class _UnknownSize(object):
+
+    """
+    value of a size that isn't known statically, identified by the
+    variable and axis that it is the size of, so that equal unknown sizes can
+    cancel out (eg. the batch size when flattening)
+    """
+
+    def __init__(self, variable, axis):
+        self.key = (variable, axis)
+
+    def __eq__(self, other):
+        return isinstance(other, _UnknownSize) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class _PartialVector(object):
+
+    """
+    value of a vector of sizes (eg. the output of Shape) where some elements
+    are not known statically
+    """
+
+    def __init__(self, elements):
+        self.elements = elements
+
+
+def _is_known(value):
+    return (value is not None
+            and not isinstance(value, (_UnknownSize, _PartialVector)))
+
+
+def _element(value):
+    """
+    converts the value of a scalar size into an element of a _PartialVector
+    (an int, an _UnknownSize or None)
+    """
+    if isinstance(value, _UnknownSize) or value is None:
+        return value
+    if _is_known(value) and np.ndim(value) == 0:
+        return int(value)
+    return None
+
+
+def _vector(elements):
+    if all(isinstance(e, int) for e in elements):
+        return np.array(elements, dtype="int64")
+    return _PartialVector(elements)
+
+
+def _scalar(element):
+    if isinstance(element, int):
+        return np.array(element, dtype="int64")
+    return element
+
+
+def _shape_elements(variable, shape_of, values):
+    """
+    the size of each axis of an fgraph variable, as _PartialVector elements
+    """
+    known = known_shape(variable)
+    elements = []
+    for axis in range(variable.ndim):
+        element = None
+        if variable in shape_of:
+            element = _element(values[shape_of[variable][axis]])
+        if (not isinstance(element, int)
+                and known is not None
+                and known[axis] is not None):
+            element = known[axis]
+        if element is None:
+            element = _UnknownSize(variable, axis)
+        elements.append(element)
+    return elements
+
+
+def _reshape_size(in_elements, requested_elements, axis):
+    """
+    the size of the given axis of the output of a reshape, if it can be
+    known statically
+    """
+    element = requested_elements[axis]
+    if element != -1:
+        return element
+    # the size is inferred from the total size, which can be computed if the
+    # unknown sizes of the input and the rest of the output are the same
+    others = requested_elements[:axis] + requested_elements[axis + 1:]
+    if None in in_elements or None in others:
+        return None
+    numerator = [e for e in in_elements if isinstance(e, int)]
+    denominator = [e for e in others if isinstance(e, int)]
+    unknown_in = [e for e in in_elements if isinstance(e, _UnknownSize)]
+    unknown_others = [e for e in others if isinstance(e, _UnknownSize)]
+    for e in unknown_in:
+        if e not in unknown_others:
+            return None
+        unknown_others.remove(e)
+    if unknown_others:
+        return None
+    numerator = int(np.prod(numerator))
+    denominator = int(np.prod(denominator))
+    if denominator == 0 or numerator % denominator != 0:
+        return None
+    return numerator // denominator
+
+
+class _ShapeEvaluator(object):
+
+    """
+    folds the symbolic sizes computed by a ShapeFeature into constants
+    """
+
+    def __init__(self, shape_feature):
+        self.shape_of = shape_feature.shape_of
+        self.values = {}
+        # the symbolic sizes of the output of a reshape are computed from the
+        # total size, which is never known if any size is unknown, so they
+        # are special cased
+        self.reshape_sizes = {}
+        for var, dims in self.shape_of.items():
+            node = var.owner
+            if node is not None and isinstance(node.op, T.Reshape):
+                for axis, dim in enumerate(dims):
+                    self.reshape_sizes[dim] = (node, axis)
+
+    def _dependencies(self, var):
+        deps = []
+        if var in self.reshape_sizes:
+            node, _ = self.reshape_sizes[var]
+            deps += list(self.shape_of.get(node.inputs[0], ()))
+            deps.append(node.inputs[1])
+        node = var.owner
+        if node is None:
+            pass
+        elif isinstance(node.op, T.Shape):
+            deps += list(self.shape_of.get(node.inputs[0], ()))
+        elif isinstance(node.op, Shape_i):
+            dims = self.shape_of.get(node.inputs[0])
+            # if the size isn't known from the graph, its dimension is the
+            # Shape_i itself
+            if dims is not None and dims[node.op.i] is not var:
+                deps.append(dims[node.op.i])
+        else:
+            deps += list(node.inputs)
+        return deps
+
+    def _evaluate_reshape_size(self, var):
+        node, axis = self.reshape_sizes[var]
+        requested = self.values[node.inputs[1]]
+        if isinstance(requested, _PartialVector):
+            requested = requested.elements
+        elif _is_known(requested):
+            requested = [int(e) for e in requested]
+        else:
+            return None
+        in_elements = _shape_elements(node.inputs[0],
+                                      self.shape_of,
+                                      self.values)
+        return _scalar(_reshape_size(in_elements, requested, axis))
+
+    def _evaluate_node(self, var):
+        """
+        computes the value of var (and the other outputs of its apply node)
+        given the values of its dependencies, with None for unknown values
+        """
+        values = self.values
+        node = var.owner
+        if var in self.reshape_sizes:
+            value = self._evaluate_reshape_size(var)
+            if value is not None:
+                values[var] = value
+                return
+        if node is None:
+            if isinstance(var, graph.Constant):
+                values[var] = var.data
+            else:
+                values[var] = None
+            return
+        op = node.op
+        inputs = node.inputs
+        if isinstance(op, T.Shape):
+            values[var] = _vector(_shape_elements(inputs[0],
+                                                  self.shape_of,
+                                                  values))
+            return
+        if isinstance(op, Shape_i):
+            dims = self.shape_of.get(inputs[0])
+            if dims is not None and dims[op.i] is not var:
+                values[var] = values[dims[op.i]]
+            else:
+                values[var] = _scalar(_shape_elements(inputs[0],
+                                                      {},
+                                                      values)[op.i])
+            return
+        input_values = [values[i] for i in inputs]
+        if isinstance(op, theano.tensor.opt.MakeVector):
+            values[var] = _vector([_element(v) for v in input_values])
+            return
+        if (isinstance(op, T.Subtensor)
+                and isinstance(input_values[0], _PartialVector)
+                and all(_is_known(v) for v in input_values[1:])):
+            # indexing into a partially known shape (eg. x.shape[0])
+            indices = T.subtensor.get_idx_list(
+                [None] + [int(v) for v in input_values[1:]],
+                op.idx_list)
+            assert len(indices) == 1
+            res = input_values[0].elements[indices[0]]
+            if isinstance(res, list):
+                values[var] = _vector(res)
+            else:
+                values[var] = _scalar(res)
+            return
+        if all(_is_known(v) for v in input_values):
+            # constant folding with the op's python implementation
+            storage = [[None] for _ in node.outputs]
+            try:
+                op.perform(node, input_values, storage)
+            except Exception:
+                pass
+            else:
+                for out, s in zip(node.outputs, storage):
+                    values[out] = s[0]
+                return
+        for out in node.outputs:
+            values[out] = None
+
+    def evaluate(self, outputs):
+        values = self.values
+        stack = list(outputs)
+        while stack:
+            var = stack[-1]
+            if var in values:
+                stack.pop()
+                continue
+            missing = [d for d in self._dependencies(var)
+                       if d not in values]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            self._evaluate_node(var)
+        return [values[o] for o in outputs]
+
+
+def infer_shape(variable):
+    """
+    infers the shape of a theano variable from the graph that computes it,
+    using each op's infer_shape and the known shapes of the variables in the
+    graph
+
+    the sizes are folded into constants in python (with each op's perform),
+    so nothing is compiled or evaluated on actual data. unknown dimensions
+    are None
+    """
+    shape = known_shape(variable)
+    if shape is not None and None not in shape:
+        return tuple(shape)
+    if not isinstance(variable.type, T.TensorType):
+        raise ValueError("can only infer the shape of tensors, not %s"
+                         % variable.type)
+
+    # clone the graph, so that attaching the shape feature doesn't modify
+    # the original variables
+    inputs = [v for v in graph.inputs([variable])
+              if not isinstance(v, graph.Constant)]
+    fgraph = FunctionGraph(inputs, [variable], clone=True)
+    shape_feature = ShapeFeature()
+    fgraph.attach_feature(shape_feature)
+    dims = shape_feature.shape_of[fgraph.outputs[0]]
+
+    evaluator = _ShapeEvaluator(shape_feature)
+    res = tuple(int(v) if _is_known(v) else None
+                for v in evaluator.evaluate(list(dims)))
+    if shape is not None:
+        res = merge_shapes(shape, res)
+    return res
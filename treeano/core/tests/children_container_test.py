@@ -124,3 +124,32 @@ def test_nodes_and_edges_children_container():
     nt.assert_is_instance(cc2, core.NodesAndEdgesContainer)
     nt.assert_equal(as_data,
                     core.children_container_to_data(cc2))
+
+
+def test_map_children():
+    node1 = tn.IdentityNode("1")
+    node2 = tn.IdentityNode("2")
+
+    def identity(node):
+        return node
+
+    def replace(node):
+        return tn.AddConstantNode(node.name)
+
+    dccs = core.DictChildrenContainerSchema(
+        foo=core.ListChildrenContainer,
+        bar=core.ChildContainer,
+    )
+    for cc in [core.ListChildrenContainer([node1, node2]),
+               core.ChildContainer(node1),
+               core.NoneChildrenContainer(None),
+               dccs({"foo": [node1], "bar": node2}),
+               core.NodesAndEdgesContainer(([node1, node2], []))]:
+        # identity shares the container
+        nt.assert_is(cc.map_children(identity), cc)
+        res = cc.map_children(replace)
+        nt.assert_is(res.__class__, cc.__class__)
+        nt.assert_equal([n.name for n in res],
+                        [n.name for n in cc])
+        for n in res:
+            nt.assert_is_instance(n, tn.AddConstantNode)
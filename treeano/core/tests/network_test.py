@@ -1,7 +1,12 @@
 import nose.tools as nt
+import numpy as np
+import theano
+import treeano
 from treeano import core
 import treeano.nodes as tn
 
+fX = theano.config.floatX
+
 
 def test_find_hyperparameters():
     class FooNode(core.WrapperNodeImpl):
@@ -25,3 +30,54 @@ def test_find_hyperparameters():
     nt.assert_equal([10, 11, 12, 4, 5, 6, 13, 7, 8, 9],
                     list(network["top"].find_hyperparameters(["a", "b", "c"],
                                                              13)))
+
+
+def _lazy_network():
+    return tn.SGDNode(
+        "sgd",
+        {"subtree": tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(3, 4)),
+             tn.DenseNode("fc", num_units=5)]),
+         "cost": tn.TotalCostNode("cost", {
+             "pred": tn.ReferenceNode("pred_ref", reference="seq"),
+             "target": tn.InputNode("y", shape=(3, 5))},
+             cost_function=treeano.utils.squared_error)},
+        learning_rate=0.1,
+    ).network(lazy=True)
+
+
+def test_lazy_network():
+    network = _lazy_network()
+    network.build()
+    nt.assert_equal(set(), network._computed_node_names)
+    x = np.random.randn(3, 4).astype(fX)
+    fn = network.function(["x"], ["seq"])
+    nt.assert_equal((3, 5), fn(x)[0].shape)
+    # only the nodes needed for the output are computed, and no updates are
+    # created
+    nt.assert_not_in("cost", network._computed_node_names)
+    nt.assert_not_in("y", network._computed_node_names)
+    nt.assert_is_none(network._update_deltas)
+
+    y = np.random.randn(3, 5).astype(fX)
+    W, = [vw.variable
+          for vw in network["fc"].find_vws_in_subtree(tags=["weight"])]
+    W_before = W.get_value()
+    train_fn = network.function(["x", "y"], ["cost"], include_updates=True)
+    train_fn(x, y)
+    nt.assert_in("cost", network._computed_node_names)
+    nt.assert_false(np.allclose(W_before, W.get_value()))
+
+
+def test_lazy_network_same_as_eager():
+    network = _lazy_network()
+    eager_network = network.root_node.network()
+    nt.assert_false(eager_network.lazy)
+    nt.assert_equal(
+        sorted(vw.name for vw in eager_network.relative_network(
+        ).find_vws_in_subtree(tags=["parameter"])),
+        sorted(vw.name for vw in network.relative_network(
+        ).find_vws_in_subtree(tags=["parameter"])))
+    nt.assert_equal(len(eager_network.update_deltas.deltas),
+                    len(network.update_deltas.deltas))
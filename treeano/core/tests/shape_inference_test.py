@@ -0,0 +1,103 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+
+import treeano
+import treeano.nodes as tn
+from treeano.core import shape_inference
+
+fX = theano.config.floatX
+
+
+def test_merge_shapes():
+    nt.assert_equal((3, 4, 5),
+                    shape_inference.merge_shapes((3, None, 5),
+                                                 (None, 4, 5)))
+    nt.assert_raises(ValueError,
+                     shape_inference.merge_shapes,
+                     (3, 4),
+                     (3, 5))
+    nt.assert_raises(ValueError,
+                     shape_inference.merge_shapes,
+                     (3, 4),
+                     (3, 4, 5))
+
+
+def test_infer_shape():
+    x = T.matrix()
+    shape_inference.annotate_shape(x, (None, 3))
+    w = theano.shared(np.zeros((3, 5), dtype=fX))
+    nt.assert_equal((None, 5), shape_inference.infer_shape(x.dot(w)))
+    nt.assert_equal((3,), shape_inference.infer_shape(x.sum(axis=0)))
+    nt.assert_equal((None, 6),
+                    shape_inference.infer_shape(T.concatenate([x, x], axis=1)))
+    nt.assert_equal((None,), shape_inference.infer_shape(x.flatten()))
+
+
+def test_infer_shape_reshape():
+    # reshape computes its output shape from the shape of its input
+    x = T.tensor4()
+    shape_inference.annotate_shape(x, (None, 3, 4, 5))
+    nt.assert_equal((None, 60), shape_inference.infer_shape(x.flatten(2)))
+    nt.assert_equal((None, 20),
+                    shape_inference.infer_shape(
+                        x.reshape((x.shape[0] * 3, 20), ndim=2)))
+    shape_inference.annotate_shape(x, (2, 3, 4, 5))
+    nt.assert_equal((6, 20),
+                    shape_inference.infer_shape(
+                        x.reshape((x.shape[0] * 3, 20), ndim=2)))
+
+
+def test_infer_shape_does_not_modify_graph():
+    x = T.matrix()
+    shape_inference.annotate_shape(x, (2, 3))
+    y = T.exp(x)
+    nt.assert_equal((2, 3), shape_inference.infer_shape(y))
+    nt.assert_false(hasattr(y, "fgraph"))
+    nt.assert_false(hasattr(y.tag, shape_inference.SHAPE_TAG))
+
+
+def test_annotate_shape_errors():
+    nt.assert_raises(ValueError,
+                     shape_inference.annotate_shape,
+                     T.matrix(),
+                     (3,))
+    nt.assert_raises(ValueError,
+                     shape_inference.annotate_shape,
+                     T.row(),
+                     (3, 4))
+    x = T.matrix()
+    shape_inference.annotate_shape(x, (None, 4))
+    shape_inference.annotate_shape(x, (3, None))
+    nt.assert_equal((3, 4), shape_inference.known_shape(x))
+    nt.assert_raises(ValueError,
+                     shape_inference.annotate_shape,
+                     x,
+                     (5, 4))
+
+
+def test_variable_wrapper_inferred_shape():
+    i = treeano.VariableWrapper("i", variable=T.matrix(), shape=(None, 3))
+    vw = treeano.VariableWrapper("foo", variable=i.variable.sum(axis=1))
+    # the input has no test value, so this would fail if it needed to
+    # evaluate the shape
+    nt.assert_equal((None,), vw.shape)
+
+
+def test_elementwise_cost_node_shape():
+    network = tn.ElementwiseCostNode(
+        "cost",
+        {"pred": tn.InputNode("x", shape=(5, 3)),
+         "target": tn.InputNode("y", shape=(5,), dtype="int32")},
+        cost_function=treeano.utils.categorical_crossentropy_i32,
+    ).network()
+    nt.assert_equal((5,), network["cost"].get_vw("default").shape)
+
+
+@nt.raises(ValueError)
+def test_variable_wrapper_invalid_shape():
+    treeano.VariableWrapper("foo", variable=T.matrix(), shape=(3, 4, 5))
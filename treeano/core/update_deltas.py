@@ -2,10 +2,12 @@ from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
 
-import toolz
+from ..lazy_module import lazy_import
 
 from .. import utils
 
+toolz = lazy_import("toolz")
+
 
 class UpdateDeltas(object):
 
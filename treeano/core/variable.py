@@ -8,6 +8,7 @@ import theano.tensor as T
 
 from .. import utils
 from .inits import ZeroInit
+from . import shape_inference
 
 ENABLE_TEST_VALUE = theano.config.compute_test_value != "off"
 
@@ -91,6 +92,13 @@ class VariableWrapper(object):
             assert dtype == variable.dtype
         if tags is not None:
             self.verify_tags(set(tags))
+        if shape is not None and variable is not None:
+            # record the shape on the variable, so that the shapes of
+            # variables computed from it can be inferred statically
+            try:
+                shape_inference.annotate_shape(variable, shape)
+            except ValueError as e:
+                raise ValueError("invalid shape for %s: %s" % (self.name, e))
         if is_shared:
 
             assert self.inits is not None, dict(
@@ -151,7 +159,10 @@ class VariableWrapper(object):
     def broadcastable(self):
         if self.broadcastable_ is None:
             if self.variable_ is not None:
-                self.broadcastable_ = self.variable_.broadcastable
+                # sparse variables don't have broadcastable dimensions
+                self.broadcastable_ = getattr(self.variable_,
+                                              "broadcastable",
+                                              (False, ) * self.ndim)
             else:
                 self.broadcastable_ = (False, ) * self.ndim
         return self.broadcastable_
@@ -203,9 +214,9 @@ class VariableWrapper(object):
             # won't change shape (maybe we can add a flag of whether or not
             # shape doesn't change that defaults to True)
 
-            # FIXME calculate shape
-            # assert False
-            self.shape_ = tuple(self.variable_.shape.eval())
+            # infer the shape from the graph, with None for dimensions that
+            # are only known at runtime
+            self.shape_ = shape_inference.infer_shape(self.variable_)
         return self.shape_
 
     def symbolic_shape(self):
@@ -0,0 +1,105 @@
+"""
+utilities for packages whose submodules are imported on first use instead of
+when the package is imported, to reduce import time
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+
+    """
+    a module whose submodules (and names exported from them) are imported
+    on first attribute access
+
+    submodules:
+    names of submodules that can be accessed as attributes
+
+    attributes:
+    map from submodule name to the names exported from that submodule
+    """
+
+    def __init__(self, module, submodules, attributes):
+        super(LazyModule, self).__init__(module.__name__, module.__doc__)
+        # keep everything already defined in the module (including __path__
+        # and __spec__, which are needed to import submodules)
+        self.__dict__.update(module.__dict__)
+        self._lazy_submodules = tuple(submodules)
+        self._lazy_attributes = {}
+        for submodule, names in attributes.items():
+            assert submodule in self._lazy_submodules, submodule
+            for name in names:
+                assert name not in self._lazy_attributes, name
+                self._lazy_attributes[name] = submodule
+
+    def _import_submodule(self, submodule):
+        return importlib.import_module("%s.%s" % (self.__name__, submodule))
+
+    def __getattr__(self, name):
+        # only called when the attribute isn't found normally
+        if name in self._lazy_attributes:
+            module = self._import_submodule(self._lazy_attributes[name])
+            value = getattr(module, name)
+        elif name in self._lazy_submodules:
+            value = self._import_submodule(name)
+        else:
+            raise AttributeError("module %r has no attribute %r"
+                                 % (self.__name__, name))
+        # cache the value, so that __getattr__ isn't called again
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__)
+                      | set(self._lazy_submodules)
+                      | set(self._lazy_attributes))
+
+    def import_all(self):
+        """
+        imports all of the lazy submodules
+        """
+        for submodule in self._lazy_submodules:
+            getattr(self, submodule)
+
+
+def make_lazy(module_name, submodules, attributes=None):
+    """
+    replaces the already imported module with the given name with a
+    LazyModule
+
+    meant to be called at the end of a package's __init__.py:
+    make_lazy(__name__, ["foo", "bar"], {"foo": ["FooClass"]})
+    """
+    module = LazyModule(sys.modules[module_name],
+                        submodules,
+                        attributes or {})
+    sys.modules[module_name] = module
+    return module
+
+
+class _LazyImport(types.ModuleType):
+
+    """
+    placeholder for a module that is imported on first attribute access
+    """
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+        # replace the placeholder's contents with the real module's, so that
+        # __getattr__ isn't called again
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+
+def lazy_import(module_name):
+    """
+    returns a placeholder for the given module, which is imported the first
+    time one of its attributes is accessed
+
+    eg. nx = lazy_import("networkx") instead of import networkx as nx
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    return _LazyImport(module_name)
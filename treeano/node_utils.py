@@ -1,5 +1,73 @@
 from . import core
 
 
+def _uses_default_from_architecture_data(node):
+    return (node.__class__._from_architecture_data.__func__
+            is core.NodeImpl._from_architecture_data.__func__)
+
+
+def rebuild_node(node, name=None, children_container=None,
+                 hyperparameters=None):
+    """
+    returns a new node of the same class as the given node, replacing
+    the given parts of the node
+
+    parts that aren't given (including the child nodes and hyperparameter
+    values) are shared with the original node
+    """
+    assert isinstance(node, core.NodeImpl)
+    if name is None:
+        name = node.name
+    if children_container is None:
+        children_container = node._children
+    if hyperparameters is None:
+        hyperparameters = node.hyperparameters
+    if _uses_default_from_architecture_data(node):
+        # fast path: skip converting the children into data and back
+        return node.__class__(name=name,
+                              children=children_container.children,
+                              **hyperparameters)
+    else:
+        # respect custom deserialization (eg. for backwards compatibility)
+        return node._from_architecture_data(dict(
+            name=name,
+            children=core.children_container_to_data(children_container),
+            hyperparameters=hyperparameters,
+        ))
+
+
+def postwalk_node(root_node, fn):
+    """
+    applies fn to each node of a tree of nodes in a postwalk (ie. leaves
+    first), returning the transformed tree
+
+    fn is given each node with its children already transformed, and
+    should return a new node instead of mutating the one given to it:
+    nodes (and subtrees) that are unchanged are shared with the original tree
+    instead of being copied
+    """
+    def inner(node):
+        assert isinstance(node, core.NodeImpl)
+        children_container = node._children
+        new_children_container = children_container.map_children(inner)
+        if new_children_container is not children_container:
+            node = rebuild_node(node,
+                                children_container=new_children_container)
+        res = fn(node)
+        assert isinstance(res, core.NodeAPI)
+        return res
+
+    return inner(root_node)
+
+
 def copy_node(node):
-    return core.node_from_data(core.node_to_data(node))
+    """
+    returns a copy of the given tree of nodes
+
+    NOTE: hyperparameter values are shared between the copies
+    """
+    if not isinstance(node, core.NodeImpl):
+        return core.node_from_data(core.node_to_data(node))
+    return rebuild_node(
+        node,
+        children_container=node._children.map_children(copy_node))
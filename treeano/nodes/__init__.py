@@ -1,140 +1,160 @@
-from . import simple
-from . import theanode
-from . import embedding
-from . import combine
-from . import containers
-from . import activations
-from . import downsample
-from . import upsample
-from . import conv
-from . import dnn
-from . import updates
-from . import costs
-from . import stochastic
-from . import scan
-from . import composite
-from . import hyperparameter
-from . import recurrent
-from . import monitor
-from . import debug
-from . import toy
-from . import test_utils
+"""
+node modules are imported lazily, on first access of either the module or one
+of the names exported from it (eg. treeano.nodes.DenseNode), to reduce import
+time
 
-from .simple import (ReferenceNode,
-                     SendToNode,
-                     HyperparameterNode,
-                     InputNode,
-                     IdentityNode,
-                     ConstantNode,
-                     AddBiasNode,
-                     LinearMappingNode,
-                     ApplyNode,
-                     AddConstantNode,
-                     MultiplyConstantNode)
-from .theanode import (ClipNode,
-                       SwapAxesNode,
-                       SqrNode,
-                       SqrtNode,
-                       TileNode,
-                       ToOneHotNode,
-                       ReshapeNode,
-                       RepeatNode,
-                       DimshuffleNode,
-                       GradientReversalNode,
-                       ZeroGradNode,
-                       DisconnectedGradNode,
-                       MeanNode,
-                       MaxNode,
-                       SumNode,
-                       FlattenNode,
-                       AddBroadcastNode,
-                       PowNode,
-                       PadNode,
-                       CumsumNode,
-                       IndexNode)
-from .embedding import (EmbeddingNode)
-from .combine import (BaseChildrenCombineNode,
-                      BaseInputCombineNode,
-                      InputFunctionCombineNode,
-                      ConcatenateNode,
-                      ElementwiseSumNode,
-                      InputElementwiseSumNode,
-                      ElementwiseProductNode)
-from .containers import (GraphNode,
-                         SequentialNode,
-                         ContainerNode,
-                         AuxiliaryNode)
-from .activations import (BaseActivationNode,
-                          ReLUNode,
-                          TanhNode,
-                          ScaledTanhNode,
-                          SigmoidNode,
-                          SoftmaxNode,
-                          StableSoftmaxNode,
-                          SoftplusNode,
-                          ReSQRTNode,
-                          AbsNode,
-                          LeakyReLUNode,
-                          VeryLeakyReLUNode,
-                          SpatialSoftmaxNode,
-                          ELUNode)
-from .downsample import (FeaturePoolNode,
-                         MaxoutNode,
-                         Pool2DNode,
-                         MeanPool2DNode,
-                         MaxPool2DNode,
-                         SumPool2DNode,
-                         GlobalPool2DNode,
-                         GlobalMeanPool2DNode,
-                         GlobalMaxPool2DNode,
-                         GlobalSumPool2DNode,
-                         CustomPool2DNode,
-                         CustomGlobalPoolNode)
-from .upsample import (RepeatNDNode,
-                       SpatialRepeatNDNode,
-                       SparseUpsampleNode,
-                       SpatialSparseUpsampleNode)
-from .conv import (Conv2DNode,
-                   Conv3DNode,
-                   Conv3D2DNode)
-from .dnn import (DnnPoolNode,
-                  DnnMeanPoolNode,
-                  DnnMaxPoolNode,
-                  DnnConv2DNode,
-                  DnnConv3DNode,
-                  DnnConv2DWithBiasNode,
-                  DnnConv3DWithBiasNode)
-from .updates import (UpdateScaleNode,
-                      StandardUpdatesNode,
-                      SGDNode,
-                      MomentumNode,
-                      MomentumSGDNode,
-                      NesterovMomentumNode,
-                      NesterovsAcceleratedGradientNode,
-                      NAGNode,
-                      WeightDecayNode,
-                      AdamNode,
-                      AdaMaxNode,
-                      ADADELTANode,
-                      ADAGRADNode,
-                      RMSPropNode,
-                      RpropNode)
-from .costs import (AggregatorNode,
-                    ElementwiseCostNode,
-                    TotalCostNode,
-                    AuxiliaryCostNode,
-                    L2PenaltyNode)
-from .stochastic import (DropoutNode,
-                         GaussianDropoutNode,
-                         SpatialDropoutNode,
-                         GaussianSpatialDropoutNode)
-from .composite import (DenseNode,
-                        DenseCombineNode,
-                        Conv2DWithBiasNode)
-from .hyperparameter import (VariableHyperparameterNode,
-                             SharedHyperparameterNode,
-                             OutputHyperparameterNode)
-from .monitor import (MonitorVarianceNode)
-from .debug import (PrintNode)
+registered node names (for deserialization) are resolved by
+treeano.core.node_from_str, which imports the modules below if needed
+"""
 
-from .test_utils import check_serialization
+from .. import core
+from ..lazy_module import make_lazy
+
+SUBMODULES = (
+    "simple",
+    "theanode",
+    "embedding",
+    "combine",
+    "containers",
+    "activations",
+    "downsample",
+    "upsample",
+    "conv",
+    "dnn",
+    "updates",
+    "costs",
+    "stochastic",
+    "scan",
+    "composite",
+    "hyperparameter",
+    "recurrent",
+    "monitor",
+    "debug",
+    "toy",
+    "test_utils",
+)
+
+EXPORTS = dict(
+    simple=("ReferenceNode",
+            "SendToNode",
+            "HyperparameterNode",
+            "InputNode",
+            "SparseInputNode",
+            "IdentityNode",
+            "ConstantNode",
+            "AddBiasNode",
+            "LinearMappingNode",
+            "ApplyNode",
+            "AddConstantNode",
+            "MultiplyConstantNode"),
+    theanode=("ClipNode",
+              "SwapAxesNode",
+              "SqrNode",
+              "SqrtNode",
+              "TileNode",
+              "ToOneHotNode",
+              "ReshapeNode",
+              "RepeatNode",
+              "DimshuffleNode",
+              "GradientReversalNode",
+              "ZeroGradNode",
+              "DisconnectedGradNode",
+              "MeanNode",
+              "MaxNode",
+              "SumNode",
+              "FlattenNode",
+              "AddBroadcastNode",
+              "PowNode",
+              "PadNode",
+              "CumsumNode",
+              "IndexNode"),
+    embedding=("EmbeddingNode",),
+    combine=("BaseChildrenCombineNode",
+             "BaseInputCombineNode",
+             "InputFunctionCombineNode",
+             "ConcatenateNode",
+             "ElementwiseSumNode",
+             "InputElementwiseSumNode",
+             "ElementwiseProductNode"),
+    containers=("GraphNode",
+                "SequentialNode",
+                "ContainerNode",
+                "AuxiliaryNode"),
+    activations=("BaseActivationNode",
+                 "ReLUNode",
+                 "TanhNode",
+                 "ScaledTanhNode",
+                 "SigmoidNode",
+                 "SoftmaxNode",
+                 "StableSoftmaxNode",
+                 "SoftplusNode",
+                 "ReSQRTNode",
+                 "AbsNode",
+                 "LeakyReLUNode",
+                 "VeryLeakyReLUNode",
+                 "SpatialSoftmaxNode",
+                 "ELUNode"),
+    downsample=("FeaturePoolNode",
+                "MaxoutNode",
+                "Pool2DNode",
+                "MeanPool2DNode",
+                "MaxPool2DNode",
+                "SumPool2DNode",
+                "GlobalPool2DNode",
+                "GlobalMeanPool2DNode",
+                "GlobalMaxPool2DNode",
+                "GlobalSumPool2DNode",
+                "CustomPool2DNode",
+                "CustomGlobalPoolNode"),
+    upsample=("RepeatNDNode",
+              "SpatialRepeatNDNode",
+              "SparseUpsampleNode",
+              "SpatialSparseUpsampleNode"),
+    conv=("Conv2DNode",
+          "Conv3DNode",
+          "Conv3D2DNode"),
+    dnn=("DnnPoolNode",
+         "DnnMeanPoolNode",
+         "DnnMaxPoolNode",
+         "DnnConv2DNode",
+         "DnnConv3DNode",
+         "DnnConv2DWithBiasNode",
+         "DnnConv3DWithBiasNode"),
+    updates=("UpdateScaleNode",
+             "StandardUpdatesNode",
+             "SGDNode",
+             "MomentumNode",
+             "MomentumSGDNode",
+             "NesterovMomentumNode",
+             "NesterovsAcceleratedGradientNode",
+             "NAGNode",
+             "WeightDecayNode",
+             "AdamNode",
+             "AdaMaxNode",
+             "ADADELTANode",
+             "ADAGRADNode",
+             "RMSPropNode",
+             "RpropNode"),
+    costs=("AggregatorNode",
+           "ElementwiseCostNode",
+           "TotalCostNode",
+           "AuxiliaryCostNode",
+           "L2PenaltyNode"),
+    stochastic=("DropoutNode",
+                "GaussianDropoutNode",
+                "SpatialDropoutNode",
+                "GaussianSpatialDropoutNode"),
+    composite=("DenseNode",
+               "DenseCombineNode",
+               "Conv2DWithBiasNode"),
+    hyperparameter=("VariableHyperparameterNode",
+                    "SharedHyperparameterNode",
+                    "OutputHyperparameterNode"),
+    monitor=("MonitorVarianceNode",),
+    debug=("PrintNode",),
+    test_utils=("check_serialization",),
+)
+
+make_lazy(__name__, SUBMODULES, EXPORTS)
+core.serialization_state.register_lazy_node_modules(
+    [__name__ + "." + submodule for submodule in SUBMODULES])
@@ -187,6 +187,8 @@ class Conv3DNode(core.NodeImpl):
                          W=W.dimshuffle(0, 2, 3, 4, 1),
                          b=b,
                          d=stride)
+        # and returns the output with channels last
+        out_var = out_var.dimshuffle(0, 4, 1, 2, 3)
 
         out_shape = conv_output_shape(input_shape=in_vw.shape,
                                       num_filters=num_filters,
@@ -255,6 +257,8 @@ class Conv3D2DNode(core.NodeImpl):
                          # if isinstance(border_mode, str), so we manually
                          # cast as a string
                          border_mode=str("valid"))
+        # and returns the output in the same order as the signals
+        out_var = out_var.dimshuffle(*order)
 
         out_shape = conv_output_shape(input_shape=in_vw.shape,
                                       num_filters=num_filters,
@@ -78,10 +78,12 @@ class ElementwiseCostNode(core.WrapperNodeImpl):
         cost_function = network.find_hyperparameter(["cost_function"])
         out_var = weight.variable * cost_function(pred.variable,
                                                   target.variable)
+        # the cost function may reduce some axes (eg. categorical
+        # crossentropy with integer targets), so the shape is inferred from
+        # the graph instead of copied from pred
         network.create_vw(
             "default",
             variable=out_var,
-            shape=pred.shape,
             tags={"output"}
         )
 
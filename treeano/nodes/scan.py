@@ -12,6 +12,45 @@ from .. import core
 from .. import utils
 
 
+def loop_invariants(outputs, variant_inputs):
+    """
+    returns the largest subexpressions of outputs that don't depend on
+    variant_inputs (eg. the inputs and states of a step of a scan), so that
+    they can be computed once and passed in as non-sequences instead of
+    being captured by the scan implicitly
+
+    expressions that depend on random number generators (shared variables
+    with a default_update) are considered variant, so that each step gets
+    new random numbers
+    """
+    inputs = theano.gof.graph.inputs(outputs)
+    variant = set(variant_inputs)
+    variant.update(v for v in inputs if hasattr(v, "default_update"))
+    # expressions of constants are left to constant folding
+    constant = set(v for v in inputs if isinstance(v, theano.Constant))
+    invariants = []
+    seen = set()
+    for apply_node in theano.gof.graph.io_toposort(inputs, outputs):
+        if all(v in constant for v in apply_node.inputs):
+            constant.update(apply_node.outputs)
+        if not any(v in variant for v in apply_node.inputs):
+            continue
+        variant.update(apply_node.outputs)
+        for v in apply_node.inputs:
+            if v not in variant and v not in constant and v not in seen:
+                seen.add(v)
+                invariants.append(v)
+    return invariants
+
+
+def _kept_state_name(state_node_name):
+    return "kept_state(%s)" % state_node_name
+
+
+def _final_state_name(state_node_name):
+    return "final_state(%s)" % state_node_name
+
+
 @core.register_node("scan_input")
 class ScanInputNode(core.NodeImpl):
 
@@ -110,9 +149,38 @@ class ScanNode(core.Wrapper1NodeImpl):
     """
     root node for a scan operation. transforms an element-wise child subtree
     into a sequence-wise subtree, taking into account ScanStateNode's
+
+    the loop invariant parts of the subtree (eg. parameters, or their
+    transposes) are computed once and passed to theano.scan as
+    non-sequences
+
+    truncate_gradient:
+    number of steps to backpropagate through (as in theano.scan), defaults
+    to -1 (the whole sequence)
+
+    scan_unroll:
+    whether to build the graph of every step instead of using theano.scan
+    (defaults to False), which can be faster for short sequences. the size
+    of the graph is linear in the length of the sequence, but compilation
+    time is superlinear, so this is only useful for a few steps (eg. <= 10).
+    requires a known sequence length and no random number generators in the
+    subtree
+
+    stateful:
+    whether the final states of the ScanStateNode's are kept in shared
+    variables between calls and used as the initial states of the next
+    call (instead of the initial state of each ScanStateNode), so that a
+    long sequence can be processed one chunk at a time (eg. for streaming
+    inference, or truncated backpropagation through time across chunks).
+    the states must have fully known shapes, start at 0, and are updated
+    with the update deltas of the network (so functions need to include
+    updates) - see reset_scan_states
     """
 
-    hyperparameter_names = ("scan_axis", )
+    hyperparameter_names = ("scan_axis",
+                            "truncate_gradient",
+                            "scan_unroll",
+                            "stateful")
     input_keys = ("default", "final_child_output",)
 
     def __init__(self, name, *args, **kwargs):
@@ -200,6 +268,7 @@ class ScanNode(core.Wrapper1NodeImpl):
         # finding initial states
         scan_state_initial_vws = [net.get_vw("initial_state")
                                   for net in scan_state_networks]
+        stateful = network.find_hyperparameter(["stateful"], False)
         # updates outputs_info to contain initial state
         for idx, node, init_vw, next_vw in zip(scan_state_idxs,
                                                scan_state_nodes,
@@ -217,18 +286,37 @@ class ScanNode(core.Wrapper1NodeImpl):
                 init_vw=init_vw,
                 next_vw=next_vw,
             )
+            if stateful:
+                assert None not in init_vw.shape, dict(
+                    msg="stateful scans need states with known shapes",
+                    node=node,
+                    init_shape=init_vw.shape,
+                )
+                # the initial state is the final state of the previous call
+                init_vw = network.create_vw(
+                    name=_kept_state_name(node.name),
+                    is_shared=True,
+                    shape=init_vw.shape,
+                    dtype=init_vw.dtype,
+                    broadcastable=init_vw.broadcastable,
+                    tags={"state"},
+                    inits=[core.inits.ZeroInit()],
+                )
             outputs_info[idx] = init_vw.variable
 
         # ############################## non_sequences ########################
         # ---
-        # for now, don't specify any non-sequences and hope that theano
-        # can optimize the graph
-        non_sequence_vars = []
-        non_sequences = []
+        # the invariant parts of the step are hoisted out of the loop, and
+        # replaced in the step by scan's non-sequence arguments
+        non_sequence_vars = loop_invariants(
+            element_output_vars,
+            element_input_vars + scan_state_vars)
+        non_sequences = list(non_sequence_vars)
 
         # ################################### scan ############################
 
-        def step(*scan_vars):
+        def step(*scan_vars, **kwargs):
+            clone = kwargs.get("clone", utils.deep_clone)
             # calculate number for each type of scan var
             num_inputs = len(input_sequences)
             num_outputs = len([x for x in outputs_info if x is not None])
@@ -261,7 +349,7 @@ class ScanNode(core.Wrapper1NodeImpl):
             assert len(to_replace) == len(for_replace)
 
             # perform scan
-            new_outputs = utils.deep_clone(
+            new_outputs = clone(
                 element_output_vars,
                 replace=dict(zip(to_replace, for_replace)),
             )
@@ -275,13 +363,30 @@ class ScanNode(core.Wrapper1NodeImpl):
 
             return final_outputs
 
-        # edit all outputs of subtree
-        results, updates = theano.scan(
-            fn=step,
-            outputs_info=outputs_info,
-            sequences=input_sequences,
-            non_sequences=non_sequences,
-        )
+        truncate_gradient = network.find_hyperparameter(["truncate_gradient"],
+                                                        -1)
+        if network.find_hyperparameter(["scan_unroll"], False):
+            assert not any(
+                hasattr(v, "default_update")
+                for v in theano.gof.graph.inputs(element_output_vars)), \
+                "random number generators would be shared by unrolled steps"
+            results = _unrolled_scan(
+                step=step,
+                outputs_info=outputs_info,
+                sequences=input_sequences,
+                non_sequences=non_sequences,
+                truncate_gradient=truncate_gradient,
+                length=sequence_input.shape[scan_axis],
+            )
+        else:
+            # edit all outputs of subtree
+            results, updates = theano.scan(
+                fn=step,
+                outputs_info=outputs_info,
+                sequences=input_sequences,
+                non_sequences=non_sequences,
+                truncate_gradient=truncate_gradient,
+            )
 
         # ############################# post-processing #######################
 
@@ -291,6 +396,17 @@ class ScanNode(core.Wrapper1NodeImpl):
         assert len(results) == len(element_output_vars)
         result_map = dict(zip(element_output_vars, results))
 
+        if stateful:
+            # keep the state after the last step, for new_update_deltas
+            for idx, node, next_vw in zip(scan_state_idxs,
+                                          scan_state_nodes,
+                                          scan_state_next_vws):
+                network.create_vw(
+                    name=_final_state_name(node.name),
+                    variable=results[idx][-1],
+                    shape=next_vw.shape,
+                )
+
         # TODO store updates in network (to later be used in new_update_deltas)
         # NOTE: before doing this, look into the effects of manipulating the
         # update deltas of random variables - it might not work as expected
@@ -299,7 +415,8 @@ class ScanNode(core.Wrapper1NodeImpl):
 
         def transform_shape(old_shape):
             tmp = list(old_shape)
-            tmp.insert(scan_axis, None)
+            # the output has the same length as the input sequence
+            tmp.insert(scan_axis, sequence_input.shape[scan_axis])
             # FIXME what if length is < scan_axis
             return tuple(tmp)
 
@@ -315,3 +432,75 @@ class ScanNode(core.Wrapper1NodeImpl):
             variable=transform_output(result_map[element_output.variable]),
             shape=transform_shape(element_output.shape),
         )
+
+    def new_update_deltas(self, network):
+        if not network.find_hyperparameter(["stateful"], False):
+            return super(ScanNode, self).new_update_deltas(network)
+        deltas = {}
+        for node in network.find_nodes_in_subtree(ScanStateNode):
+            kept = network.get_vw(_kept_state_name(node.name)).variable
+            final = network.get_vw(_final_state_name(node.name)).variable
+            deltas[kept] = final - kept
+        return core.UpdateDeltas(deltas)
+
+
+def _clone_sharing_replacements(outputs, replace):
+    """
+    like theano.clone, but without copying the graphs of the replacements
+    (so that chaining the steps of an unrolled scan doesn't copy all of the
+    previous steps at each step)
+    """
+    memo = theano.gof.graph.clone_get_equiv(
+        theano.gof.graph.inputs(outputs),
+        outputs,
+        copy_inputs_and_orphans=False,
+        memo=dict(replace))
+    return [memo[output] for output in outputs]
+
+
+def _unrolled_scan(step,
+                   outputs_info,
+                   sequences,
+                   non_sequences,
+                   truncate_gradient,
+                   length):
+    """
+    theano.scan with the graph of each step built explicitly
+    """
+    assert length is not None, "unrolling needs a known sequence length"
+    assert length >= 1
+    state_idxs = [idx for idx, info in enumerate(outputs_info)
+                  if info is not None]
+    states = [outputs_info[idx] for idx in state_idxs]
+    steps = []
+    for t in range(length):
+        outputs = step(*([seq[t] for seq in sequences]
+                         + states
+                         + non_sequences),
+                       clone=_clone_sharing_replacements)
+        if truncate_gradient != -1 and t < length - truncate_gradient:
+            # like theano.scan, only backpropagate through the last steps
+            outputs = [theano.gradient.disconnected_grad(output)
+                       for output in outputs]
+        states = [outputs[idx] for idx in state_idxs]
+        steps.append(outputs)
+    return [theano.tensor.stack([outputs[idx] for outputs in steps])
+            for idx in range(len(outputs_info))]
+
+
+def reset_scan_states(network):
+    """
+    sets the kept states of the stateful ScanNode's in a network back to 0
+    (eg. before the first chunk of a new sequence)
+    """
+    if not network.is_relative():
+        network = network.relative_network()
+    for node in network.find_nodes_in_subtree(ScanNode):
+        scan_network = network[node.name]
+        if not scan_network.find_hyperparameter(["stateful"], False):
+            continue
+        for state_node in scan_network.find_nodes_in_subtree(ScanStateNode):
+            kept = scan_network.get_vw(_kept_state_name(state_node.name))
+            value = kept.variable.get_value()
+            value[...] = 0
+            kept.variable.set_value(value)
@@ -105,6 +105,46 @@ class InputNode(core.NodeImpl):
         )
 
 
+@core.register_node("sparse_input")
+class SparseInputNode(core.NodeImpl):
+
+    """
+    an entry point into the network for a sparse matrix (eg. a scipy.sparse
+    csr_matrix of bag-of-words features), to avoid densifying it
+
+    the only nodes that take sparse inputs are LinearMappingNode (and
+    DenseNode), which use a structured dot product
+
+    sparse_format:
+    "csr" (default) or "csc"
+    """
+
+    hyperparameter_names = ("input_shape",
+                            "shape",
+                            "input_dtype",
+                            "dtype",
+                            "sparse_format")
+    input_keys = ()
+
+    def compute_output(self, network):
+        import theano.sparse
+        shape = network.find_hyperparameter(["input_shape", "shape"])
+        assert len(shape) == 2, shape
+        dtype = network.find_hyperparameter(["input_dtype", "dtype"],
+                                            theano.config.floatX)
+        sparse_format = network.find_hyperparameter(["sparse_format"], "csr")
+        sparse_type = theano.sparse.SparseType(format=sparse_format,
+                                               dtype=dtype)
+        variable = sparse_type(self.name + ":default")
+        network.create_vw(
+            name="default",
+            variable=variable,
+            shape=shape,
+            is_shared=False,
+            tags=["input"],
+        )
+
+
 @core.register_node("identity")
 class IdentityNode(core.NodeImpl):
 
@@ -213,6 +253,9 @@ class LinearMappingNode(core.NodeImpl):
     """
     node that applies a linear mapping to the last dimension of its input
     (a dot product with a parameter)
+
+    sparse matrix inputs (see SparseInputNode) use a structured dot product,
+    which has a dense output
     """
 
     hyperparameter_names = ("linear_mapping_inits",
@@ -231,9 +274,14 @@ class LinearMappingNode(core.NodeImpl):
             default_inits=[],
             default_inits_hyperparameters=["linear_mapping_inits", "inits"]
         )
+        if utils.is_sparse_variable(in_vw.variable):
+            import theano.sparse
+            out_var = theano.sparse.structured_dot(in_vw.variable, W.variable)
+        else:
+            out_var = T.dot(in_vw.variable, W.variable)
         network.create_vw(
             name="default",
-            variable=T.dot(in_vw.variable, W.variable),
+            variable=out_var,
             shape=output_shape,
             tags={"output"},
         )
@@ -27,3 +27,16 @@ def test_conv_parse_pad():
 
 def test_conv_2d_node_serialization():
     tn.check_serialization(tn.Conv2DNode("a"))
+
+
+def test_conv_3d_nodes_output_shape():
+    for node_cls in [tn.Conv3DNode, tn.Conv3D2DNode]:
+        network = tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(2, 2, 5, 6, 7)),
+             node_cls("c", num_filters=3, filter_size=(2, 3, 2))]
+        ).network()
+        fn = network.function(["i"], ["s"])
+        x = np.random.randn(2, 2, 5, 6, 7).astype(fX)
+        nt.assert_equal(network["s"].get_vw("default").shape,
+                        fn(x)[0].shape)
@@ -3,6 +3,7 @@ import numpy as np
 import theano
 import theano.tensor as T
 
+import treeano
 from treeano import nodes
 
 fX = theano.config.floatX
@@ -33,3 +34,75 @@ def test_simple_recurrent_node():
     res = fn(x)[0]
     # 3 = scan axis, 4 = batch axis, 35 = num output units
     nt.assert_equal(res.shape, (3, 4, 35))
+
+
+def _simple_recurrent_network(length=None, **kwargs):
+    return nodes.HyperparameterNode(
+        "hp",
+        nodes.SequentialNode(
+            "n",
+            [nodes.InputNode("in", shape=(length, 2, 3)),
+             nodes.recurrent.SimpleRecurrentNode("srn",
+                                                 nodes.TanhNode("tanh"),
+                                                 batch_size=2,
+                                                 num_units=4,
+                                                 scan_axis=0)]),
+        inits=[treeano.inits.NormalWeightInit(0.5)],
+        **kwargs
+    ).network()
+
+
+def test_simple_recurrent_node_truncate_gradient():
+    def input_grad(truncate_gradient):
+        # same weights for both networks
+        np.random.seed(42)
+        network = _simple_recurrent_network(
+            truncate_gradient=truncate_gradient)
+        in_var = network["in"].get_vw("default").variable
+        out_var = network["n"].get_vw("default").variable
+        grad = T.grad(out_var[-1].sum(), in_var)
+        return network.function(["in"], [grad])(x)[0]
+
+    x = np.random.randn(5, 2, 3).astype(fX)
+    full = input_grad(-1)
+    truncated = input_grad(2)
+    # only the last 2 steps are backpropagated through
+    np.testing.assert_equal(0, truncated[:3])
+    assert np.abs(full[:3]).sum() > 0
+    np.testing.assert_allclose(full[3:], truncated[3:], rtol=1e-5)
+
+
+def test_simple_recurrent_node_stateful():
+    x = np.random.randn(6, 2, 3).astype(fX)
+    network = _simple_recurrent_network(stateful=True)
+    fn = network.function(["in"], ["n"], include_updates=True)
+    # the kept state starts at 0, like the initial state
+    expected = fn(x)[0]
+    nodes.scan.reset_scan_states(network)
+    # processing the sequence one chunk at a time
+    chunks = [fn(x[:2])[0], fn(x[2:3])[0], fn(x[3:])[0]]
+    np.testing.assert_allclose(expected,
+                               np.concatenate(chunks),
+                               rtol=1e-5)
+    # without resetting, the state carries over to the next call
+    assert not np.allclose(expected[:2], fn(x[:2])[0])
+
+
+def test_simple_recurrent_node_unroll():
+    x = np.random.randn(5, 2, 3).astype(fX)
+
+    def outputs_and_grad(**kwargs):
+        # same weights for all networks
+        np.random.seed(42)
+        network = _simple_recurrent_network(length=5, **kwargs)
+        in_var = network["in"].get_vw("default").variable
+        out_var = network["n"].get_vw("default").variable
+        grad = T.grad(out_var[-1].sum(), in_var)
+        return network.function(["in"], [out_var, grad])(x)
+
+    for truncate_gradient in [-1, 2]:
+        scanned = outputs_and_grad(truncate_gradient=truncate_gradient)
+        unrolled = outputs_and_grad(truncate_gradient=truncate_gradient,
+                                    scan_unroll=True)
+        for s_res, u_res in zip(scanned, unrolled):
+            np.testing.assert_allclose(s_res, u_res, rtol=1e-5, atol=1e-7)
@@ -1,6 +1,10 @@
+import nose.tools as nt
 import numpy as np
 import theano
+import theano.tensor as T
+from theano.sandbox.rng_mrg import MRG_RandomStreams
 import treeano
+from treeano.nodes import scan
 from treeano.nodes.scan import ScanNode
 
 floatX = theano.config.floatX
@@ -31,3 +35,16 @@ def test_basic_scan():
     x = np.random.rand(3, 2, 1).astype(floatX)
     np.testing.assert_allclose(fn(x)[0],
                                2 * x)
+
+
+def test_loop_invariants():
+    x = T.matrix("x")
+    W = theano.shared(np.zeros((3, 4), dtype=floatX), name="W")
+    b = theano.shared(np.zeros((3,), dtype=floatX), name="b")
+    W_T = W.T
+    b_row = b.dimshuffle("x", 0)
+    out = T.dot(x, W_T) + b_row
+    nt.assert_equal([W_T, b_row], scan.loop_invariants([out], [x]))
+    # random numbers are computed at each step
+    mask = MRG_RandomStreams().uniform((3,)) * 2
+    nt.assert_equal([W_T], scan.loop_invariants([T.dot(x, W_T) * mask], [x]))
@@ -2,6 +2,7 @@ import copy
 
 import nose.tools as nt
 import numpy as np
+import scipy.sparse
 import theano
 import theano.tensor as T
 
@@ -37,6 +38,10 @@ def test_add_bias_node_serialization():
         broadcastable=[True, False, True]))
 
 
+def test_sparse_input_node_serialization():
+    tn.check_serialization(tn.SparseInputNode("a"))
+
+
 def test_linear_mapping_node_serialization():
     tn.check_serialization(tn.LinearMappingNode("a"))
     tn.check_serialization(tn.LinearMappingNode("a", output_dim=3))
@@ -199,6 +204,33 @@ def test_linear_mapping_node():
     np.testing.assert_allclose(np.dot(x, W), fn(x)[0], rtol=1e-4, atol=1e-7)
 
 
+def test_linear_mapping_node_sparse():
+    for sparse_format in ["csr", "csc"]:
+        network = tn.SequentialNode("s", [
+            tn.SparseInputNode("in",
+                               shape=(None, 20),
+                               sparse_format=sparse_format),
+            tn.LinearMappingNode("linear", output_dim=6),
+        ]).network()
+        W = np.random.randn(20, 6).astype(fX)
+        network["linear"].get_vw("weight").value = W
+        nt.assert_equal((None, 6), network["s"].get_vw("default").shape)
+        fn = network.function(["in"], ["s"])
+        x = scipy.sparse.random(7, 20, density=0.2, format=sparse_format,
+                                dtype=fX)
+        np.testing.assert_allclose(x.dot(W), fn(x)[0], rtol=1e-5)
+        # the weight gets a gradient through the structured dot
+        grad = T.grad(network["s"].get_vw("default").variable.sum(),
+                      network["linear"].get_vw("weight").variable)
+        grad_fn = theano.function(
+            [network["in"].get_vw("default").variable],
+            grad)
+        np.testing.assert_allclose(
+            np.asarray(x.sum(axis=0)).T * np.ones((1, 6)),
+            grad_fn(x),
+            rtol=1e-5)
+
+
 def test_apply_node():
     network = tn.SequentialNode("s", [
         tn.InputNode("in", shape=(3, 4, 5)),
@@ -0,0 +1,104 @@
+"""
+gradient checkpointing for deep sequential models: the activations inside
+a CheckpointNode are freed after the forward pass and recomputed from the
+input of the node during the backward pass, so only the activations at
+the boundaries of the checkpointed segments are kept
+
+eg. wrapping each block of a resnet:
+  tn.SequentialNode("seq", [checkpoint.CheckpointNode(
+      "checkpoint_%d" % i,
+      resnet.residual_block_conv_2d("block_%d" % i, ...))
+      for i in range(num_blocks)])
+
+trades memory for (about one forward pass of) extra computation, and
+stops theano from optimizing across the boundaries of the segments (see
+treeano.theano_extensions.checkpoint)
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import theano
+from theano.compile import SharedVariable
+import treeano
+from treeano.theano_extensions import checkpoint
+
+
+def _depends_on(var, inputs):
+    return any(v in inputs for v in theano.gof.graph.ancestors([var],
+                                                               inputs))
+
+
+@treeano.register_node("checkpoint")
+class CheckpointNode(treeano.Wrapper1NodeImpl):
+
+    """
+    computes its child as a single op, whose intermediate variables are
+    recomputed for the gradient
+
+    variables of the subtree without the batch axis (ie. with a known shape
+    whose size along axis 0 isn't the batch size, eg. batch normalization
+    statistics) are also outputs of the op, so that using them (eg. in
+    update deltas or monitors) doesn't recompute the segment
+
+    NOTE: the child can't use random variables (eg. dropout), since they
+    would be different when recomputed
+
+    checkpoint:
+    whether to checkpoint the child (defaults to True), so that
+    checkpointing can be turned off without changing the architecture
+    """
+
+    hyperparameter_names = ("checkpoint",)
+    input_keys = ("default",) + treeano.Wrapper1NodeImpl.input_keys
+
+    def compute_output(self, network, in_vw, child_vw):
+        if not network.find_hyperparameter(["checkpoint"], True):
+            network.copy_vw(
+                name="default",
+                previous_vw=child_vw,
+                tags={"output"},
+            )
+            return
+
+        in_var = in_vw.variable
+        out_var = child_vw.variable
+        batch_size = in_vw.shape[0]
+        # small variables of the subtree that are computed in the segment
+        extra_vws = [
+            vw for vw in network.find_vws_in_subtree(is_shared=False)
+            if (None not in vw.shape
+                and (vw.ndim == 0 or vw.shape[0] != batch_size)
+                and vw.variable is not out_var
+                and _depends_on(vw.variable, [in_var]))]
+        extra_vars = []
+        for vw in extra_vws:
+            if vw.variable not in extra_vars:
+                extra_vars.append(vw.variable)
+        outputs = [out_var] + extra_vars
+
+        # the segment can depend on variables other than the input of the
+        # node (eg. outputs of referenced nodes)
+        inputs = [in_var] + [
+            var for var in theano.gof.graph.inputs(outputs, [in_var])
+            if not (var is in_var
+                    or isinstance(var, (SharedVariable, theano.Constant)))]
+        new_outputs = checkpoint.checkpoint(inputs, outputs)
+
+        replacements = dict(zip(extra_vars, new_outputs[1:]))
+        for vw in extra_vws:
+            node_name, vw_name = vw.name.split(":", 1)
+            network[node_name].replace_variable(
+                vw_name,
+                treeano.VariableWrapper(
+                    vw.name,
+                    variable=replacements[vw.variable],
+                    shape=vw.shape,
+                    tags=vw.tags,
+                ))
+        network.create_vw(
+            "default",
+            variable=new_outputs[0],
+            shape=child_vw.shape,
+            tags={"output"},
+        )
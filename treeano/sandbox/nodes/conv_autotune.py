@@ -0,0 +1,355 @@
+"""
+convolution nodes that time the available cpu implementations for the
+shapes of each convolution, and use the fastest one
+
+the decisions (and the timings that they were based on) are cached in a
+json file, so that each distinct convolution is only timed once across runs
+
+NOTE: theano doesn't have fft convolutions on the cpu, so only the
+implementations below are compared
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import collections
+import json
+import os
+import time
+
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+
+fX = theano.config.floatX
+
+DEFAULT_CACHE_PATH = os.path.join("~", ".treeano", "conv_autotune.json")
+
+# map from number of spatial dimensions to map from name to
+# (conv function, function returning whether the implementation supports
+# the given stride and pad)
+IMPLEMENTATIONS = {2: collections.OrderedDict(),
+                   3: collections.OrderedDict()}
+
+
+def register_implementation(ndim, name, supports=lambda stride, pad: True):
+    """
+    registers a function that computes a convolution (flipping the filters,
+    like theano.tensor.nnet.conv2d) given
+    (input, filters, input_shape, filter_shape, stride, pad), with pad
+    given as a number for each spatial dimension
+    """
+    def inner(fn):
+        assert name not in IMPLEMENTATIONS[ndim]
+        IMPLEMENTATIONS[ndim][name] = (fn, supports)
+        return fn
+
+    return inner
+
+
+def _pad_input(in_var, input_shape, pad):
+    """
+    explicitly zero pads the spatial axes of the input, for implementations
+    that only support valid convolutions
+    """
+    if not any(pad):
+        return in_var, input_shape
+    padded_shape = tuple(input_shape[:2]) + tuple(
+        None if s is None else s + 2 * p
+        for s, p in zip(input_shape[2:], pad))
+    shape = [in_var.shape[axis] for axis in range(in_var.ndim)]
+    for axis, p in enumerate(pad):
+        shape[axis + 2] += 2 * p
+    slices = [slice(None), slice(None)] + [slice(p, -p if p else None)
+                                           for p in pad]
+    padded = T.set_subtensor(T.zeros(shape, dtype=in_var.dtype)[slices],
+                             in_var)
+    return padded, padded_shape
+
+
+@register_implementation(2, "corrmm")
+def _corrmm_2d(in_var, W, input_shape, filter_shape, stride, pad):
+    # uses im2col + gemm (CorrMM) on the cpu
+    return T.nnet.conv2d(input=in_var,
+                         filters=W,
+                         input_shape=input_shape,
+                         filter_shape=filter_shape,
+                         border_mode=pad,
+                         subsample=stride)
+
+
+@register_implementation(2, "direct")
+def _direct_2d(in_var, W, input_shape, filter_shape, stride, pad):
+    # the original theano convolution op (ConvOp), which only supports
+    # valid and full convolutions
+    from theano.tensor.nnet import conv
+    in_var, input_shape = _pad_input(in_var, input_shape, pad)
+    return conv.conv2d(input=in_var,
+                       filters=W,
+                       image_shape=input_shape,
+                       filter_shape=filter_shape,
+                       border_mode="valid",
+                       subsample=stride)
+
+
+@register_implementation(3, "conv3d")
+def _conv3d(in_var, W, input_shape, filter_shape, stride, pad):
+    from theano.tensor.nnet.Conv3D import conv3D
+    in_var, input_shape = _pad_input(in_var, input_shape, pad)
+    # Conv3D computes a correlation with channels last
+    out_var = conv3D(V=in_var.dimshuffle(0, 2, 3, 4, 1),
+                     W=W[:, :, ::-1, ::-1, ::-1].dimshuffle(0, 2, 3, 4, 1),
+                     b=T.zeros((filter_shape[0],), dtype=W.dtype),
+                     d=stride)
+    return out_var.dimshuffle(0, 4, 1, 2, 3)
+
+
+@register_implementation(3,
+                         "conv3d2d",
+                         supports=lambda stride, pad: stride == (1, 1, 1))
+def _conv3d2d(in_var, W, input_shape, filter_shape, stride, pad):
+    from theano.tensor.nnet.conv3d2d import conv3d
+    in_var, input_shape = _pad_input(in_var, input_shape, pad)
+    # takes (batch, time, channels, row, column)
+    order = (0, 2, 1, 3, 4)
+    if None in input_shape:
+        # conv3d only supports fully known shapes
+        signals_shape = None
+    else:
+        signals_shape = [input_shape[o] for o in order]
+    out_var = conv3d(signals=in_var.dimshuffle(*order),
+                     filters=W.dimshuffle(*order),
+                     signals_shape=signals_shape,
+                     filters_shape=[filter_shape[o] for o in order],
+                     border_mode=str("valid"))
+    return out_var.dimshuffle(*order)
+
+
+def _cache_key(input_shape, filter_shape, stride, pad):
+    return "|".join([fX,
+                     "x".join(map(str, input_shape)),
+                     "x".join(map(str, filter_shape)),
+                     "x".join(map(str, stride)),
+                     "x".join(map(str, pad))])
+
+
+# map from cache path to cache contents, so that the file is only read once
+_CACHES = {}
+
+
+def load_cache(path=None):
+    """
+    returns the map from convolution key to
+    {"times": {implementation: seconds}, "choice": implementation}
+    """
+    path = os.path.expanduser(path or DEFAULT_CACHE_PATH)
+    if path not in _CACHES:
+        if os.path.exists(path):
+            with open(path) as f:
+                _CACHES[path] = json.load(f)
+        else:
+            _CACHES[path] = {}
+    return _CACHES[path]
+
+
+def _save_cache(path=None):
+    path = os.path.expanduser(path or DEFAULT_CACHE_PATH)
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    # write to a temporary file so that the cache is never partially
+    # written
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_CACHES[path], f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def time_implementations(input_shape,
+                         filter_shape,
+                         stride,
+                         pad,
+                         num_runs=3):
+    """
+    returns a map from the name of each supported implementation to the
+    time (in seconds) of the forward and backward pass of a convolution
+    with the given shapes
+    """
+    ndim = len(filter_shape) - 2
+    in_var = T.TensorType(fX, (False,) * len(input_shape))("x")
+    W = T.TensorType(fX, (False,) * len(filter_shape))("W")
+    x_val = np.random.randn(*input_shape).astype(fX)
+    W_val = np.random.randn(*filter_shape).astype(fX)
+    times = {}
+    for name, (conv_fn, supports) in IMPLEMENTATIONS[ndim].items():
+        if not supports(stride, pad):
+            continue
+        out_var = conv_fn(in_var, W, input_shape, filter_shape, stride, pad)
+        grads = T.grad(out_var.sum(), [in_var, W])
+        fn = theano.function([in_var, W], [out_var] + grads)
+        # first call might allocate memory
+        fn(x_val, W_val)
+        run_times = []
+        for _ in range(num_runs):
+            start_time = time.time()
+            fn(x_val, W_val)
+            run_times.append(time.time() - start_time)
+        times[name] = float(np.median(run_times))
+    return times
+
+
+def choose_implementation(input_shape,
+                          filter_shape,
+                          stride,
+                          pad,
+                          cache_path=None):
+    """
+    returns the name of the fastest implementation for a convolution with
+    the given shapes, timing the implementations if the convolution isn't
+    in the cache
+    """
+    cache = load_cache(cache_path)
+    key = _cache_key(input_shape, filter_shape, stride, pad)
+    if key not in cache:
+        times = time_implementations(input_shape, filter_shape, stride, pad)
+        cache[key] = dict(
+            input_shape=list(input_shape),
+            filter_shape=list(filter_shape),
+            stride=list(stride),
+            pad=list(pad),
+            times=times,
+            choice=min(times, key=times.get),
+        )
+        _save_cache(cache_path)
+    return cache[key]["choice"]
+
+
+def format_table(cache_path=None):
+    """
+    returns a table of the cached decisions, with the time of each
+    implementation in ms
+    """
+    cache = load_cache(cache_path)
+    names = sorted(set(name
+                       for ndim_impls in IMPLEMENTATIONS.values()
+                       for name in ndim_impls))
+    columns = ["input_shape", "filter_shape", "stride", "pad"]
+    lines = ["\t".join(columns + names + ["choice"])]
+    for key in sorted(cache):
+        entry = cache[key]
+        row = ["x".join(map(str, entry[c])) for c in columns]
+        row += ["%.3f" % (1000 * entry["times"][name])
+                if name in entry["times"] else "-"
+                for name in names]
+        row.append(entry["choice"])
+        lines.append("\t".join(row))
+    return "\n".join(lines)
+
+
+class _AutotunedConvNode(treeano.NodeImpl):
+
+    hyperparameter_names = ("inits",
+                            "num_filters",
+                            "filter_size",
+                            "conv_stride",
+                            "stride",
+                            "conv_pad",
+                            "pad",
+                            "conv_implementation",
+                            "autotune_cache_path",
+                            "autotune_batch_size")
+
+    ndim = None
+
+    def compute_output(self, network, in_vw):
+        # same hyperparameters as Conv2DNode
+        num_filters = network.find_hyperparameter(["num_filters"])
+        filter_size = network.find_hyperparameter(["filter_size"])
+        stride = network.find_hyperparameter(["conv_stride", "stride"],
+                                             (1,) * self.ndim)
+        pad = network.find_hyperparameter(["conv_pad", "pad"], "valid")
+        pad = tn.conv.conv_parse_pad(filter_size, pad)
+        assert len(filter_size) == self.ndim
+        stride = tuple(stride)
+        pad = tuple(pad)
+
+        num_channels = in_vw.shape[1]
+        filter_shape = (num_filters, num_channels) + tuple(filter_size)
+        W = network.create_vw(
+            name="weight",
+            is_shared=True,
+            shape=filter_shape,
+            tags={"parameter", "weight"},
+            default_inits=[],
+        ).variable
+
+        implementation = network.find_hyperparameter(["conv_implementation"],
+                                                     None)
+        if implementation is None:
+            # the batch size only needs to be representative
+            input_shape = list(in_vw.shape)
+            if input_shape[0] is None:
+                input_shape[0] = network.find_hyperparameter(
+                    ["autotune_batch_size"], 32)
+            assert None not in input_shape, in_vw.shape
+            implementation = choose_implementation(
+                tuple(input_shape),
+                filter_shape,
+                stride,
+                pad,
+                cache_path=network.find_hyperparameter(
+                    ["autotune_cache_path"], None))
+        conv_fn, supports = IMPLEMENTATIONS[self.ndim][implementation]
+        assert supports(stride, pad), implementation
+
+        out_var = conv_fn(in_vw.variable,
+                          W,
+                          in_vw.shape,
+                          filter_shape,
+                          stride,
+                          pad)
+        out_shape = tn.conv.conv_output_shape(
+            input_shape=in_vw.shape,
+            num_filters=num_filters,
+            axes=tuple(range(2, 2 + self.ndim)),
+            conv_shape=filter_size,
+            strides=stride,
+            pads=pad)
+        network.create_vw(
+            "default",
+            variable=out_var,
+            shape=out_shape,
+            tags={"output"},
+        )
+
+
+@treeano.register_node("autotuned_conv_2d")
+class AutotunedConv2DNode(_AutotunedConvNode):
+
+    """
+    Conv2DNode that uses the fastest implementation for its shapes
+
+    conv_implementation:
+    name of the implementation to use instead of timing them
+
+    autotune_cache_path:
+    json file to cache decisions in (defaults to DEFAULT_CACHE_PATH)
+
+    autotune_batch_size:
+    batch size to time the implementations with, if the batch size of the
+    input isn't fixed
+    """
+
+    ndim = 2
+
+
+@treeano.register_node("autotuned_conv_3d")
+class AutotunedConv3DNode(_AutotunedConvNode):
+
+    """
+    AutotunedConv2DNode for 3D convolutions
+    """
+
+    ndim = 3
@@ -154,6 +154,10 @@ class NumpySplitProbabilitiesToLeafProbabilitiesNode(treeano.NodeImpl):
 
     this node is implemented in numpy and should be more memory efficient than
     the Theano version, and compile faster, but performed in Python (on CPU)
+
+    the probabilities are computed with sparse products with a routing matrix
+    (see tree_probability.SparseTreeProbabilityOp), so that the time spent in
+    Python doesn't grow with the size of the tree
     """
 
     hyperparameter_names = ()
@@ -166,7 +170,8 @@ class NumpySplitProbabilitiesToLeafProbabilitiesNode(treeano.NodeImpl):
 
         network.create_vw(
             "default",
-            variable=tree_probability.tree_probability(in_vw.variable),
+            variable=tree_probability.sparse_tree_probability(
+                in_vw.variable),
             shape=output_shape,
             tags={"output"},
         )
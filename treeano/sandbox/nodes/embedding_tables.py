@@ -0,0 +1,305 @@
+"""
+embeddings for vocabularies that are too large for a dense table in memory
+
+- HashedEmbeddingNode: the hashing trick, where each index is mapped to
+  rows of a table with a fixed number of buckets (summed if there is more
+  than one hash function)
+- MemmapEmbeddingTable: a table stored in a memory-mapped file, with the
+  recently used rows cached in the weight of a SparseEmbeddingNode (with
+  write-back on eviction), so that the compiled function only sees the
+  cache
+
+both work with sparse_updates.SparseSGDNode, so that each step only updates
+the rows that were looked up
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import os
+
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import canopy
+
+from . import sparse_updates
+
+fX = theano.config.floatX
+
+# largest 32-bit mersenne prime, for universal hashing of int32 indexes
+_HASH_PRIME = 2 ** 31 - 1
+
+
+def hash_coefficients(num_hashes, seed=42):
+    """
+    returns the (multiplier, offset) of each of the hash functions
+    """
+    rng = np.random.RandomState(seed)
+    return [(int(rng.randint(1, _HASH_PRIME)), int(rng.randint(_HASH_PRIME)))
+            for _ in range(num_hashes)]
+
+
+def hash_indices(idxs, num_buckets, coefficients):
+    """
+    returns the bucket of each index for each hash function (along a new
+    last axis), for both numpy arrays and theano variables
+
+    uses ((a * x + b) mod p) mod num_buckets, computed in int64 so that it
+    doesn't overflow
+    """
+    idxs = idxs.astype("int64")
+    buckets = [((a * idxs + b) % _HASH_PRIME) % num_buckets
+               for a, b in coefficients]
+    if isinstance(idxs, np.ndarray):
+        return np.stack(buckets, axis=-1).astype(np.int32)
+    return T.stack(buckets, axis=idxs.ndim).astype("int32")
+
+
+@treeano.register_node("hashed_embedding")
+class HashedEmbeddingNode(sparse_updates.SparseEmbeddingNode):
+
+    """
+    embedding where the index is hashed into num_buckets rows, so that the
+    size of the table doesn't depend on the size of the vocabulary (the
+    embedding is the sum of the rows of each hash function)
+
+    num_buckets:
+    number of rows of the table
+
+    num_hashes:
+    number of hash functions (defaults to 1), using more reduces the
+    chance of 2 indexes having the same embedding
+
+    hash_seed:
+    seed for the coefficients of the hash functions
+    """
+
+    hyperparameter_names = ("num_buckets",
+                            "output_size",
+                            "num_hashes",
+                            "hash_seed")
+
+    def compute_output(self, network, in_vw):
+        num_buckets = network.find_hyperparameter(["num_buckets"])
+        output_size = network.find_hyperparameter(["output_size"])
+        num_hashes = network.find_hyperparameter(["num_hashes"], 1)
+        hash_seed = network.find_hyperparameter(["hash_seed"], 42)
+        W = network.create_vw(
+            name="weight",
+            is_shared=True,
+            shape=(num_buckets, output_size),
+            tags={"parameter", "weight"},
+            default_inits=[],
+        ).variable
+
+        assert in_vw.dtype in ("int32", "int64")
+        buckets = hash_indices(in_vw.variable.ravel(),
+                               num_buckets,
+                               hash_coefficients(num_hashes, hash_seed))
+        lookup = W[buckets.ravel()]
+        network.create_vw(
+            name="lookup",
+            variable=lookup,
+            shape=(None, output_size),
+        )
+        out_var = lookup.reshape((-1, num_hashes, output_size)).sum(axis=1)
+        out_var = out_var.reshape(in_vw.symbolic_shape() + (output_size,))
+        network.create_vw(
+            name="default",
+            variable=out_var,
+            shape=in_vw.shape + (output_size,),
+            tags={"output"},
+        )
+
+
+class MemmapEmbeddingTable(object):
+
+    """
+    embedding table stored in a .npy file, which is memory-mapped so that
+    only the rows that are used need to be in memory
+
+    the rows of the most recently used indexes are cached in the weight of
+    a SparseEmbeddingNode with input_size=cache_size (see bind), and indexes
+    are replaced by the slots of their rows in the cache (see lookup). rows
+    that were looked up while training are written back to the file when
+    they are evicted, or on flush
+
+    NOTE: the optimizer state of the cache weight (eg. for AdaGrad) isn't
+    swapped with the rows, so stateless updates (eg. SparseSGDNode) should
+    be used
+
+    shape:
+    (vocabulary size, embedding size), needed if the file doesn't exist,
+    in which case it is created with normally distributed values with
+    standard deviation init_scale
+    """
+
+    def __init__(self,
+                 filename,
+                 cache_size,
+                 shape=None,
+                 dtype=fX,
+                 init_scale=0.01,
+                 random_state=None,
+                 init_chunk_size=2 ** 16):
+        if not os.path.exists(filename):
+            assert shape is not None, "shape is needed to create the table"
+            table = np.lib.format.open_memmap(filename,
+                                              mode="w+",
+                                              dtype=dtype,
+                                              shape=tuple(shape))
+            rng = np.random.RandomState(random_state)
+            # initialize in chunks so that the table is never in memory
+            for start in range(0, shape[0], init_chunk_size):
+                chunk = table[start:start + init_chunk_size]
+                chunk[:] = init_scale * rng.randn(*chunk.shape)
+            table.flush()
+            del table
+        self.filename = filename
+        self.table = np.load(filename, mmap_mode="r+")
+        if shape is not None:
+            assert self.table.shape == tuple(shape), self.table.shape
+        assert cache_size <= self.table.shape[0]
+        self.cache_size = cache_size
+        self.shared = None
+        # index of the row in each slot of the cache (-1 if empty)
+        self.slot_rows = -np.ones(cache_size, dtype=np.int64)
+        # step that each slot was last used in, for LRU eviction
+        self.slot_steps = -np.ones(cache_size, dtype=np.int64)
+        self.slot_dirty = np.zeros(cache_size, dtype=bool)
+        self.row_to_slot = {}
+        self.step = 0
+
+    def bind(self, shared):
+        """
+        uses a shared variable with shape (cache_size, embedding size) as
+        the cache (eg. the weight of a SparseEmbeddingNode), loading the
+        currently cached rows into it
+        """
+        value = shared.get_value()
+        assert value.shape == (self.cache_size, self.table.shape[1]), \
+            value.shape
+        used = self.slot_rows >= 0
+        if self.shared is not None:
+            value[used] = self.shared.get_value(borrow=True)[used]
+        else:
+            value[used] = self.table[self.slot_rows[used]]
+        shared.set_value(value, borrow=True)
+        self.shared = shared
+
+    def lookup(self, idxs, dirty=True):
+        """
+        returns the slots in the cache of the rows of the given indexes
+        (with the same shape), loading the rows that aren't cached
+
+        dirty:
+        whether the rows may be updated (and so need to be written back)
+        """
+        assert self.shared is not None, "bind must be called first"
+        self.step += 1
+        idxs = np.asarray(idxs)
+        rows, inverse = np.unique(idxs, return_inverse=True)
+        assert len(rows) <= self.cache_size, dict(
+            msg="more distinct indexes than cache slots",
+            num_rows=len(rows),
+            cache_size=self.cache_size,
+        )
+        # python ints are much faster to hash than numpy scalars
+        slots = np.array([self.row_to_slot.get(row, -1)
+                          for row in rows.tolist()],
+                         dtype=np.int64)
+        missing = slots < 0
+        if missing.any():
+            # evict the least recently used slots that aren't in this
+            # lookup
+            steps = self.slot_steps.copy()
+            steps[slots[~missing]] = self.step
+            num_missing = int(missing.sum())
+            victims = np.argpartition(steps, num_missing - 1)[:num_missing]
+            self._write_back(victims)
+            for row in self.slot_rows[victims].tolist():
+                if row >= 0:
+                    del self.row_to_slot[row]
+            new_rows = rows[missing]
+            value = self.shared.get_value(borrow=True)
+            value[victims] = self.table[new_rows]
+            self.shared.set_value(value, borrow=True)
+            self.slot_rows[victims] = new_rows
+            self.slot_dirty[victims] = False
+            self.row_to_slot.update(zip(new_rows.tolist(), victims.tolist()))
+            slots[missing] = victims
+        self.slot_steps[slots] = self.step
+        if dirty:
+            self.slot_dirty[slots] = True
+        return slots[inverse].reshape(idxs.shape).astype(np.int32)
+
+    def _write_back(self, slots):
+        slots = slots[self.slot_dirty[slots]]
+        if len(slots):
+            value = self.shared.get_value(borrow=True)
+            self.table[self.slot_rows[slots]] = value[slots]
+            self.slot_dirty[slots] = False
+
+    def flush(self):
+        """
+        writes the updated rows in the cache back to the file (eg. before
+        saving a checkpoint)
+        """
+        if self.shared is not None:
+            self._write_back(np.arange(self.cache_size))
+        self.table.flush()
+
+    def value(self, idxs):
+        """
+        returns the current rows of the given indexes (without caching
+        them)
+        """
+        idxs = np.asarray(idxs)
+        res = np.array(self.table[idxs.ravel()])
+        if self.shared is not None:
+            cache = self.shared.get_value(borrow=True)
+            for i, row in enumerate(idxs.ravel().tolist()):
+                slot = self.row_to_slot.get(row)
+                if slot is not None:
+                    res[i] = cache[slot]
+        return res.reshape(idxs.shape + (self.table.shape[1],))
+
+
+class MemmapEmbedding(canopy.handlers.NetworkHandlerImpl):
+
+    """
+    handler that replaces the indexes in the inputs with the given keys by
+    slots of the cache of a MemmapEmbeddingTable, binding the table to the
+    weight of the SparseEmbeddingNode with the given name
+
+    dirty:
+    whether the function updates the embedding (False for evaluation
+    functions, so that rows aren't needlessly written back)
+    """
+
+    def __init__(self, table, node_name, keys, dirty=True):
+        self.table = table
+        self.node_name = node_name
+        self.keys = keys
+        self.dirty = dirty
+
+    def __call__(self, state, in_dict, *args, **kwargs):
+        weight = state.network[self.node_name].get_vw("weight").variable
+        if self.table.shared is not weight:
+            self.table.bind(weight)
+        in_dict = dict(in_dict)
+        # a single lookup, so that the rows of one key can't be evicted by
+        # the rows of another
+        idxs = [np.asarray(in_dict[key]) for key in self.keys]
+        slots = self.table.lookup(np.concatenate([i.ravel() for i in idxs]),
+                                  dirty=self.dirty)
+        start = 0
+        for key, key_idxs in zip(self.keys, idxs):
+            in_dict[key] = slots[start:start + key_idxs.size].reshape(
+                key_idxs.shape)
+            start += key_idxs.size
+        return self._inner_handler(state, in_dict, *args, **kwargs)
+
+memmap_embedding = MemmapEmbedding
@@ -0,0 +1,238 @@
+"""
+nodes for evaluating an ensemble of networks with the same architecture at
+once, with the parameters of the members stacked along a new leading axis
+
+the members' examples are stacked along the batch axis (ie. the input has
+shape (ensemble_size * batch_size, ...), with the examples of the first
+member first), so that nodes without parameters that act on each example
+independently (eg. activations and pooling) can be shared by all members
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+from treeano.nodes import composite
+
+
+def _ensemble_size(network):
+    ensemble_size = network.find_hyperparameter(["ensemble_size"])
+    assert ensemble_size >= 1, ensemble_size
+    return ensemble_size
+
+
+def _split_members(var, ensemble_size):
+    """
+    reshapes a variable with the members' examples stacked along the batch
+    axis to have a leading member axis
+    """
+    return var.reshape(
+        [ensemble_size, -1] + [var.shape[axis] for axis in range(1, var.ndim)],
+        ndim=var.ndim + 1)
+
+
+def _merge_members(var):
+    """
+    inverse of _split_members
+    """
+    return var.reshape(
+        [-1] + [var.shape[axis] for axis in range(2, var.ndim)],
+        ndim=var.ndim - 1)
+
+
+@treeano.register_node("stacked_linear_mapping")
+class StackedLinearMappingNode(treeano.NodeImpl):
+
+    """
+    LinearMappingNode with a weight for each member of an ensemble, computed
+    as a single batched dot product
+    """
+
+    hyperparameter_names = ("linear_mapping_inits",
+                            "inits",
+                            "output_dim",
+                            "ensemble_size")
+
+    def compute_output(self, network, in_vw):
+        output_dim = network.find_hyperparameter(["output_dim"])
+        ensemble_size = _ensemble_size(network)
+        assert in_vw.ndim == 2, in_vw.ndim
+        W = network.create_vw(
+            name="weight",
+            is_shared=True,
+            shape=(ensemble_size, in_vw.shape[1], output_dim),
+            tags={"parameter", "weight"},
+            default_inits=[],
+            default_inits_hyperparameters=["linear_mapping_inits", "inits"]
+        )
+        out_var = T.batched_dot(_split_members(in_vw.variable, ensemble_size),
+                                W.variable)
+        network.create_vw(
+            name="default",
+            variable=_merge_members(out_var),
+            shape=(in_vw.shape[0], output_dim),
+            tags={"output"},
+        )
+
+
+@treeano.register_node("stacked_add_bias")
+class StackedAddBiasNode(treeano.NodeImpl):
+
+    """
+    AddBiasNode with a bias for each member of an ensemble (always
+    broadcasting over the batch axis)
+    """
+
+    hyperparameter_names = ("bias_inits",
+                            "inits",
+                            "broadcastable_axes",
+                            "broadcastable",
+                            "ensemble_size")
+
+    def compute_output(self, network, in_vw):
+        ensemble_size = _ensemble_size(network)
+        broadcastable = network.find_hyperparameter(["broadcastable"],
+                                                    None)
+        if broadcastable is None:
+            broadcastable_axes = network.find_hyperparameter(
+                ["broadcastable_axes"],
+                [0])
+            broadcastable = [axis in broadcastable_axes
+                             for axis in range(in_vw.ndim)]
+        assert len(broadcastable) == in_vw.ndim
+        assert broadcastable[0], "bias must broadcast over the batch axis"
+        # same shape as the bias of each member, with the member axis in
+        # place of the batch axis
+        shape = (ensemble_size,) + tuple([1 if is_broadcastable else size
+                                          for is_broadcastable, size
+                                          in zip(broadcastable[1:],
+                                                 in_vw.shape[1:])])
+        b = network.create_vw(
+            name="bias",
+            is_shared=True,
+            shape=shape,
+            tags={"parameter", "bias"},
+            default_inits=[],
+            default_inits_hyperparameters=["bias_inits", "inits"],
+        )
+        # add an axis for the examples of each member
+        b_var = b.variable.dimshuffle(*([0, "x"] + list(range(1, b.ndim))))
+        if any(broadcastable[1:]):
+            b_var = T.patternbroadcast(
+                b_var,
+                [False, True] + list(broadcastable[1:]))
+        out_var = _split_members(in_vw.variable, ensemble_size) + b_var
+        network.create_vw(
+            name="default",
+            variable=_merge_members(out_var),
+            shape=in_vw.shape,
+            tags={"output"},
+        )
+
+
+@treeano.register_node("stacked_conv_2d")
+class StackedConv2DNode(treeano.NodeImpl):
+
+    """
+    Conv2DNode with filters for each member of an ensemble
+
+    NOTE: theano doesn't have grouped convolutions, so each member is
+    convolved separately (within the same graph)
+    """
+
+    hyperparameter_names = ("inits",
+                            "num_filters",
+                            "filter_size",
+                            "conv_stride",
+                            "stride",
+                            "conv_pad",
+                            "pad",
+                            "ensemble_size")
+
+    def compute_output(self, network, in_vw):
+        # same hyperparameters as Conv2DNode
+        num_filters = network.find_hyperparameter(["num_filters"])
+        filter_size = network.find_hyperparameter(["filter_size"])
+        stride = network.find_hyperparameter(["conv_stride", "stride"], (1, 1))
+        pad = network.find_hyperparameter(["conv_pad", "pad"], "valid")
+        pad = tn.conv.conv_parse_pad(filter_size, pad)
+        ensemble_size = _ensemble_size(network)
+
+        num_channels = in_vw.shape[1]
+        filter_shape = (num_filters, num_channels) + tuple(filter_size)
+        W = network.create_vw(
+            name="weight",
+            is_shared=True,
+            shape=(ensemble_size,) + filter_shape,
+            tags={"parameter", "weight"},
+            default_inits=[],
+        ).variable
+        in_var = _split_members(in_vw.variable, ensemble_size)
+        member_input_shape = (None,) + tuple(in_vw.shape[1:])
+        out_var = T.concatenate([
+            T.nnet.conv2d(input=in_var[idx],
+                          filters=W[idx],
+                          input_shape=member_input_shape,
+                          filter_shape=filter_shape,
+                          border_mode=pad,
+                          subsample=stride)
+            for idx in range(ensemble_size)])
+        out_shape = tn.conv.conv_output_shape(input_shape=in_vw.shape,
+                                              num_filters=num_filters,
+                                              axes=(2, 3),
+                                              conv_shape=filter_size,
+                                              strides=stride,
+                                              pads=pad)
+        network.create_vw(
+            "default",
+            variable=out_var,
+            shape=out_shape,
+            tags={"output"},
+        )
+
+
+@treeano.register_node("stacked_dense")
+class StackedDenseNode(treeano.Wrapper0NodeImpl):
+
+    """
+    DenseNode for an ensemble (with the same names for the child nodes)
+    """
+
+    hyperparameter_names = ("num_units",
+                            "inits",
+                            "ensemble_size")
+
+    def architecture_children(self):
+        return [
+            tn.SequentialNode(
+                self._name + "_sequential",
+                [composite._Flatten1dOr2dNode(self._name + "_flatten"),
+                 StackedLinearMappingNode(self._name + "_linear"),
+                 StackedAddBiasNode(self._name + "_bias")])]
+
+    def init_state(self, network):
+        super(StackedDenseNode, self).init_state(network)
+        network.forward_hyperparameter(self._name + "_linear",
+                                       "output_dim",
+                                       ["num_units"])
+
+
+@treeano.register_node("stacked_conv_2d_with_bias")
+class StackedConv2DWithBiasNode(treeano.Wrapper0NodeImpl):
+
+    """
+    Conv2DWithBiasNode for an ensemble (with the same names for the child
+    nodes)
+    """
+
+    hyperparameter_names = StackedConv2DNode.hyperparameter_names
+
+    def architecture_children(self):
+        return [
+            tn.SequentialNode(
+                self._name + "_sequential",
+                [StackedConv2DNode(self._name + "_conv"),
+                 StackedAddBiasNode(self._name + "_bias",
+                                    broadcastable_axes=(0, 2, 3))])]
@@ -19,15 +19,22 @@ class DisjointPseudorandomFractionalMaxPool2DNode(treeano.NodeImpl):
         assert in_vw.ndim == 4
         alpha = network.find_hyperparameter(["fmp_alpha"])
         u = network.find_hyperparameter(["fmp_u"])
-        op = fmp.DisjointPseudorandomFractionalMaxPooling2DOp(
-            alpha=alpha,
-            u=u
-        )
         out_shape = list(in_vw.shape)
-        # currently must be the same height and width
-        assert out_shape[2] == out_shape[3]
-        if out_shape[2] is not None:
-            out_shape[2] = out_shape[3] = op.output_length(out_shape[2])
+        if "gpu" in theano.config.device:
+            op = fmp.DisjointPseudorandomFractionalMaxPooling2DOp(
+                alpha=alpha,
+                u=u
+            )
+            # currently must be the same height and width
+            assert out_shape[2] == out_shape[3]
+        else:
+            op = fmp.DisjointPseudorandomFractionalMaxPooling2DCPUOp(
+                alpha=alpha,
+                u=u
+            )
+        for axis in [2, 3]:
+            if out_shape[axis] is not None:
+                out_shape[axis] = op.output_length(out_shape[axis])
         out_shape = tuple(out_shape)
         network.create_vw(
             "default",
@@ -0,0 +1,335 @@
+"""
+softmax output layers for large numbers of classes, which avoid computing
+the scores of every class while training
+
+- SampledSoftmaxNode: from "On Using Very Large Target Vocabulary for
+  Neural Machine Translation" (http://arxiv.org/abs/1412.2007), the softmax
+  is computed over the target and classes sampled from a proposal
+  distribution (with the logits corrected by the log of the expected count
+  of each class)
+- HierarchicalSoftmaxNode: from "Hierarchical Probabilistic Neural Network
+  Language Model", the classes are the leaves of a balanced binary tree,
+  and the probability of a class is the product of the probabilities of
+  the splits on its path
+
+while training, the nodes output the probability of the target of each
+example (shape (batch_size,)), and in deterministic mode, the probability
+of every class (shape (batch_size, num_classes)), so that they can be used
+with TotalCostNode and target_categorical_crossentropy_i32 in both cases
+
+while training, the rows of the weight that are used are looked up, so
+that sparse_updates.SparseSGDNode only updates those rows
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import theano
+import theano.tensor as T
+from theano.sandbox.rng_mrg import MRG_RandomStreams
+import treeano
+from treeano.theano_extensions import tree_probability
+
+from . import sparse_updates
+
+fX = theano.config.floatX
+
+
+def target_categorical_crossentropy_i32(pred, target):
+    """
+    categorical_crossentropy_i32 for the outputs of the nodes of this
+    module, where a 1d pred is already the probability of the target
+    """
+    if pred.ndim == 1:
+        assert target.dtype == "int32"
+        assert target.ndim == 1
+        if pred.owner is not None and pred.owner.op == T.exp:
+            # the nodes compute the log probability, which is used directly
+            # so that the cost doesn't overflow when the probability
+            # underflows
+            return -pred.owner.inputs[0]
+        return -T.log(pred)
+    return treeano.utils.categorical_crossentropy_i32(pred, target)
+
+
+# ################################ proposals ################################
+
+
+def uniform_proposal(num_classes):
+    """
+    every class is equally likely
+    """
+    def sample(srng, num_samples):
+        u = srng.uniform((num_samples,))
+        return T.minimum(T.floor(u * num_classes),
+                         num_classes - 1).astype("int32")
+
+    def log_probability(classes):
+        return T.zeros(classes.shape, dtype=fX) - np.log(num_classes)
+
+    return sample, log_probability
+
+
+def log_uniform_proposal(num_classes):
+    """
+    zipfian distribution, for classes sorted by decreasing frequency (eg.
+    words): P(class) = log((class + 2) / (class + 1)) / log(num_classes + 1)
+    """
+    log_range = np.log(num_classes + 1)
+
+    def sample(srng, num_samples):
+        u = srng.uniform((num_samples,))
+        classes = T.floor(T.exp(u * log_range)) - 1
+        return T.clip(classes, 0, num_classes - 1).astype("int32")
+
+    def log_probability(classes):
+        classes = classes.astype(fX)
+        return (T.log(T.log((classes + 2) / (classes + 1)))
+                - np.log(log_range)).astype(fX)
+
+    return sample, log_probability
+
+
+def unigram_proposal(probabilities, table_size=None):
+    """
+    returns a proposal with the given probability of each class (eg.
+    unigram counts raised to the 3/4 power), sampled like word2vec from a
+    table where each class is repeated proportionally to its probability
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    probabilities = probabilities / probabilities.sum()
+    if table_size is None:
+        table_size = 100 * len(probabilities)
+    counts = np.round(probabilities * table_size).astype(np.int64)
+    # every class with a nonzero probability can be sampled
+    counts[(counts == 0) & (probabilities > 0)] = 1
+    table = np.repeat(np.arange(len(probabilities), dtype=np.int32), counts)
+    # the probabilities of the table, rather than the given ones
+    log_probabilities = np.log(np.maximum(counts, 1) / len(table)).astype(fX)
+
+    def proposal(num_classes):
+        assert num_classes == len(probabilities)
+
+        def sample(srng, num_samples):
+            u = srng.uniform((num_samples,))
+            idxs = T.minimum(T.floor(u * len(table)), len(table) - 1)
+            return T.constant(table)[idxs.astype("int32")]
+
+        def log_probability(classes):
+            return T.constant(log_probabilities)[classes]
+
+        return sample, log_probability
+
+    return proposal
+
+
+PROPOSALS = {
+    "uniform": uniform_proposal,
+    "log_uniform": log_uniform_proposal,
+}
+
+
+# ################################## nodes ##################################
+
+
+class _LargeSoftmaxNode(treeano.NodeImpl):
+
+    input_keys = ("default", "target")
+
+    def init_long_range_dependencies(self, network):
+        network.take_output_from(
+            network.find_hyperparameter(["target_reference"]),
+            to_key="target")
+
+    def _lookup(self, network, W, idxs):
+        lookup = W[idxs]
+        network.create_vw(
+            name="lookup",
+            variable=lookup,
+            shape=(None, network.get_vw("weight").shape[1]),
+        )
+        return lookup
+
+    def _create_weights(self, network, num_rows, num_features):
+        W = network.create_vw(
+            name="weight",
+            is_shared=True,
+            shape=(num_rows, num_features),
+            tags={"parameter", "weight"},
+            default_inits=[],
+        ).variable
+        b = network.create_vw(
+            name="bias",
+            is_shared=True,
+            shape=(num_rows,),
+            tags={"parameter", "bias"},
+            default_inits=[],
+        ).variable
+        return W, b
+
+
+@sparse_updates.register_sparse_lookup_node
+@treeano.register_node("sampled_softmax")
+class SampledSoftmaxNode(_LargeSoftmaxNode):
+
+    """
+    affine transformation followed by a softmax over num_classes classes,
+    computed (while training) over the target and num_samples classes
+    sampled from a proposal distribution, shared by the examples of a
+    minibatch
+
+    the weight has shape (num_classes, num_features), so that the rows of
+    the sampled classes can be gathered
+
+    target_reference:
+    name of the node with the int32 targets
+
+    proposal:
+    name in PROPOSALS (defaults to "log_uniform") or a function of
+    num_classes returning the functions (sample, log_probability), where
+    sample(srng, num_samples) returns int32 classes, and log_probability
+    returns the log probability of each of the given classes (eg. the
+    result of unigram_proposal)
+
+    remove_accidental_hits:
+    whether sampled classes equal to the target of an example are ignored
+    for that example (defaults to True)
+    """
+
+    hyperparameter_names = ("num_classes",
+                            "num_samples",
+                            "proposal",
+                            "remove_accidental_hits",
+                            "target_reference",
+                            "inits",
+                            "deterministic")
+
+    def compute_output(self, network, in_vw, target_vw):
+        num_classes = network.find_hyperparameter(["num_classes"])
+        num_samples = network.find_hyperparameter(["num_samples"])
+        deterministic = network.find_hyperparameter(["deterministic"], False)
+        assert in_vw.ndim == 2
+        W, b = self._create_weights(network, num_classes, in_vw.shape[1])
+        h = in_vw.variable
+
+        if deterministic:
+            network.create_vw(
+                "default",
+                variable=T.nnet.softmax(T.dot(h, W.T) + b),
+                shape=(in_vw.shape[0], num_classes),
+                tags={"output"},
+            )
+            return
+
+        proposal = network.find_hyperparameter(["proposal"], "log_uniform")
+        proposal = PROPOSALS.get(proposal, proposal)
+        sample, log_probability = proposal(num_classes)
+        # TODO save this state so that we can seed the rng
+        srng = MRG_RandomStreams()
+        samples = theano.gradient.disconnected_grad(sample(srng, num_samples))
+        target = target_vw.variable
+        # logits minus the log of the expected number of times that each
+        # class is sampled
+        log_num_samples = np.log(num_samples).astype(fX)
+        # a single lookup of the rows of the targets and samples, for
+        # sparse updates
+        rows = self._lookup(network, W, T.concatenate([target, samples]))
+        target_W = rows[:target.shape[0]]
+        samples_W = rows[target.shape[0]:]
+        target_logits = ((h * target_W).sum(axis=1)
+                         + b[target]
+                         - log_probability(target)
+                         - log_num_samples)
+        sample_logits = (T.dot(h, samples_W.T)
+                         + b[samples]
+                         - log_probability(samples)
+                         - log_num_samples)
+        if network.find_hyperparameter(["remove_accidental_hits"], True):
+            hits = T.eq(target.dimshuffle(0, "x"), samples.dimshuffle("x", 0))
+            sample_logits = T.switch(hits,
+                                     np.array(-1e30, dtype=fX),
+                                     sample_logits)
+        logits = T.concatenate([target_logits.dimshuffle(0, "x"),
+                                sample_logits],
+                               axis=1)
+        # log probability of the target (ie. column 0)
+        max_logits = theano.gradient.disconnected_grad(logits.max(axis=1))
+        log_p = (target_logits - max_logits
+                 - T.log(T.exp(logits - max_logits.dimshuffle(0, "x")).sum(
+                     axis=1)))
+        network.create_vw(
+            "default",
+            variable=T.exp(log_p),
+            shape=(in_vw.shape[0],),
+            tags={"output"},
+        )
+
+
+@sparse_updates.register_sparse_lookup_node
+@treeano.register_node("hierarchical_softmax")
+class HierarchicalSoftmaxNode(_LargeSoftmaxNode):
+
+    """
+    softmax over num_classes classes, where the classes are the leaves of a
+    balanced binary tree (see treeano.theano_extensions.tree_probability)
+    and each split has a logistic regression for the probability of going
+    left
+
+    while training, only the splits on the path to the target are computed
+    (depth = log2(num_classes) instead of num_classes scores per example)
+
+    the weight has shape (num_splits, num_features)
+
+    NOTE: if num_classes isn't a power of 2, the tree is padded with leaves
+    that are never targets (so their probabilities only go to 0 with
+    training), and the probabilities in deterministic mode don't sum to 1
+
+    target_reference:
+    name of the node with the int32 targets
+    """
+
+    hyperparameter_names = ("num_classes",
+                            "target_reference",
+                            "inits",
+                            "deterministic")
+
+    def compute_output(self, network, in_vw, target_vw):
+        num_classes = network.find_hyperparameter(["num_classes"])
+        deterministic = network.find_hyperparameter(["deterministic"], False)
+        assert in_vw.ndim == 2
+        depth = int(np.ceil(np.log2(max(num_classes, 2))))
+        num_splits = 2 ** depth - 1
+        W, b = self._create_weights(network, num_splits, in_vw.shape[1])
+        h = in_vw.variable
+
+        if deterministic:
+            split_probabilities = T.nnet.sigmoid(T.dot(h, W.T) + b)
+            leaf_probabilities = tree_probability.sparse_tree_probability(
+                split_probabilities)
+            network.create_vw(
+                "default",
+                variable=leaf_probabilities[:, :num_classes],
+                shape=(in_vw.shape[0], num_classes),
+                tags={"output"},
+            )
+            return
+
+        splits, lefts = tree_probability.size_to_paths(num_splits)
+        target = target_vw.variable
+        # (batch_size, depth)
+        path_splits = T.constant(splits)[target]
+        signs = T.constant(np.where(lefts, 1, -1).astype(fX))[target]
+        # (batch_size, depth, num_features)
+        path_W = self._lookup(network, W, path_splits.ravel()).reshape(
+            (path_splits.shape[0], depth, W.shape[1]))
+        logits = (h.dimshuffle(0, "x", 1) * path_W).sum(axis=2)
+        logits += b[path_splits]
+        # log(sigmoid(x)) = -softplus(-x)
+        log_p = -T.nnet.softplus(-signs * logits).sum(axis=1)
+        network.create_vw(
+            "default",
+            variable=T.exp(log_p),
+            shape=(in_vw.shape[0],),
+            tags={"output"},
+        )
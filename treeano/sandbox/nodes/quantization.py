@@ -0,0 +1,230 @@
+"""
+nodes for inference with int8 weights and activations
+
+weights are stored as int8 with a scale per output unit / filter, and
+inputs are quantized to int8 with a fixed scale (eg. calibrated from the
+range of the inputs on sample data, see canopy.transforms.quantize)
+
+the nodes only compute outputs, and can't be trained
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+from treeano.nodes import composite
+
+fX = theano.config.floatX
+
+# symmetric quantization: [-127, 127] (-128 is unused so that negating
+# doesn't overflow)
+QUANTIZED_MAX = 127
+
+
+def quantize_weight(W, channel_axis):
+    """
+    returns W quantized to int8 with a scale for each index of channel_axis,
+    such that W ~= quantized * scale
+    """
+    reduce_axes = tuple(axis for axis in range(W.ndim)
+                        if axis != channel_axis)
+    max_abs = np.abs(W).max(axis=reduce_axes)
+    # avoid dividing by 0 for channels with all 0 weights
+    scale = np.where(max_abs > 0, max_abs, 1) / QUANTIZED_MAX
+    shape = [1] * W.ndim
+    shape[channel_axis] = -1
+    quantized = np.round(W / scale.reshape(shape))
+    quantized = np.clip(quantized, -QUANTIZED_MAX, QUANTIZED_MAX)
+    return quantized.astype("int8"), scale.astype(fX)
+
+
+def quantize_input(x, input_scale):
+    """
+    quantizes a theano variable to integers in [-127, 127] (as floats)
+    """
+    return T.round(T.clip(x / input_scale, -QUANTIZED_MAX, QUANTIZED_MAX))
+
+
+def _float_accumulation_is_exact(num_terms):
+    """
+    whether a sum of num_terms products of quantized values can be computed
+    exactly with floatX (ie. all of the partial sums are exactly
+    representable integers)
+    """
+    mantissa_bits = np.finfo(fX).nmant + 1
+    return num_terms * QUANTIZED_MAX ** 2 <= 2 ** mantissa_bits
+
+
+def _input_scale(network):
+    input_scale = network.find_hyperparameter(["input_scale"])
+    assert input_scale > 0, input_scale
+    return input_scale
+
+
+@treeano.register_node("quantized_linear_mapping")
+class QuantizedLinearMappingNode(treeano.NodeImpl):
+
+    """
+    LinearMappingNode with int8 weights and inputs, accumulated in int32
+
+    NOTE: when the accumulated values are small enough to be exact in
+    floatX, the dot product is computed with floats instead (which uses blas)
+
+    input_scale:
+    the input is quantized as round(input / input_scale), so input_scale
+    should be the largest absolute input value / 127
+    """
+
+    hyperparameter_names = ("output_dim",
+                            "input_scale")
+
+    def compute_output(self, network, in_vw):
+        output_dim = network.find_hyperparameter(["output_dim"])
+        input_scale = _input_scale(network)
+        weight_shape = (in_vw.shape[-1], output_dim)
+        output_shape = tuple(in_vw.shape[:-1]) + (output_dim, )
+        W = network.create_vw(
+            name="quantized_weight",
+            is_shared=True,
+            shape=weight_shape,
+            dtype="int8",
+            tags={"state"},
+            default_inits=[],
+        )
+        scale = network.create_vw(
+            name="weight_scale",
+            is_shared=True,
+            shape=(output_dim,),
+            tags={"state"},
+            default_inits=[],
+        )
+        x = quantize_input(in_vw.variable, input_scale)
+        if _float_accumulation_is_exact(weight_shape[0]):
+            # integer dot products don't use blas, so they are a lot slower
+            # than float ones
+            accumulated = T.dot(x, W.variable.astype(fX))
+        else:
+            accumulated = T.dot(x.astype("int32"),
+                                W.variable.astype("int32")).astype(fX)
+        out_var = accumulated * (scale.variable * input_scale)
+        network.create_vw(
+            name="default",
+            variable=out_var,
+            shape=output_shape,
+            tags={"output"},
+        )
+
+
+@treeano.register_node("quantized_conv_2d")
+class QuantizedConv2DNode(treeano.NodeImpl):
+
+    """
+    Conv2DNode with int8 weights and inputs
+
+    NOTE: theano's cpu convolutions only support floats, so the quantized
+    values are convolved as floats (which is exact as long as the
+    accumulated values are smaller than 2 ** 24 for float32)
+    """
+
+    hyperparameter_names = ("num_filters",
+                            "filter_size",
+                            "conv_stride",
+                            "stride",
+                            "conv_pad",
+                            "pad",
+                            "input_scale")
+
+    def compute_output(self, network, in_vw):
+        # same hyperparameters as Conv2DNode
+        num_filters = network.find_hyperparameter(["num_filters"])
+        filter_size = network.find_hyperparameter(["filter_size"])
+        stride = network.find_hyperparameter(["conv_stride", "stride"], (1, 1))
+        pad = network.find_hyperparameter(["conv_pad", "pad"], "valid")
+        pad = tn.conv.conv_parse_pad(filter_size, pad)
+        input_scale = _input_scale(network)
+
+        num_channels = in_vw.shape[1]
+        filter_shape = (num_filters, num_channels) + tuple(filter_size)
+        W = network.create_vw(
+            name="quantized_weight",
+            is_shared=True,
+            shape=filter_shape,
+            dtype="int8",
+            tags={"state"},
+            default_inits=[],
+        )
+        scale = network.create_vw(
+            name="weight_scale",
+            is_shared=True,
+            shape=(num_filters,),
+            tags={"state"},
+            default_inits=[],
+        )
+        accumulated = T.nnet.conv2d(
+            input=quantize_input(in_vw.variable, input_scale),
+            filters=W.variable.astype(fX),
+            input_shape=in_vw.shape,
+            filter_shape=filter_shape,
+            border_mode=pad,
+            subsample=stride)
+        out_scale = scale.variable.dimshuffle("x", 0, "x", "x") * input_scale
+        out_shape = tn.conv.conv_output_shape(input_shape=in_vw.shape,
+                                              num_filters=num_filters,
+                                              axes=(2, 3),
+                                              conv_shape=filter_size,
+                                              strides=stride,
+                                              pads=pad)
+        network.create_vw(
+            "default",
+            variable=accumulated * out_scale,
+            shape=out_shape,
+            tags={"output"},
+        )
+
+
+@treeano.register_node("quantized_dense")
+class QuantizedDenseNode(treeano.Wrapper0NodeImpl):
+
+    """
+    DenseNode with a QuantizedLinearMappingNode (with the same names for
+    the child nodes, so that the bias is the same as the DenseNode's)
+    """
+
+    hyperparameter_names = ("num_units",
+                            "input_scale")
+
+    def architecture_children(self):
+        return [
+            tn.SequentialNode(
+                self._name + "_sequential",
+                [composite._Flatten1dOr2dNode(self._name + "_flatten"),
+                 QuantizedLinearMappingNode(self._name + "_linear"),
+                 tn.AddBiasNode(self._name + "_bias")])]
+
+    def init_state(self, network):
+        super(QuantizedDenseNode, self).init_state(network)
+        network.forward_hyperparameter(self._name + "_linear",
+                                       "output_dim",
+                                       ["num_units"])
+
+
+@treeano.register_node("quantized_conv_2d_with_bias")
+class QuantizedConv2DWithBiasNode(treeano.Wrapper0NodeImpl):
+
+    """
+    Conv2DWithBiasNode with a QuantizedConv2DNode
+    """
+
+    hyperparameter_names = QuantizedConv2DNode.hyperparameter_names
+
+    def architecture_children(self):
+        return [
+            tn.SequentialNode(
+                self._name + "_sequential",
+                [QuantizedConv2DNode(self._name + "_conv"),
+                 tn.AddBiasNode(self._name + "_bias",
+                                broadcastable_axes=(0, 2, 3))])]
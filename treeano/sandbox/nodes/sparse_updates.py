@@ -0,0 +1,198 @@
+"""
+embeddings whose updates only touch the rows that were looked up, so that
+the time of an update doesn't depend on the size of the embedding table
+
+SparseEmbeddingNode's weight is a regular parameter (so that it can be
+updated by any updates node), but SparseSGDNode and SparseAdaGradNode
+update it with an increment of the looked up rows instead of a gradient
+with the shape of the whole table
+
+other nodes that look up rows of their weight can get the same updates by
+being registered with register_sparse_lookup_node
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+
+
+# classes of nodes (including their subclasses) with a "weight" vw and a
+# "lookup" vw with the rows of the weight that were looked up
+SPARSE_LOOKUP_NODES = []
+
+
+def register_sparse_lookup_node(cls):
+    """
+    registers a class of nodes that create a "lookup" vw (a subtensor of
+    the rows of their "weight" vw, as W[idxs]), so that their weight gets
+    sparse updates
+    """
+    SPARSE_LOOKUP_NODES.append(cls)
+    return cls
+
+
+@register_sparse_lookup_node
+@treeano.register_node("sparse_embedding")
+class SparseEmbeddingNode(treeano.NodeImpl):
+
+    """
+    EmbeddingNode that also creates a "lookup" variable with the rows of
+    the weight that were looked up (before reshaping), for sparse updates
+    """
+
+    hyperparameter_names = ("input_size",
+                            "output_size")
+
+    def compute_output(self, network, in_vw):
+        input_size = network.find_hyperparameter(["input_size"])
+        output_size = network.find_hyperparameter(["output_size"])
+        W = network.create_vw(
+            name="weight",
+            is_shared=True,
+            shape=(input_size, output_size),
+            tags={"parameter", "weight"},
+            default_inits=[],
+        ).variable
+
+        assert in_vw.dtype == "int32"
+        lookup = W[in_vw.variable.ravel()]
+        network.create_vw(
+            name="lookup",
+            variable=lookup,
+            shape=(None, output_size),
+        )
+        network.create_vw(
+            name="default",
+            variable=lookup.reshape(in_vw.symbolic_shape() + (output_size,)),
+            shape=in_vw.shape + (output_size,),
+            tags={"output"},
+        )
+
+
+def _subclasses(cls):
+    res = [cls]
+    for subclass in cls.__subclasses__():
+        res += _subclasses(subclass)
+    return res
+
+
+def sparse_embedding_vws(network):
+    """
+    returns a list of (weight vw, lookup vw) for each node of the classes in
+    SPARSE_LOOKUP_NODES (or their subclasses) in the subtree
+    """
+    classes = []
+    for registered in SPARSE_LOOKUP_NODES:
+        for cls in _subclasses(registered):
+            if cls not in classes:
+                classes.append(cls)
+    res = []
+    # find_nodes_in_subtree only finds nodes of the exact class
+    for cls in classes:
+        for node in network.find_nodes_in_subtree(cls):
+            rel_network = network[node.name]
+            try:
+                lookup_vw = rel_network.get_vw("lookup")
+            except KeyError:
+                # eg. nodes that use the whole weight in deterministic mode
+                continue
+            res.append((rel_network.get_vw("weight"), lookup_vw))
+    return res
+
+
+def sparse_update_delta(var, lookup, delta):
+    """
+    returns the update delta of a shared variable that increments the rows
+    of lookup (a subtensor of the variable) by delta
+
+    NOTE: theano simplifies var + (inc_subtensor(...) - var) into an inplace
+    increment of the rows, as long as the delta isn't transformed further
+    """
+    return T.inc_subtensor(lookup, delta) - var
+
+
+class _SparseUpdatesMixin(object):
+
+    def new_update_deltas(self, network):
+        # dense updates for the other parameters
+        update_deltas = super(_SparseUpdatesMixin, self).new_update_deltas(
+            network)
+        cost = self.raw_children()["cost"]
+        cost_var = network[cost.name].get_vw("default").variable
+        vws = sparse_embedding_vws(network)
+        lookups = [lookup_vw.variable for _, lookup_vw in vws]
+        grads = T.grad(cost_var, lookups)
+        for (weight_vw, _), lookup, grad in zip(vws, lookups, grads):
+            self._sparse_update_deltas(network,
+                                       update_deltas,
+                                       weight_vw,
+                                       lookup,
+                                       grad)
+        return update_deltas
+
+    def _new_update_deltas(self, network, parameter_vws, grads):
+        # sparse parameters are updated separately
+        sparse_vws = {weight_vw.name
+                      for weight_vw, _ in sparse_embedding_vws(network)}
+        dense = [(vw, grad) for vw, grad in zip(parameter_vws, grads)
+                 if vw.name not in sparse_vws]
+        return super(_SparseUpdatesMixin, self)._new_update_deltas(
+            network,
+            [vw for vw, _ in dense],
+            [grad for _, grad in dense])
+
+
+@treeano.register_node("sparse_sgd")
+class SparseSGDNode(_SparseUpdatesMixin, tn.SGDNode):
+
+    """
+    SGDNode that only updates the looked up rows of SparseEmbeddingNode's
+    """
+
+    def _sparse_update_deltas(self, network, update_deltas, weight_vw, lookup,
+                              grad):
+        learning_rate = network.find_hyperparameter(["sgd_learning_rate",
+                                                     "learning_rate"],
+                                                    0.1)
+        update_deltas[weight_vw.variable] = sparse_update_delta(
+            weight_vw.variable,
+            lookup,
+            -learning_rate * grad)
+
+
+@treeano.register_node("sparse_adagrad")
+class SparseAdaGradNode(_SparseUpdatesMixin, tn.ADAGRADNode):
+
+    """
+    ADAGRADNode that only updates the looked up rows of SparseEmbeddingNode's
+    (and their sums of squared gradients)
+
+    NOTE: if a row is looked up more than once in a minibatch, each
+    occurrence is scaled with the sum of squared gradients from before the
+    minibatch
+    """
+
+    def _sparse_update_deltas(self, network, update_deltas, weight_vw, lookup,
+                              grad):
+        learning_rate = network.find_hyperparameter(["learning_rate"], 1e-3)
+        epsilon = network.find_hyperparameter(["epsilon"], 1e-6)
+        g2_sum = network.create_vw(
+            "adagrad_gradients_squared(%s)" % weight_vw.name,
+            shape=weight_vw.shape,
+            is_shared=True,
+            tags={"state"},
+            default_inits=[],
+        ).variable
+        idxs = lookup.owner.inputs[1]
+        g2_sum_lookup = g2_sum[idxs]
+        new_g2_sum_lookup = g2_sum_lookup + grad ** 2
+        update_deltas[g2_sum] = sparse_update_delta(g2_sum,
+                                                    g2_sum_lookup,
+                                                    grad ** 2)
+        update_deltas[weight_vw.variable] = sparse_update_delta(
+            weight_vw.variable,
+            lookup,
+            -learning_rate * grad / T.sqrt(new_g2_sum_lookup + epsilon))
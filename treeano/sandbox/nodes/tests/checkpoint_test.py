@@ -0,0 +1,76 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+
+import treeano
+import treeano.nodes as tn
+import canopy
+from treeano.theano_extensions.checkpoint import CheckpointOp
+from treeano.sandbox.nodes import checkpoint
+from treeano.sandbox.nodes import resnet
+
+fX = theano.config.floatX
+
+
+def _network(**kwargs):
+    np.random.seed(42)
+    return tn.HyperparameterNode(
+        "hp",
+        tn.SGDNode(
+            "sgd",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [tn.InputNode("x", shape=(None, 2, 6, 6)),
+                 checkpoint.CheckpointNode(
+                     "c1",
+                     resnet.residual_block_conv_2d("b1",
+                                                   num_filters=2,
+                                                   num_layers=2)),
+                 checkpoint.CheckpointNode(
+                     "c2",
+                     resnet.residual_block_conv_2d("b2",
+                                                   num_filters=4,
+                                                   num_layers=2,
+                                                   increase_dim="projection")),
+                 tn.GlobalMeanPool2DNode("pool"),
+                 tn.DenseNode("d", num_units=3),
+                 tn.SoftmaxNode("p")]),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                  "target": tn.InputNode("y", shape=(None,),
+                                         dtype="int32")})}),
+        filter_size=(3, 3),
+        inits=[treeano.inits.NormalWeightInit(0.5)],
+        cost_function=treeano.utils.categorical_crossentropy_i32,
+        learning_rate=0.1,
+        **kwargs
+    ).network()
+
+
+def test_checkpoint_node():
+    x = np.random.randn(5, 2, 6, 6).astype(fX)
+    y = np.array([0, 1, 2, 1, 0], dtype="int32")
+    results = []
+    for checkpoint_ in [False, True]:
+        network = _network(checkpoint=checkpoint_)
+        fn = network.function(["x", "y"], ["cost"], include_updates=True)
+        costs = [fn(x, y)[0] for _ in range(3)]
+        values = canopy.network_utils.to_value_dict(network)
+        results.append((costs, values, fn))
+    (costs1, values1, _), (costs2, values2, fn) = results
+    np.testing.assert_allclose(costs1, costs2, rtol=1e-4)
+    # parameters and batch normalization moving statistics
+    nt.assert_equal(set(values1), set(values2))
+    for key in values1:
+        np.testing.assert_allclose(values1[key], values2[key],
+                                   rtol=1e-4, atol=1e-5)
+    # the convolutions (including for the batch normalization updates) are
+    # only computed by the checkpoint ops (2 forward and 2 gradient ops)
+    nodes = fn.maker.fgraph.toposort()
+    nt.assert_equal(4, len([node for node in nodes
+                            if isinstance(node.op, CheckpointOp)]))
+    nt.assert_false(any("Conv" in type(node.op).__name__
+                        or "Corr" in type(node.op).__name__
+                        for node in nodes))
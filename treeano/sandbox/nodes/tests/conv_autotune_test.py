@@ -0,0 +1,127 @@
+import itertools
+import json
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+
+from treeano.sandbox.nodes import conv_autotune
+
+fX = theano.config.floatX
+
+
+def _naive_conv(x, W, stride, pad):
+    """
+    convolution (with flipped filters) with numpy
+    """
+    ndim = W.ndim - 2
+    pad_width = [(0, 0), (0, 0)] + [(p, p) for p in pad]
+    x = np.pad(x, pad_width, mode="constant")
+    W = W[(slice(None), slice(None)) + (slice(None, None, -1),) * ndim]
+    out_shape = [(x.shape[axis + 2] - W.shape[axis + 2]) // stride[axis] + 1
+                 for axis in range(ndim)]
+    out = np.zeros((x.shape[0], W.shape[0]) + tuple(out_shape), dtype=x.dtype)
+    for idx in itertools.product(*[range(s) for s in out_shape]):
+        slices = tuple(slice(i * s, i * s + f)
+                       for i, s, f in zip(idx, stride, W.shape[2:]))
+        patch = x[(slice(None), slice(None)) + slices]
+        out[(slice(None), slice(None)) + idx] = np.tensordot(
+            patch, W, axes=[list(range(1, ndim + 2))] * 2)
+    return out
+
+
+def test_implementations():
+    for ndim, stride, pad in [(2, (1, 1), (0, 0)),
+                              (2, (2, 1), (1, 2)),
+                              (3, (1, 1, 1), (0, 0, 0)),
+                              (3, (1, 2, 1), (1, 0, 1))]:
+        input_shape = (2, 3) + (6,) * ndim
+        filter_shape = (4, 3) + (3,) * ndim
+        x = np.random.randn(*input_shape).astype(fX)
+        W = np.random.randn(*filter_shape).astype(fX)
+        expected = _naive_conv(x, W, stride, pad)
+        in_var = T.TensorType(fX, (False,) * (ndim + 2))()
+        W_var = T.TensorType(fX, (False,) * (ndim + 2))()
+        impls = conv_autotune.IMPLEMENTATIONS[ndim]
+        for name, (conv_fn, supports) in impls.items():
+            if not supports(stride, pad):
+                continue
+            out_var = conv_fn(in_var,
+                              W_var,
+                              (None,) + input_shape[1:],
+                              filter_shape,
+                              stride,
+                              pad)
+            res = theano.function([in_var, W_var], out_var)(x, W)
+            np.testing.assert_allclose(expected,
+                                       res,
+                                       rtol=1e-4,
+                                       atol=1e-4,
+                                       err_msg=name)
+
+
+def test_autotuned_conv_2d_node():
+    cache_dir = tempfile.mkdtemp()
+    cache_path = os.path.join(cache_dir, "cache.json")
+    try:
+        def network_fn(node):
+            return tn.SequentialNode(
+                "s",
+                [tn.InputNode("i", shape=(None, 2, 8, 8)),
+                 node]
+            ).network()
+
+        kwargs = dict(num_filters=3, filter_size=(3, 3), pad="same")
+        network1 = network_fn(tn.Conv2DNode("c", **kwargs))
+        network2 = network_fn(conv_autotune.AutotunedConv2DNode(
+            "c",
+            autotune_cache_path=cache_path,
+            autotune_batch_size=4,
+            **kwargs))
+        network1.build()
+        W = network1["c"].get_vw("weight").value
+        network2["c"].get_vw("weight").variable.set_value(W)
+        x = np.random.randn(4, 2, 8, 8).astype(fX)
+        np.testing.assert_allclose(network1.function(["i"], ["s"])(x)[0],
+                                   network2.function(["i"], ["s"])(x)[0],
+                                   rtol=1e-4,
+                                   atol=1e-5)
+
+        # the decision is cached on disk, with the timings
+        with open(cache_path) as f:
+            cache = json.load(f)
+        nt.assert_equal(1, len(cache))
+        entry = list(cache.values())[0]
+        nt.assert_equal([4, 2, 8, 8], entry["input_shape"])
+        nt.assert_equal(set(conv_autotune.IMPLEMENTATIONS[2]),
+                        set(entry["times"]))
+        nt.assert_in(entry["choice"], entry["times"])
+        table = conv_autotune.format_table(cache_path)
+        nt.assert_equal(2, len(table.split("\n")))
+        nt.assert_in(entry["choice"], table)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_autotuned_conv_3d_node_implementation():
+    # the implementation can also be chosen manually
+    for implementation in ["conv3d", "conv3d2d"]:
+        network = tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(2, 2, 5, 6, 7)),
+             conv_autotune.AutotunedConv3DNode(
+                 "c",
+                 num_filters=3,
+                 filter_size=(2, 3, 2),
+                 conv_implementation=implementation)]
+        ).network()
+        fn = network.function(["i"], ["s"])
+        x = np.random.randn(2, 2, 5, 6, 7).astype(fX)
+        nt.assert_equal((2, 3, 4, 4, 6), fn(x)[0].shape)
+        nt.assert_equal((2, 3, 4, 4, 6), network["s"].get_vw("default").shape)
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+import canopy
+
+from treeano.sandbox.nodes import embedding_tables
+from treeano.sandbox.nodes import sparse_updates
+
+fX = theano.config.floatX
+
+
+def test_hashed_embedding_node_serialization():
+    tn.check_serialization(embedding_tables.HashedEmbeddingNode("a"))
+
+
+def test_hashed_embedding_node():
+    for num_hashes in [1, 3]:
+        network = tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(None, 2), dtype="int32"),
+             embedding_tables.HashedEmbeddingNode("e",
+                                                  num_buckets=7,
+                                                  output_size=3,
+                                                  num_hashes=num_hashes)]
+        ).network()
+        W = np.random.randn(7, 3).astype(fX)
+        network["e"].get_vw("weight").variable.set_value(W)
+        x = np.array([[0, 123456789], [5, 5]], dtype=np.int32)
+        buckets = embedding_tables.hash_indices(
+            x, 7, embedding_tables.hash_coefficients(num_hashes))
+        nt.assert_equal((2, 2, num_hashes), buckets.shape)
+        nt.assert_true(((buckets >= 0) & (buckets < 7)).all())
+        fn = network.function(["i"], ["s"])
+        np.testing.assert_allclose(W[buckets].sum(axis=2), fn(x)[0],
+                                   rtol=1e-5)
+
+
+def test_hashed_embedding_node_sparse_updates():
+    # same updates as the dense node
+    res = []
+    for cls in [sparse_updates.SparseSGDNode, tn.SGDNode]:
+        network = tn.HyperparameterNode(
+            "hp",
+            cls("updates",
+                {"subtree": tn.SequentialNode(
+                    "s",
+                    [tn.InputNode("i", shape=(None,), dtype="int32"),
+                     embedding_tables.HashedEmbeddingNode("e")]),
+                 "cost": tn.TotalCostNode(
+                     "cost",
+                     {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                      "target": tn.InputNode("y", shape=(None, 3))})}),
+            num_buckets=5,
+            output_size=3,
+            num_hashes=2,
+            learning_rate=0.1,
+            cost_function=treeano.utils.squared_error,
+            inits=[treeano.inits.ConstantInit(0.5)],
+        ).network()
+        fn = network.function(["i", "y"], ["cost"], include_updates=True)
+        if cls is sparse_updates.SparseSGDNode:
+            nt.assert_equal(
+                1,
+                len(sparse_updates.sparse_embedding_vws(network["updates"])))
+        for _ in range(3):
+            fn(np.array([1, 70, 4, 1], dtype=np.int32),
+               np.ones((4, 3), dtype=fX))
+        res.append(network["e"].get_vw("weight").value)
+    np.testing.assert_allclose(res[0], res[1], rtol=1e-5)
+
+
+def _memmap_network(cache_size):
+    return tn.HyperparameterNode(
+        "hp",
+        sparse_updates.SparseSGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [tn.InputNode("i", shape=(None,), dtype="int32"),
+                 sparse_updates.SparseEmbeddingNode("e")]),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                  "target": tn.InputNode("y", shape=(None, 3))})}),
+        input_size=cache_size,
+        output_size=3,
+        learning_rate=0.1,
+        cost_function=treeano.utils.squared_error,
+    ).network()
+
+
+def test_memmap_embedding_table():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp_dir, "table.npy")
+        table = embedding_tables.MemmapEmbeddingTable(filename,
+                                                      cache_size=4,
+                                                      shape=(50, 3),
+                                                      random_state=42,
+                                                      init_chunk_size=7)
+        initial = np.load(filename)
+        network = _memmap_network(cache_size=4)
+        fn = canopy.handled_fn(
+            network,
+            [embedding_tables.memmap_embedding(table, "e", ["x"])],
+            {"x": "i", "y": "y"},
+            {"out": "s"},
+            include_updates=True)
+        # same updates as sgd on the whole table, with more distinct
+        # indexes than cache slots over all of the steps
+        ans = initial.copy()
+        rng = np.random.RandomState(42)
+        for _ in range(20):
+            x = rng.randint(50, size=5).astype(np.int32)
+            x[:2] = [3, 3]
+            y = rng.randn(5, 3).astype(fX)
+            out = fn({"x": x, "y": y})["out"]
+            np.testing.assert_allclose(ans[x], out, rtol=1e-4, atol=1e-6)
+            grad = np.zeros_like(ans)
+            np.add.at(grad, x, 2 * (ans[x] - y) / y.size)
+            ans -= 0.1 * grad
+        np.testing.assert_allclose(ans, table.value(np.arange(50)),
+                                   rtol=1e-4, atol=1e-6)
+        table.flush()
+        np.testing.assert_allclose(ans, np.load(filename),
+                                   rtol=1e-4, atol=1e-6)
+        # reopening the file continues from the updated table
+        table2 = embedding_tables.MemmapEmbeddingTable(filename, cache_size=4)
+        np.testing.assert_allclose(ans, table2.value(np.arange(50)),
+                                   rtol=1e-4, atol=1e-6)
+        del table, table2
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@nt.raises(AssertionError)
+def test_memmap_embedding_table_too_many_indexes():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        table = embedding_tables.MemmapEmbeddingTable(
+            os.path.join(tmp_dir, "table.npy"),
+            cache_size=2,
+            shape=(10, 3))
+        table.bind(theano.shared(np.zeros((2, 3), dtype=fX)))
+        table.lookup([1, 2, 3])
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,44 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+
+from treeano.sandbox.nodes import ensemble
+
+fX = theano.config.floatX
+
+
+def test_stacked_dense_node():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 3)),
+         ensemble.StackedDenseNode("fc", num_units=4, ensemble_size=2)]
+    ).network()
+    W = np.random.randn(2, 3, 4).astype(fX)
+    b = np.random.randn(2, 4).astype(fX)
+    network["fc_linear"].get_vw("weight").variable.set_value(W)
+    network["fc_bias"].get_vw("bias").variable.set_value(b)
+    fn = network.function(["i"], ["s"])
+    # the first 5 examples are for the first member, the rest for the second
+    x = np.random.randn(10, 3).astype(fX)
+    ans = np.concatenate([x[:5].dot(W[0]) + b[0], x[5:].dot(W[1]) + b[1]])
+    np.testing.assert_allclose(ans, fn(x)[0], rtol=1e-5, atol=1e-6)
+
+
+def test_stacked_conv_2d_with_bias_node():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 2, 5, 5)),
+         ensemble.StackedConv2DWithBiasNode("c",
+                                            num_filters=3,
+                                            filter_size=(3, 3),
+                                            ensemble_size=2)]
+    ).network()
+    fn = network.function(["i"], ["s"])
+    nt.assert_equal((2, 3, 2, 3, 3),
+                    network["c_conv"].get_vw("weight").shape)
+    nt.assert_equal((2, 3, 1, 1), network["c_bias"].get_vw("bias").shape)
+    x = np.random.randn(6, 2, 5, 5).astype(fX)
+    nt.assert_equal((6, 3, 3, 3), fn(x)[0].shape)
@@ -0,0 +1,179 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+from theano.sandbox.rng_mrg import MRG_RandomStreams
+import treeano
+import treeano.nodes as tn
+import canopy
+
+from treeano.sandbox.nodes import large_softmax
+from treeano.sandbox.nodes import sparse_updates
+
+fX = theano.config.floatX
+
+
+def test_large_softmax_nodes_serialization():
+    tn.check_serialization(large_softmax.SampledSoftmaxNode("a"))
+    tn.check_serialization(large_softmax.HierarchicalSoftmaxNode("a"))
+
+
+def _network(node, learning_rate=0.5, updates_cls=tn.SGDNode, **kwargs):
+    return tn.HyperparameterNode(
+        "hp",
+        updates_cls(
+            "updates",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [tn.InputNode("x", shape=(None, 8)),
+                 node]),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("r", reference="s"),
+                  "target": tn.InputNode("y", shape=(None,),
+                                         dtype="int32")})}),
+        target_reference="y",
+        cost_function=large_softmax.target_categorical_crossentropy_i32,
+        learning_rate=learning_rate,
+        inits=[treeano.inits.NormalWeightInit(0.1)],
+        **kwargs
+    ).network()
+
+
+def _fns(network):
+    train_fn = canopy.handled_fn(network,
+                                 [],
+                                 {"x": "x", "y": "y"},
+                                 {"cost": "cost", "p": "s"},
+                                 include_updates=True)
+    valid_fn = canopy.handled_fn(
+        network,
+        [canopy.handlers.override_hyperparameters(deterministic=True)],
+        {"x": "x", "y": "y"},
+        {"cost": "cost", "p": "s"})
+    return train_fn, valid_fn
+
+
+def test_large_softmax_nodes_sparse_updates():
+    # only the rows of the target and the samples (or of the splits on the
+    # path to the target) are updated
+    x = np.random.randn(2, 8).astype(fX)
+    y = np.array([3, 3], dtype=np.int32)
+    for node, num_updated in [
+            (large_softmax.SampledSoftmaxNode("sm",
+                                              num_samples=1,
+                                              proposal="uniform"),
+             2),
+            (large_softmax.HierarchicalSoftmaxNode("sm"), 5)]:
+        network = _network(node,
+                           updates_cls=sparse_updates.SparseSGDNode,
+                           num_classes=32)
+        train_fn, _ = _fns(network)
+        weight = network["sm"].get_vw("weight").variable
+        before = weight.get_value()
+        train_fn({"x": x, "y": y})
+        changed = (weight.get_value() != before).any(axis=1)
+        nt.assert_greater(changed.sum(), 0)
+        nt.assert_less_equal(changed.sum(), num_updated)
+
+
+def test_large_softmax_nodes_learn():
+    rng = np.random.RandomState(42)
+    prototypes = 3 * rng.randn(20, 8).astype(fX)
+
+    def batch(batch_size):
+        y = rng.randint(20, size=batch_size).astype(np.int32)
+        x = prototypes[y] + rng.randn(batch_size, 8).astype(fX)
+        return {"x": x, "y": y}
+
+    for node in [large_softmax.SampledSoftmaxNode("sm", num_samples=5),
+                 large_softmax.SampledSoftmaxNode("sm",
+                                                  num_samples=5,
+                                                  proposal="uniform"),
+                 large_softmax.HierarchicalSoftmaxNode("sm")]:
+        network = _network(node, num_classes=20)
+        train_fn, valid_fn = _fns(network)
+        valid = batch(200)
+        initial_cost = valid_fn(valid)["cost"]
+        for _ in range(100):
+            train_fn(batch(32))
+        res = valid_fn(valid)
+        nt.assert_less(res["cost"], initial_cost / 2)
+        nt.assert_equal((200, 20), res["p"].shape)
+        nt.assert_greater((res["p"].argmax(axis=1) == valid["y"]).mean(),
+                          0.5)
+
+
+def test_sampled_softmax_node_deterministic():
+    network = _network(large_softmax.SampledSoftmaxNode("sm", num_samples=3),
+                       num_classes=10)
+    _, valid_fn = _fns(network)
+    W = network["sm"].get_vw("weight").value
+    b = np.random.randn(10).astype(fX)
+    network["sm"].get_vw("bias").value = b
+    x = np.random.randn(4, 8).astype(fX)
+    y = np.array([0, 3, 3, 9], dtype=np.int32)
+    logits = np.dot(x, W.T) + b
+    ans = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+    res = valid_fn({"x": x, "y": y})
+    np.testing.assert_allclose(ans, res["p"], rtol=1e-5)
+    np.testing.assert_allclose(-np.log(ans[np.arange(4), y]).mean(),
+                               res["cost"],
+                               rtol=1e-5)
+
+
+def test_hierarchical_softmax_node():
+    # the probability of the target while training is the same as in
+    # deterministic mode, including when num_classes isn't a power of 2
+    for num_classes in [8, 11]:
+        network = _network(large_softmax.HierarchicalSoftmaxNode("sm"),
+                           num_classes=num_classes,
+                           learning_rate=0)
+        train_fn, valid_fn = _fns(network)
+        x = np.random.randn(5, 8).astype(fX)
+        y = np.array([0, 1, 7, 3, 7], dtype=np.int32)
+        train_res = train_fn({"x": x, "y": y})
+        valid_res = valid_fn({"x": x, "y": y})
+        np.testing.assert_allclose(valid_res["p"][np.arange(5), y],
+                                   train_res["p"],
+                                   rtol=1e-5)
+        np.testing.assert_allclose(valid_res["cost"], train_res["cost"],
+                                   rtol=1e-5)
+        if num_classes == 8:
+            np.testing.assert_allclose(1, valid_res["p"].sum(axis=1),
+                                       rtol=1e-5)
+
+
+def test_large_softmax_nodes_cost_doesnt_overflow():
+    for node in [large_softmax.SampledSoftmaxNode("sm", num_samples=5),
+                 large_softmax.HierarchicalSoftmaxNode("sm")]:
+        network = _network(node, num_classes=20)
+        W_vw = network["sm"].get_vw("weight")
+        W_vw.value = 1e4 * W_vw.value
+        train_fn, _ = _fns(network)
+        x = np.random.randn(10, 8).astype(fX)
+        y = np.arange(10).astype(np.int32)
+        nt.assert_true(np.isfinite(train_fn({"x": x, "y": y})["cost"]))
+
+
+def test_proposals():
+    srng = MRG_RandomStreams(42)
+    probabilities = np.array([0.5, 0.0, 0.2, 0.3])
+    for proposal, ans in [
+            (large_softmax.uniform_proposal, np.ones(4) / 4),
+            (large_softmax.log_uniform_proposal,
+             np.log(np.arange(2, 6) / np.arange(1, 5)) / np.log(5)),
+            (large_softmax.unigram_proposal(probabilities), probabilities)]:
+        sample, log_probability = proposal(4)
+        samples = sample(srng, 20000).eval()
+        nt.assert_equal(np.int32, samples.dtype)
+        np.testing.assert_allclose(ans,
+                                   np.bincount(samples, minlength=4) / 20000,
+                                   atol=0.02)
+        # classes that can't be sampled have a finite log probability, so
+        # that they can still be targets
+        classes = np.where(ans > 0)[0].astype(np.int32)
+        np.testing.assert_allclose(
+            np.log(ans[classes]),
+            log_probability(T.constant(classes)).eval(),
+            rtol=1e-5)
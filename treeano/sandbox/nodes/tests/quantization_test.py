@@ -0,0 +1,71 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+
+from treeano.sandbox.nodes import quantization
+
+fX = theano.config.floatX
+
+
+def test_quantize_weight():
+    W = np.random.randn(5, 3).astype(fX)
+    W[:, 1] = 0
+    quantized, scale = quantization.quantize_weight(W, 1)
+    nt.assert_equal("int8", quantized.dtype)
+    nt.assert_equal((3,), scale.shape)
+    np.testing.assert_equal(127, np.abs(quantized[:, [0, 2]]).max(axis=0))
+    np.testing.assert_allclose(W, quantized * scale, atol=scale.max() / 2)
+
+
+def test_quantized_linear_mapping_node():
+    # the larger input dim is accumulated with int32
+    for input_dim in [4, 2000]:
+        W = np.random.randn(input_dim, 5).astype(fX)
+        quantized, scale = quantization.quantize_weight(W, 1)
+        network = tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(3, input_dim)),
+             quantization.QuantizedLinearMappingNode("q",
+                                                     output_dim=5,
+                                                     input_scale=3. / 127)]
+        ).network()
+        network["q"].get_vw("quantized_weight").variable.set_value(quantized)
+        network["q"].get_vw("weight_scale").variable.set_value(scale)
+        fn = network.function(["i"], ["s"])
+        x = np.random.uniform(-3, 3, (3, input_dim)).astype(fX)
+        # exactly the quantized computation
+        x_quantized = np.round(x / (3. / 127)).astype("int64")
+        ans = (x_quantized.dot(quantized.astype("int64"))
+               * scale * (3. / 127))
+        np.testing.assert_allclose(ans, fn(x)[0], rtol=1e-4, atol=1e-4)
+        # approximately the float computation
+        ans = np.dot(x, W)
+        np.testing.assert_allclose(ans, fn(x)[0],
+                                   atol=0.1 * np.sqrt(input_dim))
+
+
+def test_quantized_conv_2d_node():
+    W = np.random.randn(5, 2, 3, 3).astype(fX)
+    quantized, scale = quantization.quantize_weight(W, 0)
+
+    def network_fn(node):
+        return tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(3, 2, 6, 6)),
+             node]
+        ).network()
+
+    kwargs = dict(num_filters=5, filter_size=(3, 3), pad="same")
+    network1 = network_fn(tn.Conv2DNode("c", **kwargs))
+    network1["c"].get_vw("weight").variable.set_value(W)
+    network2 = network_fn(quantization.QuantizedConv2DNode(
+        "c", input_scale=3. / 127, **kwargs))
+    network2["c"].get_vw("quantized_weight").variable.set_value(quantized)
+    network2["c"].get_vw("weight_scale").variable.set_value(scale)
+    x = np.random.uniform(-3, 3, (3, 2, 6, 6)).astype(fX)
+    y1 = network1.function(["i"], ["s"])(x)[0]
+    y2 = network2.function(["i"], ["s"])(x)[0]
+    np.testing.assert_allclose(y1, y2, atol=0.05 * np.abs(y1).max())
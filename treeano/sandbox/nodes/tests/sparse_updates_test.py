@@ -0,0 +1,100 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+import canopy
+
+from treeano.sandbox.nodes import sparse_updates
+
+fX = theano.config.floatX
+
+
+def test_sparse_embedding_node_serialization():
+    tn.check_serialization(sparse_updates.SparseEmbeddingNode("a"))
+    tn.check_serialization(sparse_updates.SparseSGDNode(
+        "a",
+        {"subtree": tn.IdentityNode("b"), "cost": tn.IdentityNode("c")}))
+    tn.check_serialization(sparse_updates.SparseAdaGradNode(
+        "a",
+        {"subtree": tn.IdentityNode("b"), "cost": tn.IdentityNode("c")}))
+
+
+def test_sparse_embedding_node():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(None, 2), dtype="int32"),
+         sparse_updates.SparseEmbeddingNode("e", input_size=5, output_size=3)]
+    ).network()
+    W = np.random.randn(5, 3).astype(fX)
+    network["e"].get_vw("weight").variable.set_value(W)
+    x = np.array([[0, 4], [2, 2]], dtype=np.int32)
+    fn = network.function(["i"], ["s"])
+    np.testing.assert_equal(W[x], fn(x)[0])
+
+
+def test_sparse_updates_nodes():
+    # same updates as the dense nodes
+    for sparse_cls, dense_cls in [(sparse_updates.SparseSGDNode, tn.SGDNode),
+                                  (sparse_updates.SparseAdaGradNode,
+                                   tn.ADAGRADNode)]:
+        res = []
+        for cls in [sparse_cls, dense_cls]:
+            network = tn.HyperparameterNode(
+                "hp",
+                cls("updates",
+                    {"subtree": tn.SequentialNode(
+                        "s",
+                        [tn.InputNode("i", shape=(None,), dtype="int32"),
+                         sparse_updates.SparseEmbeddingNode("e"),
+                         tn.DenseNode("d", num_units=2)]),
+                     "cost": tn.TotalCostNode(
+                         "cost",
+                         {"pred": tn.ReferenceNode("pred_ref",
+                                                   reference="s"),
+                          "target": tn.InputNode("y", shape=(None, 2))})}),
+                input_size=10,
+                output_size=3,
+                learning_rate=0.1,
+                cost_function=treeano.utils.squared_error,
+                inits=[treeano.inits.ConstantInit(0.5)],
+            ).network()
+            fn = network.function(["i", "y"],
+                                  ["cost"],
+                                  include_updates=True)
+            for _ in range(3):
+                fn(np.array([1, 7, 4], dtype=np.int32),
+                   np.ones((3, 2), dtype=fX))
+            vws = network["hp"].find_vws_in_subtree(is_shared=True)
+            res.append([vw.value
+                        for vw in sorted(vws, key=lambda vw: vw.name)])
+        nt.assert_equal(len(res[0]), len(res[1]))
+        for sparse_value, dense_value in zip(*res):
+            np.testing.assert_allclose(sparse_value, dense_value, rtol=1e-5)
+
+
+def test_sparse_updates_only_update_rows():
+    network = tn.HyperparameterNode(
+        "hp",
+        sparse_updates.SparseSGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode(
+                "s",
+                [tn.InputNode("i", shape=(None,), dtype="int32"),
+                 sparse_updates.SparseEmbeddingNode("e")]),
+             "cost": tn.TotalCostNode(
+                 "cost",
+                 {"pred": tn.ReferenceNode("pred_ref", reference="s"),
+                  "target": tn.InputNode("y", shape=(None, 3))})}),
+        input_size=1000,
+        output_size=3,
+        cost_function=treeano.utils.squared_error,
+    ).network()
+    fn = network.function(["i", "y"], ["cost"], include_updates=True)
+    nodes = fn.maker.fgraph.toposort()
+    # the weight is incremented inplace, instead of with a dense gradient
+    nt.assert_false(any(isinstance(node.op, T.Alloc) for node in nodes))
+    nt.assert_true(any(isinstance(node.op, T.AdvancedIncSubtensor1) and
+                       node.op.inplace
+                       for node in nodes))
@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+import treeano
+import treeano.nodes as tn
+import canopy
+
+from treeano.sandbox.nodes import sparse_updates
+from treeano.sandbox.nodes import word_vectors
+
+
+def _random_sentences(vocabulary_size, num_sentences, max_length):
+    return [list(np.random.randint(vocabulary_size,
+                                   size=np.random.randint(max_length + 1)))
+            for _ in range(num_sentences)]
+
+
+def test_sentences_to_tokens():
+    tokens, offsets = word_vectors.sentences_to_tokens([[3, 1], [], [2]])
+    np.testing.assert_equal([3, 1, 2], tokens)
+    np.testing.assert_equal([0, 2, 2, 3], offsets)
+
+
+def test_coocurrence_counts():
+    data = _random_sentences(vocabulary_size=20,
+                             num_sentences=30,
+                             max_length=15)
+    tokens, offsets = word_vectors.sentences_to_tokens(data)
+    for window_size in [0, 1, 5]:
+        ans = word_vectors.coocurrence_matrix(data,
+                                              vocabulary_size=20,
+                                              window_size=window_size)
+        # chunks smaller than sentences and windows, and a buffer that
+        # is merged after every chunk
+        for kwargs in [{},
+                       dict(chunk_size=3, buffer_size=1),
+                       dict(chunk_size=7, num_workers=3)]:
+            res = word_vectors.coocurrence_counts(tokens,
+                                                  offsets,
+                                                  vocabulary_size=20,
+                                                  window_size=window_size,
+                                                  **kwargs)
+            nt.assert_equal(ans.dtype, res.dtype)
+            np.testing.assert_equal(ans.toarray(), res.toarray())
+
+
+def test_coocurrence_counts_memmap_spill():
+    data = _random_sentences(vocabulary_size=10,
+                             num_sentences=20,
+                             max_length=10)
+    ans = word_vectors.coocurrence_matrix(data, vocabulary_size=10)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tokens, offsets = word_vectors.sentences_to_tokens(data)
+        np.save(os.path.join(tmp_dir, "tokens.npy"), tokens)
+        tokens = np.load(os.path.join(tmp_dir, "tokens.npy"), mmap_mode="r")
+        spill_dir = os.path.join(tmp_dir, "spill")
+        res = word_vectors.coocurrence_counts(tokens,
+                                              offsets,
+                                              vocabulary_size=10,
+                                              chunk_size=4,
+                                              num_workers=2,
+                                              spill_dir=spill_dir)
+        np.testing.assert_equal(ans.toarray(), res.toarray())
+        # spilled files are removed after being merged
+        nt.assert_equal([], os.listdir(spill_dir))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_coocurrence_counts_memmap_slice():
+    data = _random_sentences(vocabulary_size=10,
+                             num_sentences=20,
+                             max_length=10)
+    tokens, offsets = word_vectors.sentences_to_tokens(data)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        np.save(os.path.join(tmp_dir, "tokens.npy"), tokens)
+        mmap = np.load(os.path.join(tmp_dir, "tokens.npy"), mmap_mode="r")
+        # the tokens of the sentences after the first 5
+        start = offsets[5]
+        for sliced in [mmap[start:], mmap[start:][2:]]:
+            ans = word_vectors.coocurrence_counts(np.array(sliced),
+                                                  offsets[5:] - start,
+                                                  vocabulary_size=10)
+            res = word_vectors.coocurrence_counts(sliced,
+                                                  offsets[5:] - start,
+                                                  vocabulary_size=10)
+            np.testing.assert_equal(ans.toarray(), res.toarray())
+        # strided slices are copied
+        nt.assert_equal("array", word_vectors._array_ref(mmap[::2])[0])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_shard_vocabulary():
+    shards = word_vectors.shard_vocabulary([5, 1, 9, 3, 7], 2)
+    np.testing.assert_equal([2, 0, 1], shards[0])
+    np.testing.assert_equal([4, 3], shards[1])
+
+
+def test_sparse_blocks():
+    data = _random_sentences(vocabulary_size=25,
+                             num_sentences=30,
+                             max_length=15)
+    counts = word_vectors.coocurrence_matrix(data, vocabulary_size=25)
+    ans = counts.toarray()
+    res = np.zeros_like(ans)
+    blocks = list(word_vectors.sparse_blocks(counts,
+                                             num_shards=3,
+                                             num_epochs=2,
+                                             random_state=42))
+    nt.assert_equal(18, len(blocks))
+    for block in blocks:
+        rows, cols = block["row_idxs"], block["col_idxs"]
+        np.testing.assert_allclose(ans[rows][:, cols], block["counts"])
+        np.testing.assert_allclose(ans.sum(axis=1)[rows],
+                                   block["row_counts"])
+        np.testing.assert_allclose(ans.sum(axis=0)[cols],
+                                   block["col_counts"])
+        res[np.ix_(rows, cols)] += block["counts"]
+    # each block is seen once per epoch
+    np.testing.assert_allclose(2 * ans, res)
+
+
+def test_sparse_block_word_vectors_node_serialization():
+    tn.check_serialization(
+        word_vectors.SparseBlockWordVectorsNode("a", vocabulary_size=3))
+
+
+def test_sparse_block_word_vectors_node():
+    np.random.seed(42)
+    data = _random_sentences(vocabulary_size=30,
+                             num_sentences=50,
+                             max_length=20)
+    counts = word_vectors.coocurrence_matrix(data, vocabulary_size=30)
+    for cost_function in ["glove", "sgns", "swivel"]:
+        node = word_vectors.SparseBlockWordVectorsNode(
+            "wv",
+            vocabulary_size=30,
+            embedding_size=5,
+            cost_function=cost_function)
+        network = tn.HyperparameterNode(
+            "hp",
+            sparse_updates.SparseAdaGradNode(
+                "updates",
+                {"subtree": node,
+                 "cost": tn.ReferenceNode("cost", reference="wv")}),
+            learning_rate=0.1,
+            inits=[treeano.inits.NormalWeightInit(0.1)],
+        ).network()
+        fn = canopy.handled_fn(network,
+                               [],
+                               node.inputs(),
+                               {"cost": "wv"},
+                               include_updates=True,
+                               # glove doesn't use the marginal counts
+                               on_unused_input="ignore")
+        blocks = canopy.fn_utils.prefetch(
+            word_vectors.sparse_blocks(counts, num_shards=2, num_epochs=30))
+        costs = [fn(block)["cost"] for block in blocks]
+        nt.assert_less(np.mean(costs[-4:]), np.mean(costs[:4]))
@@ -1,8 +1,17 @@
+import multiprocessing
+import os
+import uuid
+
 import numpy as np
 import scipy.sparse
 import theano
 import theano.tensor as T
 import treeano
+import treeano.nodes as tn
+
+from . import sparse_updates
+
+fX = theano.config.floatX
 
 
 def coocurrence_matrix(data, vocabulary_size, window_size=5):
@@ -15,6 +24,9 @@ def coocurrence_matrix(data, vocabulary_size, window_size=5):
 
     idxs:
     list of list of indexes
+
+    NOTE: this loops over every pair in Python, see coocurrence_counts for
+    large corpora
     """
     m = scipy.sparse.lil_matrix((vocabulary_size,) * 2)
     windows = list(range(-window_size, window_size + 1))
@@ -29,6 +41,201 @@ def coocurrence_matrix(data, vocabulary_size, window_size=5):
     return m
 
 
+def sentences_to_tokens(data, dtype=np.int32):
+    """
+    converts a list of list of indexes into a flat array of tokens and an
+    array of the offset of the start of each sentence (the format of
+    coocurrence_counts), eg. to be saved with np.save and memory-mapped
+    """
+    lengths = [len(sentence) for sentence in data]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    tokens = np.zeros(offsets[-1], dtype=dtype)
+    for start, sentence in zip(offsets, data):
+        tokens[start:start + len(sentence)] = sentence
+    return tokens, offsets
+
+
+def _chunk_window_pairs(tokens, offsets, start, end, window_size):
+    """
+    returns the (row, column) pairs of each token in [start, end) with the
+    tokens after it in its window (the pairs in the other direction are the
+    transpose)
+    """
+    # the windows of the last tokens of the chunk extend past it
+    ext_end = min(end + window_size, len(tokens))
+    ext_tokens = np.asarray(tokens[start:ext_end])
+    sentence_ids = np.searchsorted(offsets,
+                                   np.arange(start, ext_end),
+                                   side="right")
+    num_tokens = end - start
+    rows = []
+    cols = []
+    for w in range(1, window_size + 1):
+        right = ext_tokens[w:w + num_tokens]
+        left = ext_tokens[:len(right)]
+        same_sentence = sentence_ids[:len(right)] == sentence_ids[
+            w:w + len(right)]
+        rows.append(left[same_sentence])
+        cols.append(right[same_sentence])
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def _address(array):
+    return array.__array_interface__["data"][0]
+
+
+def _array_ref(array):
+    """
+    returns a picklable reference to an array, that doesn't copy the data
+    of (contiguous) memory-mapped arrays
+    """
+    if (isinstance(array, np.memmap)
+            and array.filename is not None
+            and array.flags.c_contiguous):
+        # slices of a memmap keep the offset of the memmap they are from,
+        # so the offset of their data is found from the memmap of the file
+        root = array
+        while isinstance(root.base, np.memmap):
+            root = root.base
+        offset = root.offset + _address(array) - _address(root)
+        return ("memmap", array.filename, array.dtype.str, offset,
+                array.shape)
+    else:
+        return ("array", np.asarray(array))
+
+
+def _from_array_ref(ref):
+    if ref[0] == "memmap":
+        _, filename, dtype, offset, shape = ref
+        return np.memmap(filename,
+                         dtype=dtype,
+                         mode="r",
+                         offset=offset,
+                         shape=shape)
+    else:
+        return ref[1]
+
+
+def _coocurrence_worker(args):
+    """
+    counts the pairs of the chunks in a range of tokens, buffering pairs as
+    coo and merging them into a csr matrix when the buffer is full
+
+    returns the matrix, or the filename it was saved to if spill_dir is
+    given
+    """
+    (tokens_ref, offsets_ref, start, end, vocabulary_size, window_size,
+     chunk_size, buffer_size, dtype, spill_dir) = args
+    tokens = _from_array_ref(tokens_ref)
+    offsets = _from_array_ref(offsets_ref)
+    shape = (vocabulary_size, vocabulary_size)
+    res = scipy.sparse.csr_matrix(shape, dtype=dtype)
+    buffer_rows = []
+    buffer_cols = []
+    num_buffered = 0
+    for chunk_start in range(start, end, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, end)
+        rows, cols = _chunk_window_pairs(tokens,
+                                         offsets,
+                                         chunk_start,
+                                         chunk_end,
+                                         window_size)
+        buffer_rows.append(rows)
+        buffer_cols.append(cols)
+        num_buffered += len(rows)
+        if num_buffered >= buffer_size or chunk_end == end:
+            rows = np.concatenate(buffer_rows)
+            cols = np.concatenate(buffer_cols)
+            # converting to csr sums the duplicate pairs
+            res = res + scipy.sparse.coo_matrix(
+                (np.ones(len(rows), dtype=dtype), (rows, cols)),
+                shape=shape).tocsr()
+            buffer_rows = []
+            buffer_cols = []
+            num_buffered = 0
+    if spill_dir is not None:
+        filename = os.path.join(spill_dir,
+                                "coocurrence_%s.npz" % uuid.uuid4().hex)
+        scipy.sparse.save_npz(filename, res)
+        return filename
+    return res
+
+
+def coocurrence_counts(tokens,
+                       offsets,
+                       vocabulary_size,
+                       window_size=5,
+                       chunk_size=2 ** 16,
+                       buffer_size=2 ** 22,
+                       num_workers=1,
+                       spill_dir=None,
+                       dtype=np.float64):
+    """
+    returns the same counts as coocurrence_matrix, as a csr matrix, but
+    streams over the tokens in chunks (so that they can be memory-mapped)
+    and computes the pairs of each chunk with vectorized operations
+
+    tokens:
+    flat array of the indexes of all of the sentences (see
+    sentences_to_tokens)
+
+    offsets:
+    array of the offset of the start of each sentence in tokens
+
+    chunk_size:
+    number of tokens whose pairs are computed at once
+
+    buffer_size:
+    number of pairs that are buffered before they are merged into the
+    result
+
+    num_workers:
+    number of processes that count pairs of different ranges of the tokens
+    (memory-mapped tokens are re-opened instead of being copied to each
+    process)
+
+    spill_dir:
+    if given, the counts of each worker are written to a file in this
+    directory (and deleted after being merged) instead of being sent back
+    to the main process
+    """
+    assert window_size >= 0
+    num_tokens = len(tokens)
+    num_workers = max(1, min(num_workers, num_tokens))
+    bounds = np.linspace(0, num_tokens, num_workers + 1).astype(np.int64)
+    tokens_ref = _array_ref(tokens)
+    offsets_ref = _array_ref(offsets)
+    if spill_dir is not None and not os.path.isdir(spill_dir):
+        os.makedirs(spill_dir)
+    tasks = [(tokens_ref, offsets_ref, int(start), int(end), vocabulary_size,
+              window_size, chunk_size, buffer_size, dtype, spill_dir)
+             for start, end in zip(bounds[:-1], bounds[1:])]
+    if num_workers == 1:
+        results = map(_coocurrence_worker, tasks)
+    else:
+        pool = multiprocessing.Pool(num_workers)
+        results = pool.imap_unordered(_coocurrence_worker, tasks)
+    try:
+        res = scipy.sparse.csr_matrix((vocabulary_size,) * 2, dtype=dtype)
+        for result in results:
+            if spill_dir is not None:
+                filename = result
+                result = scipy.sparse.load_npz(filename)
+                os.remove(filename)
+            res = res + result
+    finally:
+        if num_workers != 1:
+            pool.close()
+            pool.join()
+    # pairs in the other direction
+    res = res + res.T
+    res.sort_indices()
+    return res
+
+
 def pointwise_mutual_information(counts_both,
                                  row_counts=None,
                                  col_counts=None,
@@ -199,3 +406,218 @@ def swivel_cost(preds,
     # mean over minibatch
     loss = T.sum(loss, axis=1).mean()
     return loss
+
+
+# ######################### training on sparse blocks #########################
+
+
+def shard_vocabulary(word_counts, num_shards):
+    """
+    splits the indexes of the vocabulary into shards like Swivel: the words
+    are sorted by count and dealt to the shards in turn, so that each shard
+    has words of all frequencies
+    """
+    order = np.argsort(-np.asarray(word_counts), kind="mergesort")
+    return [order[shard::num_shards].astype(np.int32)
+            for shard in range(num_shards)]
+
+
+def sparse_blocks(counts,
+                  num_shards,
+                  num_epochs=None,
+                  random_state=None,
+                  dtype=fX):
+    """
+    generator of dicts with the dense blocks of a sparse co-occurrence
+    matrix (eg. from coocurrence_counts), for the row and column shards of
+    the vocabulary (see shard_vocabulary), in a random order each epoch
+
+    the dicts have keys:
+    - row_idxs / col_idxs: indexes of the words of the block
+    - counts: counts_both of the block
+    - row_counts / col_counts: counts of the rows / columns of the block in
+      the whole matrix
+    - count_total: sum of the whole matrix
+
+    num_epochs:
+    number of times to go over each block (forever if None)
+    """
+    counts = scipy.sparse.csr_matrix(counts)
+    row_counts = np.asarray(counts.sum(axis=1)).ravel()
+    col_counts = np.asarray(counts.sum(axis=0)).ravel()
+    count_total = np.array(counts.sum(), dtype=dtype)
+    row_shards = shard_vocabulary(row_counts, num_shards)
+    col_shards = shard_vocabulary(col_counts, num_shards)
+    # permute the matrix so that each shard is a contiguous range, and
+    # store each row shard as csc, so that blocks are cheap slices
+    row_bounds = np.cumsum([0] + [len(rows) for rows in row_shards])
+    col_bounds = np.cumsum([0] + [len(cols) for cols in col_shards])
+    permuted = counts[np.concatenate(row_shards)][
+        :, np.concatenate(col_shards)]
+    row_shard_matrices = [permuted[row_bounds[i]:row_bounds[i + 1]].tocsc()
+                          for i in range(num_shards)]
+    rng = np.random.RandomState(random_state)
+    epoch = 0
+    while num_epochs is None or epoch < num_epochs:
+        for block in rng.permutation(num_shards ** 2):
+            i, j = divmod(block, num_shards)
+            block_counts = row_shard_matrices[i][
+                :, col_bounds[j]:col_bounds[j + 1]]
+            yield {
+                "row_idxs": row_shards[i],
+                "col_idxs": col_shards[j],
+                "counts": block_counts.toarray().astype(dtype),
+                "row_counts": row_counts[row_shards[i]].astype(dtype),
+                "col_counts": col_counts[col_shards[j]].astype(dtype),
+                "count_total": count_total,
+            }
+        epoch += 1
+
+
+# costs that can be computed on a block of the co-occurrence matrix, with
+# signature (preds, counts_both, row_counts, col_counts, count_total)
+BLOCK_COSTS = {
+    "glove": lambda preds, counts_both, row_counts, col_counts, count_total:
+    glove_cost(preds, counts_both),
+    "sgns": sgns_cost,
+    "swivel": swivel_cost,
+}
+
+BLOCK_INPUTS = ("row_idxs",
+                "col_idxs",
+                "counts",
+                "row_counts",
+                "col_counts",
+                "count_total")
+
+
+@treeano.register_node("block_product")
+class BlockProductNode(treeano.NodeImpl):
+
+    """
+    products of the rows of the "rows" input with the rows of the "cols"
+    input, plus the "row_bias" and "col_bias" inputs
+    """
+
+    input_keys = ("rows", "cols", "row_bias", "col_bias")
+
+    def compute_output(self, network, rows, cols, row_bias, col_bias):
+        out_var = (T.dot(rows.variable, cols.variable.T)
+                   + row_bias.variable.reshape((-1, 1))
+                   + col_bias.variable.reshape((1, -1)))
+        network.create_vw(
+            "default",
+            variable=out_var,
+            shape=(rows.shape[0], cols.shape[0]),
+            tags={"output"},
+        )
+
+
+@treeano.register_node("block_cost")
+class BlockCostNode(treeano.NodeImpl):
+
+    """
+    cost of the predictions of a block (the "preds" input), given the
+    other inputs of BLOCK_INPUTS
+    """
+
+    hyperparameter_names = ("cost_function",)
+    input_keys = ("preds",) + BLOCK_INPUTS[2:]
+
+    def compute_output(self, network, *vws):
+        cost_function = network.find_hyperparameter(["cost_function"],
+                                                    "swivel")
+        cost_function = BLOCK_COSTS.get(cost_function, cost_function)
+        network.create_vw(
+            "default",
+            variable=cost_function(*[vw.variable for vw in vws]),
+            shape=(),
+            tags={"output"},
+        )
+
+
+@treeano.register_node("sparse_block_word_vectors")
+class SparseBlockWordVectorsNode(treeano.Wrapper0NodeImpl):
+
+    """
+    word vectors trained on dense blocks of a sparse co-occurrence matrix
+    (from sparse_blocks), where the predictions of a block are the products
+    of the row and column embeddings of its words (plus a bias for each)
+
+    the inputs are InputNode's named <name>_<key> for each key of the dicts
+    from sparse_blocks, and the output is the cost of the block
+
+    the embeddings are SparseEmbeddingNode's, so that wrapping this node
+    with sparse_updates.SparseAdaGradNode (or SparseSGDNode) only updates
+    the rows of the words of the block
+
+    cost_function:
+    name in BLOCK_COSTS (defaults to "swivel"), or a function with the same
+    signature as those (NOTE: "glove" doesn't use the marginal counts, so
+    functions of it need on_unused_input="ignore")
+    """
+
+    hyperparameter_names = ("vocabulary_size",
+                            "embedding_size",
+                            "cost_function",
+                            "inits")
+
+    def architecture_children(self):
+        name = self._name
+        nodes = [
+            tn.InputNode(name + "_row_idxs", shape=(None,), dtype="int32"),
+            tn.InputNode(name + "_col_idxs", shape=(None,), dtype="int32"),
+            tn.InputNode(name + "_counts", shape=(None, None)),
+            tn.InputNode(name + "_row_counts", shape=(None,)),
+            tn.InputNode(name + "_col_counts", shape=(None,)),
+            tn.InputNode(name + "_count_total", shape=()),
+            sparse_updates.SparseEmbeddingNode(name + "_row_embedding"),
+            sparse_updates.SparseEmbeddingNode(name + "_col_embedding"),
+            sparse_updates.SparseEmbeddingNode(name + "_row_bias",
+                                               output_size=1),
+            sparse_updates.SparseEmbeddingNode(name + "_col_bias",
+                                               output_size=1),
+            BlockProductNode(name + "_preds"),
+            BlockCostNode(name + "_cost"),
+        ]
+        edges = [
+            {"from": name + "_row_idxs", "to": name + "_row_embedding"},
+            {"from": name + "_col_idxs", "to": name + "_col_embedding"},
+            {"from": name + "_row_idxs", "to": name + "_row_bias"},
+            {"from": name + "_col_idxs", "to": name + "_col_bias"},
+            {"from": name + "_row_embedding", "to": name + "_preds",
+             "to_key": "rows"},
+            {"from": name + "_col_embedding", "to": name + "_preds",
+             "to_key": "cols"},
+            {"from": name + "_row_bias", "to": name + "_preds",
+             "to_key": "row_bias"},
+            {"from": name + "_col_bias", "to": name + "_preds",
+             "to_key": "col_bias"},
+            {"from": name + "_preds", "to": name + "_cost",
+             "to_key": "preds"},
+        ]
+        for key in BLOCK_INPUTS[2:]:
+            edges.append({"from": name + "_" + key,
+                          "to": name + "_cost",
+                          "to_key": key})
+        edges.append({"from": name + "_cost"})
+        return [tn.GraphNode(name + "_graph", [nodes, edges])]
+
+    def init_state(self, network):
+        super(SparseBlockWordVectorsNode, self).init_state(network)
+        for child in ["_row_embedding", "_col_embedding",
+                      "_row_bias", "_col_bias"]:
+            network.forward_hyperparameter(self._name + child,
+                                           "input_size",
+                                           ["vocabulary_size"])
+        for child in ["_row_embedding", "_col_embedding"]:
+            network.forward_hyperparameter(self._name + child,
+                                           "output_size",
+                                           ["embedding_size"])
+
+    def inputs(self):
+        """
+        returns the map from key of the dicts from sparse_blocks to the
+        input node, for handled_fn
+        """
+        return {key: self._name + "_" + key for key in BLOCK_INPUTS}
@@ -4,6 +4,7 @@ Models and Saliency Maps"
 http://arxiv.org/abs/1312.6034
 """
 
+import numpy as np
 import theano
 import theano.tensor as T
 import treeano
@@ -48,6 +49,90 @@ class SensitivityAnalysisOutput(canopy.handlers.NetworkHandlerImpl):
         return kwargs
 
 
+class BatchedSensitivityAnalysisOutput(canopy.handlers.NetworkHandlerImpl):
+
+    """
+    like SensitivityAnalysisOutput, but takes in a vector of indices into
+    the logit and computes the sensitivity analysis for all of them with a
+    single backward pass, by replicating the input once per index along the
+    batch axis
+
+    the output has shape (batch_size, num_indices) + input shape[1:]
+
+    NOTE: the examples in a batch must not affect each other (eg. the
+    network should be deterministic) and the batch axis of the input must
+    not have a fixed size in the network
+
+    idx_input_key: key of the vector of indices
+
+    input_key: key of the input in the function's inputs
+
+    output_key: key to put the sensitivity analysis in the results
+
+    input_name: node name of the input in the network
+
+    logit_name: node name of the logit in the network
+    """
+
+    def __init__(self,
+                 idx_input_key,
+                 input_key,
+                 output_key,
+                 input_name,
+                 logit_name):
+        self.idx_input_key = idx_input_key
+        self.input_key = input_key
+        self.output_key = output_key
+        self.input_name = input_name
+        self.logit_name = logit_name
+
+    def transform_compile_function_kwargs(self, state, **kwargs):
+        assert self.idx_input_key not in kwargs["inputs"]
+        assert self.output_key not in kwargs["outputs"]
+        network = state.network
+        input_var = network[self.input_name].get_vw("default").variable
+        logit_var = network[self.logit_name].get_vw("default").variable
+        assert logit_var.ndim == 2
+        idxs_var = T.ivector()
+        num_idxs = idxs_var.shape[0]
+        # the input given to the function, before replication
+        new_input_var = input_var.type()
+        batch_size = new_input_var.shape[0]
+        # logits for each replica, and a mask of the index for each replica
+        logits = logit_var.reshape((num_idxs, batch_size, logit_var.shape[1]))
+        mask = T.eq(T.arange(logit_var.shape[1]).dimshuffle("x", 0),
+                    idxs_var.dimshuffle(0, "x"))
+        target_var = (logits * mask.dimshuffle(0, "x", 1)).sum()
+        # since each example only depends on its own input, the gradient
+        # of each replica is the gradient of the logit of its index
+        sensitivity_var = T.grad(target_var, input_var)
+        sensitivity_var = sensitivity_var.reshape(
+            [num_idxs, batch_size] + [input_var.shape[axis]
+                                      for axis in range(1, input_var.ndim)],
+            ndim=input_var.ndim + 1).swapaxes(0, 1)
+
+        givens = kwargs.get("givens")
+        if givens is None:
+            new_givens = []
+        elif isinstance(givens, dict):
+            new_givens = list(givens.items())
+        elif isinstance(givens, (list, tuple)):
+            new_givens = list(givens)
+        reps = [num_idxs] + [1] * (input_var.ndim - 1)
+        new_givens.append((input_var, T.tile(new_input_var, reps,
+                                             ndim=input_var.ndim)))
+
+        inputs = dict(kwargs["inputs"])
+        inputs[self.input_key] = new_input_var
+        inputs[self.idx_input_key] = idxs_var
+        outputs = dict(kwargs["outputs"])
+        outputs[self.output_key] = sensitivity_var
+        kwargs["inputs"] = inputs
+        kwargs["outputs"] = outputs
+        kwargs["givens"] = new_givens
+        return kwargs
+
+
 def sensitivity_analysis_fn(input_name,
                             logit_name,
                             network,
@@ -115,3 +200,49 @@ def customizable_sensitivity_analysis_fn(input_name,
                            **kwargs)
 
     return fn
+
+
+def batched_sensitivity_analysis_fn(input_name,
+                                    logit_name,
+                                    network,
+                                    handlers,
+                                    chunk_size=None,
+                                    **kwargs):
+    """
+    returns a function from input and a list of indices into the logit to
+    the sensitivity analysis heatmaps for those indices, with shape
+    (batch_size, num_indices) + input shape[1:]
+
+    chunk_size:
+    if given, the heatmaps are computed for at most this many indices at
+    once (to bound memory use), and the returned function is a generator of
+    (indices, heatmaps) for each chunk of indices
+    """
+    handlers = [
+        BatchedSensitivityAnalysisOutput(idx_input_key="idxs",
+                                         input_key="input",
+                                         output_key="outputs",
+                                         input_name=input_name,
+                                         logit_name=logit_name),
+        canopy.handlers.override_hyperparameters(deterministic=True)
+    ] + handlers
+
+    fn = canopy.handled_fn(network,
+                           handlers=handlers,
+                           inputs={"input": input_name},
+                           outputs={},
+                           **kwargs)
+
+    def inner(in_val, idx_vals):
+        idx_vals = np.asarray(idx_vals, dtype="int32")
+        return fn({"input": in_val, "idxs": idx_vals})["outputs"]
+
+    if chunk_size is None:
+        return inner
+
+    def chunked(in_val, idx_vals):
+        for start in range(0, len(idx_vals), chunk_size):
+            chunk = idx_vals[start:start + chunk_size]
+            yield chunk, inner(in_val, chunk)
+
+    return chunked
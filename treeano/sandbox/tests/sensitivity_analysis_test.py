@@ -0,0 +1,52 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+
+from treeano.sandbox import sensitivity_analysis
+
+fX = theano.config.floatX
+
+
+def _network():
+    return tn.HyperparameterNode(
+        "hp",
+        tn.SequentialNode(
+            "s",
+            [tn.InputNode("i", shape=(None, 2, 5, 5)),
+             tn.Conv2DWithBiasNode("c", num_filters=3, filter_size=(3, 3)),
+             tn.ReLUNode("r"),
+             tn.DenseNode("logit", num_units=4),
+             tn.DropoutNode("do", p=0.5)]),
+        inits=[treeano.inits.NormalWeightInit()]
+    ).network()
+
+
+def test_batched_sensitivity_analysis_fn():
+    network = _network()
+    # so that the functions share the same weights
+    network.build()
+    fn = sensitivity_analysis.sensitivity_analysis_fn("i",
+                                                      "logit",
+                                                      network,
+                                                      [])
+    x = np.random.randn(3, 2, 5, 5).astype(fX)
+    idxs = [2, 0, 3, 2]
+    expected = np.array([fn(x, idx) for idx in idxs]).swapaxes(0, 1)
+
+    batched_fn = sensitivity_analysis.batched_sensitivity_analysis_fn(
+        "i", "logit", network, [])
+    res = batched_fn(x, idxs)
+    nt.assert_equal((3, 4, 2, 5, 5), res.shape)
+    np.testing.assert_allclose(expected, res, rtol=1e-4, atol=1e-6)
+
+    chunked_fn = sensitivity_analysis.batched_sensitivity_analysis_fn(
+        "i", "logit", network, [], chunk_size=3)
+    chunks = list(chunked_fn(x, idxs))
+    nt.assert_equal([[2, 0, 3], [2]], [list(c[0]) for c in chunks])
+    np.testing.assert_allclose(expected,
+                               np.concatenate([c[1] for c in chunks], axis=1),
+                               rtol=1e-4,
+                               atol=1e-6)
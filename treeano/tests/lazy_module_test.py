@@ -0,0 +1,53 @@
+import subprocess
+import sys
+
+import nose.tools as nt
+
+import treeano
+from treeano import lazy_module
+
+
+def _run(code):
+    return subprocess.check_output([sys.executable, "-c", code]).decode()
+
+
+def test_lazy_nodes_not_imported():
+    modules = ["treeano.nodes.composite",
+               "treeano.nodes.conv",
+               "treeano.nodes.recurrent"]
+    out = _run("import sys; import treeano; "
+               "print([m for m in %r if m in sys.modules])" % modules)
+    nt.assert_equal(out.strip(), "[]")
+    # sanity check that the modules are loaded when used
+    out = _run("import sys; import treeano; treeano.nodes.DenseNode; "
+               "print('treeano.nodes.composite' in sys.modules)")
+    nt.assert_equal(out.strip(), "True")
+
+
+def test_lazy_node_from_str():
+    # looking up a node by name should import the node modules
+    out = _run("import treeano; "
+               "from treeano.core.serialization_state import node_from_str; "
+               "print(node_from_str('dense').__name__)")
+    nt.assert_equal(out.strip(), "DenseNode")
+
+
+def test_lazy_attributes():
+    import treeano.nodes as tn
+    nt.assert_is(tn.DenseNode, tn.composite.DenseNode)
+    nt.assert_in("DenseNode", dir(tn))
+    nt.assert_is(treeano.inits, sys.modules["treeano.inits"])
+
+
+@nt.raises(AttributeError)
+def test_lazy_missing_attribute():
+    import treeano.nodes as tn
+    tn.DoesNotExistNode
+
+
+def test_lazy_import():
+    m = lazy_module.lazy_import("this_module_does_not_exist")
+    # nothing is imported until an attribute is accessed
+    nt.assert_raises(ImportError, lambda: m.foo)
+    m = lazy_module.lazy_import("json")
+    nt.assert_is(m, sys.modules["json"])
@@ -0,0 +1,27 @@
+import nose.tools as nt
+
+import treeano
+import treeano.nodes as tn
+
+
+def test_copy_node():
+    node = tn.SequentialNode(
+        "s",
+        [tn.HyperparameterNode("hp", tn.IdentityNode("i"), foo=3),
+         tn.AddConstantNode("ac", value=2)])
+    res = treeano.node_utils.copy_node(node)
+    nt.assert_equal(res, node)
+    nt.assert_is_not(res, node)
+    for c1, c2 in zip(res.architecture_children(),
+                      node.architecture_children()):
+        nt.assert_is_not(c1, c2)
+
+
+def test_rebuild_node():
+    node = tn.HyperparameterNode("hp", tn.IdentityNode("i"), foo=3)
+    res = treeano.node_utils.rebuild_node(node, name="hp2")
+    nt.assert_equal(res.name, "hp2")
+    nt.assert_equal(res.hyperparameters, dict(foo=3))
+    # children are shared
+    nt.assert_is(res.architecture_children()[0],
+                 node.architecture_children()[0])
@@ -0,0 +1,101 @@
+"""
+gradient checkpointing (ie. recomputing activations during the backward
+pass instead of storing them), from "Training Deep Nets with Sublinear
+Memory Cost" (http://arxiv.org/abs/1604.06174)
+
+checkpoint(inputs, outputs) returns outputs computed by a single op whose
+inner graph is compiled separately, so that the intermediate variables of
+the graph are freed after the forward pass. the gradient of the op
+recomputes the graph from its inputs in a single inner function that
+returns the gradients of all inputs, so only the inputs and outputs of a
+checkpointed segment are kept for the backward pass
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import theano
+import theano.tensor as T
+from theano.compile import SharedVariable
+from theano.compile.builders import OpFromGraph
+from theano.gof.graph import io_connection_pattern
+
+
+def _is_float(var):
+    return var.type.dtype in T.float_dtypes
+
+
+class CheckpointOp(OpFromGraph):
+
+    """
+    OpFromGraph whose gradient is computed by a single op, instead of an
+    op for each input (which would each recompute the inner graph)
+    """
+
+    def grad(self, inputs, output_grads):
+        connected = tuple(
+            not isinstance(g.type, theano.gradient.DisconnectedType)
+            for g in output_grads)
+        # inputs that have gradients: floats that are connected to an
+        # output with a gradient
+        pattern = io_connection_pattern(self.new_inputs, self.new_outputs)
+        wrt = [_is_float(i) and any(p and c for p, c in zip(ps, connected))
+               for i, ps in zip(self.new_inputs, pattern)]
+        if not hasattr(self, "grad_ops"):
+            self.grad_ops = {}
+        if connected not in self.grad_ops:
+            # new variables for the gradients of the outputs, rather than
+            # using the outer gradients as inputs of the inner graph
+            outputs = [out for out, c in zip(self.new_outputs, connected)
+                       if c]
+            grad_vars = [out.type() for out in outputs]
+            gs = theano.gradient.grad(
+                cost=None,
+                known_grads=dict(zip(outputs, grad_vars)),
+                wrt=[i for i, w in zip(self.new_inputs, wrt) if w],
+                disconnected_inputs="ignore",
+                return_disconnected="zero")
+            self.grad_ops[connected] = CheckpointOp(
+                self.new_inputs + grad_vars,
+                gs,
+                on_unused_input="ignore")
+        grad_op = self.grad_ops[connected]
+        gs = grad_op(*(list(inputs)
+                       + [g for g, c in zip(output_grads, connected) if c]))
+        if not isinstance(gs, list):
+            gs = [gs]
+        gs = iter(gs)
+        return [next(gs) if w else theano.gradient.DisconnectedType()()
+                for w in wrt]
+
+
+def checkpoint(inputs, outputs):
+    """
+    returns outputs (a list of variables computed from inputs and shared
+    variables) computed by a CheckpointOp, so that their intermediate
+    variables are recomputed for the gradient instead of being kept in
+    memory
+
+    NOTE: the graph can't contain random variables (eg. dropout masks),
+    since they would be different when recomputed
+    """
+    assert isinstance(outputs, list)
+    for var in theano.gof.graph.inputs(outputs, blockers=inputs):
+        assert not (isinstance(var, SharedVariable)
+                    and getattr(var, "default_update", None) is not None), \
+            dict(msg="can't checkpoint graphs with random variables",
+                 variable=var)
+        assert var in inputs or isinstance(var, (SharedVariable,
+                                                 theano.Constant)), \
+            dict(msg="outputs depend on a variable that isn't an input",
+                 variable=var)
+    # OpFromGraph collects the shared variables of the whole graph (eg. of
+    # the computation of the inputs), so the inputs are replaced by new
+    # variables
+    new_inputs = [i.type() for i in inputs]
+    new_outputs = theano.clone(outputs, replace=dict(zip(inputs, new_inputs)))
+    op = CheckpointOp(new_inputs, new_outputs)
+    res = op(*inputs)
+    if not isinstance(res, list):
+        res = [res]
+    return res
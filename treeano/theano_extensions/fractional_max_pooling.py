@@ -1,17 +1,15 @@
 """
 implementation of "Fractional Max-Pooling" (http://arxiv.org/abs/1412.6071)
 
-from https://github.com/diogo149/theano_fractional_max_pooling
+GPU ops from https://github.com/diogo149/theano_fractional_max_pooling
+(which need pycuda), and CPU ops with the same pooling regions
 """
 
 import numpy as np
 import theano
+import theano.tensor as T
 import theano.sandbox.cuda as cuda
 
-from pycuda.compiler import SourceModule
-
-import theano.misc.pycuda_init
-
 
 class DisjointPseudorandomFractionalMaxPooling2DOp(cuda.GpuOp):
 
@@ -45,6 +43,9 @@ class DisjointPseudorandomFractionalMaxPooling2DOp(cuda.GpuOp):
     # TODO add infer_shape
 
     def make_thunk(self, node, storage_map, _, _2):
+        from pycuda.compiler import SourceModule
+        import theano.misc.pycuda_init
+
         inputs = [storage_map[v] for v in node.inputs]
         outputs = [storage_map[v] for v in node.outputs]
 
@@ -173,6 +174,9 @@ class DisjointPseudorandomFractionalMaxPooling2DGradOp(cuda.GpuOp):
         return cuda.CudaNdarrayType(broadcastable=[False] * (inp.type.ndim))
 
     def make_thunk(self, node, storage_map, _, _2):
+        from pycuda.compiler import SourceModule
+        import theano.misc.pycuda_init
+
         inputs = [storage_map[v] for v in node.inputs]
         outputs = [storage_map[v] for v in node.outputs]
 
@@ -267,3 +271,331 @@ __global__ void fmp(float * input,
         thunk.lazy = False
 
         return thunk
+
+
+def pooling_regions(input_length, output_length, alpha, u):
+    """
+    returns the start (inclusive) and end (exclusive) along an axis of the
+    input of each pooling region, computed in single precision like the GPU
+    kernel
+    """
+    alpha = np.float32(alpha)
+    u = np.float32(u)
+    idxs = np.arange(output_length).astype(np.float32)
+    starts = np.ceil(alpha * (idxs - 1 + u)).astype(np.int64)
+    ends = np.ceil(alpha * (idxs + u)).astype(np.int64)
+    if output_length > 0:
+        starts[0] = 0
+        ends[-1] = input_length
+    return starts, ends
+
+
+# computes the pooling regions of an axis the same way as pooling_regions
+_CPU_SUPPORT_CODE = """
+static void fmp_pooling_regions(npy_intp input_length,
+                                npy_intp output_length,
+                                float alpha,
+                                float u,
+                                npy_intp* starts,
+                                npy_intp* ends) {
+    for (npy_intp i = 0; i < output_length; ++i) {
+        starts[i] = (i == 0)
+            ? 0
+            : (npy_intp) ceilf(alpha * ((float) (i - 1) + u));
+        ends[i] = (i == output_length - 1)
+            ? input_length
+            : (npy_intp) ceilf(alpha * ((float) i + u));
+    }
+}
+"""
+
+# defines x_c (a contiguous version of the input), the input and output
+# shapes and the pooling regions of both axes (in a single allocation, which
+# must be freed)
+_CPU_SETUP_CODE = """
+    // declared without initialization, because failing jumps past them
+    PyArrayObject* x_c;
+    npy_intp num_maps, in_h, in_w, out_h, out_w;
+    npy_intp *regions, *h_starts, *h_ends, *w_starts, *w_ends;
+    if (PyArray_NDIM(%(x)s) != 4) {
+        PyErr_SetString(PyExc_ValueError, "x must be a 4d ndarray");
+        %(fail)s;
+    }
+    x_c = PyArray_GETCONTIGUOUS(%(x)s);
+    if (x_c == NULL) {
+        %(fail)s;
+    }
+    num_maps = PyArray_DIMS(x_c)[0] * PyArray_DIMS(x_c)[1];
+    in_h = PyArray_DIMS(x_c)[2];
+    in_w = PyArray_DIMS(x_c)[3];
+    // same as output_length (in double precision)
+    out_h = (npy_intp) floor(in_h / %(alpha_double)s);
+    out_w = (npy_intp) floor(in_w / %(alpha_double)s);
+    regions = (npy_intp*) malloc(sizeof(npy_intp) * 2 * (out_h + out_w + 1));
+    if (regions == NULL) {
+        Py_DECREF(x_c);
+        PyErr_NoMemory();
+        %(fail)s;
+    }
+    h_starts = regions;
+    h_ends = h_starts + out_h;
+    w_starts = h_ends + out_h;
+    w_ends = w_starts + out_w;
+    fmp_pooling_regions(in_h, out_h, %(alpha_float)s, %(u_float)s,
+                        h_starts, h_ends);
+    fmp_pooling_regions(in_w, out_w, %(alpha_float)s, %(u_float)s,
+                        w_starts, w_ends);
+"""
+
+
+class _DisjointPseudorandomFractionalMaxPooling2DCPUBase(theano.Op):
+
+    __props__ = ("alpha", "u")
+
+    def __init__(self, alpha, u):
+        assert 1 < alpha < 2
+        assert 0 < u < 1
+        self.alpha = alpha
+        self.u = u
+
+    def output_length(self, input_length):
+        return int(np.floor(input_length / self.alpha))
+
+    def _regions(self, input_shape):
+        return [pooling_regions(length,
+                                self.output_length(length),
+                                self.alpha,
+                                self.u)
+                for length in input_shape[2:]]
+
+    def c_support_code(self):
+        return _CPU_SUPPORT_CODE
+
+    def c_headers(self):
+        return ["<math.h>", "<stdlib.h>"]
+
+    def _setup_code(self, x, sub):
+        return _CPU_SETUP_CODE % dict(
+            x=x,
+            fail=sub["fail"],
+            alpha_double=repr(float(self.alpha)),
+            alpha_float="((float) %r)" % float(self.alpha),
+            u_float="((float) %r)" % float(self.u),
+        )
+
+    def c_code_cache_version(self):
+        return (1,)
+
+
+class DisjointPseudorandomFractionalMaxPooling2DCPUOp(
+        _DisjointPseudorandomFractionalMaxPooling2DCPUBase):
+
+    """
+    CPU version of DisjointPseudorandomFractionalMaxPooling2DOp, which also
+    supports inputs with different heights and widths
+    """
+
+    def make_node(self, inp):
+        inp = T.as_tensor_variable(inp)
+        assert inp.ndim == 4
+        return theano.Apply(self,
+                            [inp],
+                            [T.TensorType(inp.dtype, (inp.broadcastable[0],
+                                                      inp.broadcastable[1],
+                                                      False,
+                                                      False))()])
+
+    def infer_shape(self, node, input_shapes):
+        shape, = input_shapes
+        alpha = np.array(self.alpha, dtype="float64")
+        return [(shape[0],
+                 shape[1],
+                 T.cast(T.floor(shape[2] / alpha), "int64"),
+                 T.cast(T.floor(shape[3] / alpha), "int64"))]
+
+    def perform(self, node, inputs, output_storage):
+        x, = inputs
+        z, = output_storage
+        (h_starts, h_ends), (w_starts, w_ends) = self._regions(x.shape)
+        res = np.empty(x.shape[:2] + (len(h_starts), len(w_starts)),
+                       dtype=x.dtype)
+        for i, (h_start, h_end) in enumerate(zip(h_starts, h_ends)):
+            for j, (w_start, w_end) in enumerate(zip(w_starts, w_ends)):
+                res[:, :, i, j] = x[:, :, h_start:h_end, w_start:w_end].max(
+                    axis=(2, 3))
+        z[0] = res
+
+    def c_code(self, node, name, inp, out, sub):
+        x, = inp
+        z, = out
+        dtype = "dtype_%s" % x
+        return self._setup_code(x, sub) + """
+    if (%(z)s == NULL
+        || !PyArray_ISCONTIGUOUS(%(z)s)
+        || PyArray_DIMS(%(z)s)[0] != PyArray_DIMS(x_c)[0]
+        || PyArray_DIMS(%(z)s)[1] != PyArray_DIMS(x_c)[1]
+        || PyArray_DIMS(%(z)s)[2] != out_h
+        || PyArray_DIMS(%(z)s)[3] != out_w) {
+        Py_XDECREF(%(z)s);
+        npy_intp out_dims[4] = {PyArray_DIMS(x_c)[0],
+                                PyArray_DIMS(x_c)[1],
+                                out_h,
+                                out_w};
+        %(z)s = (PyArrayObject*) PyArray_EMPTY(4,
+                                               out_dims,
+                                               PyArray_TYPE(x_c),
+                                               0);
+        if (%(z)s == NULL) {
+            free(regions);
+            Py_DECREF(x_c);
+            %(fail)s;
+        }
+    }
+    {
+        const %(dtype)s* x_data = (%(dtype)s*) PyArray_DATA(x_c);
+        %(dtype)s* z_data = (%(dtype)s*) PyArray_DATA(%(z)s);
+        // batch and channels are a single axis of independent maps
+        for (npy_intp m = 0; m < num_maps; ++m) {
+            const %(dtype)s* x_map = x_data + m * in_h * in_w;
+            %(dtype)s* z_map = z_data + m * out_h * out_w;
+            for (npy_intp i = 0; i < out_h; ++i) {
+                for (npy_intp j = 0; j < out_w; ++j) {
+                    %(dtype)s best = x_map[h_starts[i] * in_w + w_starts[j]];
+                    for (npy_intp a = h_starts[i]; a < h_ends[i]; ++a) {
+                        const %(dtype)s* x_row = x_map + a * in_w;
+                        for (npy_intp b = w_starts[j]; b < w_ends[j]; ++b) {
+                            if (x_row[b] > best) {
+                                best = x_row[b];
+                            }
+                        }
+                    }
+                    z_map[i * out_w + j] = best;
+                }
+            }
+        }
+    }
+    free(regions);
+    Py_DECREF(x_c);
+""" % dict(z=z, dtype=dtype, fail=sub["fail"])
+
+    def grad(self, inputs, grads):
+        inp, = inputs
+        top, = grads
+        return [DisjointPseudorandomFractionalMaxPooling2DGradCPUOp(
+            self.alpha,
+            self.u
+        )(inp, top)]
+
+
+class DisjointPseudorandomFractionalMaxPooling2DGradCPUOp(
+        _DisjointPseudorandomFractionalMaxPooling2DCPUBase):
+
+    """
+    CPU version of DisjointPseudorandomFractionalMaxPooling2DGradOp
+
+    like the GPU op, the gradient of each region goes to every position
+    equal to the maximum
+    """
+
+    def make_node(self, inp, grad):
+        inp = T.as_tensor_variable(inp)
+        grad = T.as_tensor_variable(grad)
+        assert inp.ndim == grad.ndim == 4
+        assert inp.dtype == grad.dtype
+        return theano.Apply(self, [inp, grad], [inp.type()])
+
+    def infer_shape(self, node, input_shapes):
+        return [input_shapes[0]]
+
+    def perform(self, node, inputs, output_storage):
+        x, gz = inputs
+        gx, = output_storage
+        (h_starts, h_ends), (w_starts, w_ends) = self._regions(x.shape)
+        res = np.zeros_like(x)
+        for i, (h_start, h_end) in enumerate(zip(h_starts, h_ends)):
+            for j, (w_start, w_end) in enumerate(zip(w_starts, w_ends)):
+                region = x[:, :, h_start:h_end, w_start:w_end]
+                is_max = region == region.max(axis=(2, 3), keepdims=True)
+                res[:, :, h_start:h_end, w_start:w_end] = (
+                    is_max * gz[:, :, i, j, np.newaxis, np.newaxis])
+        gx[0] = res
+
+    def c_code(self, node, name, inp, out, sub):
+        x, gz = inp
+        gx, = out
+        dtype = "dtype_%s" % x
+        return self._setup_code(x, sub) + """
+    PyArrayObject* gz_c;
+    gz_c = PyArray_GETCONTIGUOUS(%(gz)s);
+    if (gz_c == NULL) {
+        free(regions);
+        Py_DECREF(x_c);
+        %(fail)s;
+    }
+    if (PyArray_NDIM(gz_c) != 4
+        || PyArray_DIMS(gz_c)[0] != PyArray_DIMS(x_c)[0]
+        || PyArray_DIMS(gz_c)[1] != PyArray_DIMS(x_c)[1]
+        || PyArray_DIMS(gz_c)[2] != out_h
+        || PyArray_DIMS(gz_c)[3] != out_w) {
+        PyErr_SetString(PyExc_ValueError, "gz has the wrong shape");
+        free(regions);
+        Py_DECREF(x_c);
+        Py_DECREF(gz_c);
+        %(fail)s;
+    }
+    if (%(gx)s == NULL
+        || !PyArray_ISCONTIGUOUS(%(gx)s)
+        || !PyArray_SAMESHAPE(%(gx)s, x_c)) {
+        Py_XDECREF(%(gx)s);
+        %(gx)s = (PyArrayObject*) PyArray_EMPTY(4,
+                                                PyArray_DIMS(x_c),
+                                                PyArray_TYPE(x_c),
+                                                0);
+        if (%(gx)s == NULL) {
+            free(regions);
+            Py_DECREF(x_c);
+            Py_DECREF(gz_c);
+            %(fail)s;
+        }
+    }
+    {
+        const %(dtype)s* x_data = (%(dtype)s*) PyArray_DATA(x_c);
+        const %(dtype)s* gz_data = (%(dtype)s*) PyArray_DATA(gz_c);
+        %(dtype)s* gx_data = (%(dtype)s*) PyArray_DATA(%(gx)s);
+        // the regions cover the whole input (except for rows / columns
+        // after the last region, which only exist for empty outputs), so
+        // only those need to be zeroed
+        if (out_h == 0 || out_w == 0) {
+            memset(gx_data, 0, PyArray_NBYTES(%(gx)s));
+        }
+        for (npy_intp m = 0; m < num_maps; ++m) {
+            const %(dtype)s* x_map = x_data + m * in_h * in_w;
+            const %(dtype)s* gz_map = gz_data + m * out_h * out_w;
+            %(dtype)s* gx_map = gx_data + m * in_h * in_w;
+            for (npy_intp i = 0; i < out_h; ++i) {
+                for (npy_intp j = 0; j < out_w; ++j) {
+                    %(dtype)s best = x_map[h_starts[i] * in_w + w_starts[j]];
+                    for (npy_intp a = h_starts[i]; a < h_ends[i]; ++a) {
+                        const %(dtype)s* x_row = x_map + a * in_w;
+                        for (npy_intp b = w_starts[j]; b < w_ends[j]; ++b) {
+                            if (x_row[b] > best) {
+                                best = x_row[b];
+                            }
+                        }
+                    }
+                    const %(dtype)s g = gz_map[i * out_w + j];
+                    for (npy_intp a = h_starts[i]; a < h_ends[i]; ++a) {
+                        const %(dtype)s* x_row = x_map + a * in_w;
+                        %(dtype)s* gx_row = gx_map + a * in_w;
+                        for (npy_intp b = w_starts[j]; b < w_ends[j]; ++b) {
+                            gx_row[b] = (x_row[b] == best) ? g : 0;
+                        }
+                    }
+                }
+            }
+        }
+    }
+    free(regions);
+    Py_DECREF(x_c);
+    Py_DECREF(gz_c);
+""" % dict(gz=gz, gx=gx, dtype=dtype, fail=sub["fail"])
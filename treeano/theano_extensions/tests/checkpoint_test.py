@@ -0,0 +1,51 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+
+from treeano.theano_extensions import checkpoint
+
+fX = theano.config.floatX
+
+
+def test_checkpoint():
+    W = theano.shared(np.random.randn(5, 5).astype(fX))
+    x = T.matrix()
+    idxs = T.ivector()
+
+    def segment():
+        h = T.tanh(T.dot(T.tanh(T.dot(x, W)), W))
+        return h[idxs] * 2
+
+    y1 = segment()
+    y2, = checkpoint.checkpoint([x, idxs], [segment()])
+    outputs = []
+    for y in [y1, y2]:
+        cost = (y ** 2).sum()
+        outputs += [cost] + T.grad(cost, [x, W])
+    fn = theano.function([x, idxs], outputs)
+    res = fn(np.random.randn(4, 5).astype(fX),
+             np.array([0, 2, 2], dtype="int32"))
+    for r1, r2 in zip(res[:3], res[3:]):
+        np.testing.assert_allclose(r1, r2, rtol=1e-5, atol=1e-6)
+    # the gradients of all inputs are computed by a single op
+    ops = [node.op for node in fn.maker.fgraph.toposort()
+           if isinstance(node.op, checkpoint.CheckpointOp)]
+    nt.assert_equal(2, len(ops))
+
+
+def test_checkpoint_disconnected_output():
+    x = T.vector()
+    y1, y2 = checkpoint.checkpoint([x], [T.exp(x), x.sum()])
+    g = T.grad(y1.sum(), x)
+    v = np.random.randn(3).astype(fX)
+    np.testing.assert_allclose(np.exp(v),
+                               theano.function([x], g)(v),
+                               rtol=1e-5)
+
+
+@nt.raises(AssertionError)
+def test_checkpoint_random():
+    srng = theano.tensor.shared_randomstreams.RandomStreams()
+    x = T.vector()
+    checkpoint.checkpoint([x], [x * srng.uniform(x.shape)])
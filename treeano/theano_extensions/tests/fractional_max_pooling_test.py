@@ -43,3 +43,96 @@ if "gpu" in theano.config.device:
             print(in_dim, res, new_dim, alpha, u)
             nt.assert_equal((1, 1, new_dim, new_dim),
                             res)
+
+
+import treeano.theano_extensions.fractional_max_pooling as fmp_cpu
+
+
+def _reference_fmp(x, alpha, u):
+    # loop over each output position, computing the regions like the GPU
+    # kernel
+    alpha32 = np.float32(alpha)
+    u32 = np.float32(u)
+
+    def bounds(idx, old_map_size, map_size):
+        before = (0 if idx == 0
+                  else int(np.ceil(alpha32 * (np.float32(idx - 1) + u32))))
+        after = (old_map_size if idx == map_size - 1
+                 else int(np.ceil(alpha32 * (np.float32(idx) + u32))))
+        return before, after
+
+    out_h = int(np.floor(x.shape[2] / alpha))
+    out_w = int(np.floor(x.shape[3] / alpha))
+    res = np.zeros(x.shape[:2] + (out_h, out_w), dtype=x.dtype)
+    for n in range(x.shape[0]):
+        for c in range(x.shape[1]):
+            for i in range(out_h):
+                a_before, a_after = bounds(i, x.shape[2], out_h)
+                for j in range(out_w):
+                    b_before, b_after = bounds(j, x.shape[3], out_w)
+                    res[n, c, i, j] = x[n, c,
+                                        a_before:a_after,
+                                        b_before:b_after].max()
+    return res
+
+
+def test_fractional_max_pooling_cpu_reference():
+    x = T.tensor4()
+    for alpha, u in [(1.414, 0.5), (1.9, 0.1), (1.1, 0.9)]:
+        op = fmp_cpu.DisjointPseudorandomFractionalMaxPooling2DCPUOp(
+            alpha=alpha,
+            u=u)
+        # c implementation and python implementation
+        for mode in [theano.Mode(linker="c"), theano.Mode(linker="py")]:
+            fn = theano.function([x], op(x), mode=mode)
+            for shape in [(2, 3, 13, 13), (1, 2, 7, 11)]:
+                x_val = np.random.randn(*shape).astype(fX)
+                np.testing.assert_equal(_reference_fmp(x_val, alpha, u),
+                                        fn(x_val))
+                # non-contiguous input
+                np.testing.assert_equal(
+                    _reference_fmp(x_val[:, :, ::-1], alpha, u),
+                    fn(x_val[:, :, ::-1]))
+
+
+def test_fractional_max_pooling_cpu_shape():
+    x = T.tensor4()
+    for _ in range(10):
+        in_h, in_w = np.random.randint(1, 50, size=2)
+        alpha = np.random.rand() * 0.9 + 1.05
+        u = np.random.rand() * 0.9 + 0.05
+        op = fmp_cpu.DisjointPseudorandomFractionalMaxPooling2DCPUOp(
+            alpha=alpha,
+            u=u)
+        x_val = np.random.randn(2, 3, in_h, in_w).astype(fX)
+        y = op(x)
+        res = y.eval({x: x_val}).shape
+        ans = (2, 3, op.output_length(in_h), op.output_length(in_w))
+        nt.assert_equal(ans, res)
+        # infer_shape
+        nt.assert_equal(ans, tuple(y.shape.eval({x: x_val})))
+
+
+def test_fractional_max_pooling_cpu_numeric_gradient():
+    def fun(x):
+        return fmp_cpu.DisjointPseudorandomFractionalMaxPooling2DCPUOp(
+            alpha=1.414,
+            u=0.5
+        )(x)
+
+    x_val = np.random.permutation(2 * 3 * 7 * 6).reshape(2, 3, 7, 6)
+    T.verify_grad(fun, [x_val.astype(fX)], rng=np.random)
+
+
+def test_fractional_max_pooling_cpu_grad_python():
+    x = T.tensor4()
+    op = fmp_cpu.DisjointPseudorandomFractionalMaxPooling2DCPUOp(alpha=1.6,
+                                                                 u=0.3)
+    y = op(x)
+    g = T.grad((y * T.arange(y.size).reshape(y.shape)).sum(), x)
+    x_val = np.random.randn(2, 2, 9, 12).astype(fX)
+    # ties go to every maximum
+    x_val[:, :, :3] = 0
+    np.testing.assert_equal(
+        theano.function([x], g, mode=theano.Mode(linker="py"))(x_val),
+        theano.function([x], g)(x_val))
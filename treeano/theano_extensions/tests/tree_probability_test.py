@@ -0,0 +1,66 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+
+from treeano.theano_extensions import tree_probability
+
+fX = theano.config.floatX
+
+
+def test_size_to_routing():
+    routing = tree_probability.size_to_routing(3).toarray()
+    # columns are left at each split, then right at each split
+    ans = np.array([[1, 1, 0, 0, 0, 0],
+                    [1, 0, 0, 0, 1, 0],
+                    [0, 0, 1, 1, 0, 0],
+                    [0, 0, 0, 1, 0, 1]])
+    np.testing.assert_equal(ans, routing)
+    nt.assert_is(tree_probability.size_to_routing(3),
+                 tree_probability.size_to_routing(3))
+
+
+def test_size_to_paths():
+    splits, lefts = tree_probability.size_to_paths(3)
+    np.testing.assert_equal([[0, 1], [0, 1], [0, 2], [0, 2]], splits)
+    np.testing.assert_equal([[True, True],
+                             [True, False],
+                             [False, True],
+                             [False, False]],
+                            lefts)
+    # the product along the paths is the same as the routing
+    x = np.random.rand(63)
+    splits, lefts = tree_probability.size_to_paths(63)
+    ans = np.where(lefts, x[splits], 1 - x[splits]).prod(axis=1)
+    routing = tree_probability.size_to_routing(63)
+    res = np.exp(routing.dot(np.log(np.concatenate([x, 1 - x]))))
+    np.testing.assert_allclose(ans, res)
+
+
+def test_sparse_tree_probability():
+    # compare to the tree traversal in float64, so that the comparison
+    # doesn't depend on the accumulation of rounding errors
+    x = T.tensor3(dtype="float64")
+    for depth in [1, 3, 7]:
+        size = 2 ** depth - 1
+        x_val = np.random.rand(5, size, 2)
+        # probabilities of 0 and 1
+        x_val[0, 0, 0] = 0
+        x_val[1, size - 1, 1] = 1
+        w_val = np.random.randn(5, size + 1, 2)
+        res = []
+        for op in [tree_probability.tree_probability,
+                   tree_probability.sparse_tree_probability]:
+            y = op(x)
+            g = T.grad((y * w_val).sum(), x)
+            res.append(theano.function([x], [y, g])(x_val))
+        np.testing.assert_allclose(res[0][0], res[1][0])
+        np.testing.assert_allclose(res[0][1], res[1][1], rtol=1e-5)
+        # probabilities of the leaves of each tree sum to 1
+        np.testing.assert_allclose(1, res[1][0].sum(axis=1))
+
+
+def test_sparse_tree_probability_numeric_gradient():
+    T.verify_grad(tree_probability.sparse_tree_probability,
+                  [np.random.uniform(0.1, 0.9, size=(3, 7)).astype(fX)],
+                  rng=np.random)
@@ -4,11 +4,13 @@ http://research.microsoft.com/apps/pubs/default.aspx?id=255952
 """
 
 import numpy as np
+import scipy.sparse
 import theano
 import theano.tensor as T
 
 
 TREE_CACHE = {}
+ROUTING_CACHE = {}
 
 
 def is_power_of_2(num):
@@ -41,6 +43,72 @@ def size_to_tree(size):
     return res
 
 
+def size_to_routing(size):
+    """
+    returns a sparse (csr) matrix of shape (num_leaves, 2 * size), where
+    entry (leaf, split) is 1 if the path to the leaf goes left at the split
+    and entry (leaf, size + split) is 1 if it goes right at the split
+    """
+    if size in ROUTING_CACHE:
+        return ROUTING_CACHE[size]
+
+    rows = []
+    cols = []
+    for idx, (l, m, r) in enumerate(size_to_tree(size)):
+        rows.append(np.arange(l, r))
+        cols.append(np.repeat([idx, size + idx], [m - l, r - m]))
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+    # int8 so that the result of a product has the dtype of the other
+    # operand
+    res = scipy.sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int8), (rows, cols)),
+        shape=(size + 1, 2 * size))
+    ROUTING_CACHE[size] = res
+    return res
+
+
+PATHS_CACHE = {}
+
+
+def size_to_paths(size):
+    """
+    returns (splits, lefts), both of shape (num_leaves, depth), with the
+    splits on the path to each leaf and whether the path goes left at each
+    of them (ie. whether the probability of the split or 1 minus it is
+    used for the leaf)
+    """
+    if size in PATHS_CACHE:
+        return PATHS_CACHE[size]
+
+    routing = size_to_routing(size)
+    num_leaves = size + 1
+    depth = int(np.log2(num_leaves))
+    # every leaf of the tree has the same depth
+    assert np.all(np.diff(routing.indptr) == depth)
+    cols = routing.indices.reshape(num_leaves, depth)
+    order = np.argsort(cols % size, axis=1, kind="mergesort")
+    cols = cols[np.arange(num_leaves)[:, np.newaxis], order]
+    res = ((cols % size).astype(np.int32), cols < size)
+    PATHS_CACHE[size] = res
+    return res
+
+
+def _splits_first(x):
+    """
+    returns a 2D view of x with the split / leaf axis (axis 1) first
+    """
+    return np.moveaxis(x, 1, 0).reshape(x.shape[1], -1)
+
+
+def _from_splits_first(x, shape):
+    """
+    inverse of _splits_first, where shape is the shape of the result
+    """
+    shape = (shape[1], shape[0]) + tuple(shape[2:])
+    return np.ascontiguousarray(np.moveaxis(x.reshape(shape), 0, 1))
+
+
 class TreeProbabilityOp(theano.Op):
 
     def make_node(self, split_probabilities):
@@ -130,5 +198,74 @@ class TreeProbabilityGradOp(theano.Op):
         # return output same size as split_probabilities
         return [input_shapes[0]]
 
+
+class SparseTreeProbabilityOp(TreeProbabilityOp):
+
+    """
+    TreeProbabilityOp that computes the log of the probability of each leaf
+    as a single product of the routing matrix (see size_to_routing) with
+    the log probabilities of going left and right, instead of traversing
+    the tree
+    """
+
+    def perform(self, node, inputs_storage, output_storage):
+        left_probabilities, = inputs_storage
+        z, = output_storage
+
+        size = left_probabilities.shape[1]
+        routing = size_to_routing(size)
+
+        x = _splits_first(left_probabilities)
+        # log probabilities of going left, then of going right
+        # NOTE: log(1 - x) instead of log1p(-x), because log1p is much slower
+        log_probabilities = np.empty((2 * size, x.shape[1]), dtype=x.dtype)
+        np.subtract(1, x, out=log_probabilities[size:])
+        log_probabilities[:size] = x
+        # probabilities of 0 become leaves with probability 0
+        with np.errstate(divide="ignore"):
+            np.log(log_probabilities, out=log_probabilities)
+        res = routing.dot(log_probabilities)
+        np.exp(res, out=res)
+
+        output_shape = list(left_probabilities.shape)
+        output_shape[1] += 1
+        z[0] = _from_splits_first(res.astype(left_probabilities.dtype),
+                                  output_shape)
+
+    def grad(self, inputs, output_grads):
+        return [sparse_tree_probability_grad(inputs[0],
+                                             self(inputs[0]),
+                                             output_grads[0])]
+
+
+class SparseTreeProbabilityGradOp(TreeProbabilityGradOp):
+
+    """
+    TreeProbabilityGradOp that sums the gradients of the leaves under each
+    side of each split with a product with the transposed routing matrix
+    """
+
+    def perform(self, node, inputs_storage, output_storage):
+        split_probabilities, outputs, grads = inputs_storage
+        z, = output_storage
+
+        size = split_probabilities.shape[1]
+        routing = size_to_routing(size)
+
+        grad_times_output = _splits_first(outputs * grads)
+        accumulated = routing.T.dot(grad_times_output)
+
+        # TODO parameterize
+        epsilon = 1e-8
+
+        p = _splits_first(split_probabilities)
+        res = (accumulated[:size] / np.clip(p, epsilon, 1)
+               + accumulated[size:] / np.clip(p - 1, -1, -epsilon))
+        z[0] = _from_splits_first(res.astype(split_probabilities.dtype),
+                                  split_probabilities.shape)
+
+
 tree_probability = TreeProbabilityOp()
 tree_probability_grad = TreeProbabilityGradOp()
+sparse_tree_probability = SparseTreeProbabilityOp()
+sparse_tree_probability_grad = SparseTreeProbabilityGradOp()
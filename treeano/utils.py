@@ -1,5 +1,6 @@
 import numbers
 import functools
+import sys
 
 import numpy as np
 import theano
@@ -41,6 +42,14 @@ def is_variable(x):
     return is_nonshared_variable(x) or is_shared_variable(x)
 
 
+def is_sparse_variable(x):
+    # theano.sparse is only imported when needed, and sparse variables can
+    # only exist once it is
+    sparse = sys.modules.get("theano.sparse")
+    return sparse is not None and isinstance(getattr(x, "type", None),
+                                             sparse.SparseType)
+
+
 def is_number(x):
     return isinstance(x, numbers.Number)
 